@@ -40,6 +40,8 @@
 # MAGIC
 # MAGIC The following cell will establish some text fields at the top of this notebook to provide this information. When you enter your credentials into these fields, code will execute on the cluster to set up environment variables with this information. This setup greatly simplifies the API calls we will be making.
 # MAGIC
+# MAGIC The cell also creates **`api`**, a Python client for the Account API from the *Includes* folder. It holds on to its connections between calls, which makes it a faster alternative to cURL when issuing many calls from Python.
+# MAGIC
 # MAGIC If you're using your own tool, then you can forego the following cell and configure your tool as follows:
 # MAGIC * Use **Basic** authentication with the username and password separated by a colon (:)
 # MAGIC * Use a base URL of *https://accounts.cloud.databricks.com/api/2.0/accounts/* followed by your Databricks account id; all API endpoints will be added to the end of this base URL
@@ -55,6 +57,12 @@ import base64,os
 os.environ["DBACADEMY_API_URL"] = f"https://accounts.cloud.databricks.com/api/2.0/accounts/{dbutils.widgets.get('account_id')}"
 os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64encode(('%s:%s' % (dbutils.widgets.get('username'),dbutils.widgets.get('password'))).encode('ascii')).decode('ascii')}"
 
+import sys
+sys.path.append(os.path.abspath("../Includes"))
+
+from dbacademy_admin import AccountClient, account_api, get_session
+api = AccountClient.from_environment()
+
 # COMMAND ----------
 
 # MAGIC %md
@@ -71,11 +79,44 @@ os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64e
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC The same call can be made from Python with **`account_api`**, which reuses the connections of the **`api`** client rather than starting a new process for every call. The response comes back as a Python list, displayed as a table.
+
+# COMMAND ----------
+
+workspaces = account_api("GET", "/workspaces", fields=["workspace_id", "workspace_name", "aws_region", "workspace_status", "credentials_id", "storage_configuration_id"])
+workspaces
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC Scrolling through the response, let's locate the workspace that we can experiement with. Let's take note of the *credentials_id* and *storage_configuration_id*. Since workspaces can share these configurations, we'll reuse them momentarily to create a new workspace.
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC Rather than scrolling, we can also use the **`api`** client to stream the list and keep only the fields we're interested in. This stays fast even on accounts with thousands of workspaces.
+
+# COMMAND ----------
+
+for workspace in api.iter_workspaces(fields=["workspace_id", "workspace_name", "credentials_id", "storage_configuration_id"]):
+    print(workspace)
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC The Python cells that follow fill in *&lt;CREDENTIALS_ID&gt;* and *&lt;STORAGE_CONFIGURATION_ID&gt;* from **`get_session().ids`**. The next cell sets them from the workspace we're copying from: the first one listed, unless you name another in *source_workspace_name*. The cURL cells still need the values pasted in.
+
+# COMMAND ----------
+
+source_workspace_name = ""
+
+source = next(w for w in workspaces if w["workspace_name"] == source_workspace_name) if source_workspace_name else workspaces[0]
+get_session().ids.update(credentials_id=source["credentials_id"], storage_configuration_id=source["storage_configuration_id"])
+source
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ## Creating a workspace
 # MAGIC
@@ -89,6 +130,8 @@ os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64e
 # MAGIC * Use an API endpoint of */workspaces*
 # MAGIC * Use the **`POST`** method
 # MAGIC * Include the modified JSON payload from the following cell in your request
+# MAGIC
+# MAGIC The cURL cell below and the Python cell after it are alternatives: run one or the other. The Python cell needs no substitutions, and if the workspace already exists, for example because the cURL cell created it, it picks that workspace up instead of creating a second one.
 
 # COMMAND ----------
 
@@ -104,10 +147,31 @@ os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64e
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC Or, instead, from Python. The placeholders are filled in from the ids set earlier and the region is the source workspace's. The ids in the response, such as *workspace_id*, are remembered by **`account_api`**, so the placeholders of later calls are filled in automatically.
+
+# COMMAND ----------
+
+existing = [w for w in account_api("GET", "/workspaces") if w["workspace_name"] == "dbacademy-test-workspace-api"]
+if existing:
+    workspace = existing[0]
+    get_session().remember(workspace)
+else:
+    workspace = account_api("POST", "/workspaces", {
+        "workspace_name": "dbacademy-test-workspace-api",
+        "deployment_name": "dbacademy-test-workspace-api",
+        "aws_region": source["aws_region"],
+        "credentials_id": "<CREDENTIALS_ID>",
+        "storage_configuration_id": "<STORAGE_CONFIGURATION_ID>"
+    })
+workspace
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ### Monitoring a workspace
 # MAGIC
-# MAGIC You can query an individual workspace with a simple **`GET`** request as follows. This is useful for querying information for just a single workspace, or to monitor the status of the workspace we just requested. Be sure to replace *&lt;WORKSPACE_ID&gt;* with the value from the response to creating the workspace earlier.
+# MAGIC You can query an individual workspace with a simple **`GET`** request as follows. This is useful for querying information for just a single workspace, or to monitor the status of the workspace we just requested. Be sure to replace *&lt;WORKSPACE_ID&gt;* with the value from the response to creating the workspace earlier; the Python cell after it uses the *workspace_id* remembered from that response.
 
 # COMMAND ----------
 
@@ -115,6 +179,10 @@ os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64e
 
 # COMMAND ----------
 
+account_api("GET", "/workspaces/<WORKSPACE_ID>", fields=["workspace_id", "workspace_name", "workspace_status", "workspace_status_message"])
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ## Conclusion
 # MAGIC
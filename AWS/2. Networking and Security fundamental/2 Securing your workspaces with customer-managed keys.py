@@ -159,6 +159,8 @@
 # MAGIC ### Setting up authentication
 # MAGIC
 # MAGIC The following cell will establish some text fields at the top of this notebook, which you can fill in with your Databricks account id, username and password. Whenever you update the values of these fields, this will trigger the update of environment variables in the cluster execution environment.
+# MAGIC
+# MAGIC The cell also creates **`api`**, a Python client for the Account API from the *Includes* folder. It holds on to its connections between calls, which makes it a faster alternative to cURL when issuing many calls from Python.
 
 # COMMAND ----------
 
@@ -171,6 +173,12 @@ import base64,os
 os.environ["DBACADEMY_API_URL"] = f"https://accounts.cloud.databricks.com/api/2.0/accounts/{dbutils.widgets.get('account_id')}"
 os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64encode(('%s:%s' % (dbutils.widgets.get('username'),dbutils.widgets.get('password'))).encode('ascii')).decode('ascii')}"
 
+import sys
+sys.path.append(os.path.abspath("../Includes"))
+
+from dbacademy_admin import AccountClient, account_api, get_session
+api = AccountClient.from_environment()
+
 # COMMAND ----------
 
 # MAGIC %md
@@ -183,6 +191,16 @@ os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64e
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC The same call can be made from Python with **`account_api`**, which reuses the connections of the **`api`** client and displays the response as a table.
+
+# COMMAND ----------
+
+workspaces = account_api("GET", "/workspaces", fields=["workspace_id", "workspace_name", "credentials_id", "storage_configuration_id"])
+workspaces
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC This call accomplishes two things:
 # MAGIC 1. it validates your authentication information and determines if it provides administrative capabilities
@@ -192,12 +210,27 @@ os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64e
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC The Python cells of this lab fill in *&lt;CREDENTIALS_ID&gt;* and *&lt;STORAGE_CONFIGURATION_ID&gt;* from **`get_session().ids`**. The next cell sets them from the workspace named in *source_workspace_name*, or from the first one listed if it's left empty. The cURL cells still need the values pasted in.
+
+# COMMAND ----------
+
+source_workspace_name = ""
+
+source = next(w for w in workspaces if w["workspace_name"] == source_workspace_name) if source_workspace_name else workspaces[0]
+get_session().ids.update(credentials_id=source["credentials_id"], storage_configuration_id=source["storage_configuration_id"])
+source
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ## Creating a key configuration
 # MAGIC
 # MAGIC Before we can apply an AWS key to a new or existing workspace, we must make Databricks aware of the key by creating a key configuration. Similar to how credential configurations, storage configurations, and network configurations all bring awareness of AWS constructs into Databricks, key configurations accomplish the same goal for AWS keys. Using the Account console API, let's create a new key configuration. Here we are creating the key for use with both managed services (control plane) and storage (data plane). And in that context, we're also providing for encryption on your cluster's EBS volumes.
 # MAGIC
 # MAGIC Prior to executing the following cell, be sure to replace <KEY_ARN> and <KEY_ALIAS> to the proper values from the key we created earlier.
+# MAGIC
+# MAGIC The cURL cell below and the Python cell after it are alternatives: run one or the other.
 
 # COMMAND ----------
 
@@ -213,6 +246,35 @@ os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64e
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC Or, instead, from Python. Rather than editing the cell, fill in the *key_arn* and *key_alias* fields it adds to the top of the notebook. If a key configuration for that key already exists, for example because the cURL cell created it, the cell picks it up instead of creating a second one. Either way, the *customer_managed_key_id* is remembered by **`account_api`** and fills in the *&lt;CSK_ID&gt;* placeholders of the calls that follow.
+
+# COMMAND ----------
+
+dbutils.widgets.text(name='key_arn', defaultValue='')
+dbutils.widgets.text(name='key_alias', defaultValue='')
+key_arn, key_alias = dbutils.widgets.get('key_arn'), dbutils.widgets.get('key_alias')
+if not key_arn or not key_alias:
+    raise ValueError("Fill in the key_arn and key_alias fields at the top of the notebook, then run this cell again")
+get_session().ids.update(key_arn=key_arn, key_alias=key_alias)
+
+existing = [k for k in account_api("GET", "/customer-managed-keys") if k.get("aws_key_info", {}).get("key_arn") == key_arn]
+if existing:
+    key = existing[0]
+    get_session().remember(key)
+else:
+    key = account_api("POST", "/customer-managed-keys", {
+        "use_cases": ["STORAGE","MANAGED_SERVICES"],
+        "aws_key_info": {
+            "key_arn": "<KEY_ARN>",
+            "key_alias": "<KEY_ALIAS>",
+            "reuse_key_for_cluster_volumes": True
+        }
+    })
+key
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC Once this executes successfully, take note of the  *customer_managed_key_id*. We will additionally need this value to create our workspace.
 
@@ -224,6 +286,8 @@ os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64e
 # MAGIC Now let's now create a new workspace using our key configuration. Though we've created workspaces before, this time we're using the Account API to do so since key configurations aren't currently handled by the UI.
 # MAGIC
 # MAGIC Prior to executing the following cell, be sure to replace *&lt;<CREDENTIALS_ID&gt;* and *&lt;STORAGE_CONFIGURATION_ID&gt;* with the values gathered earlier, and replace both instances of *&lt;CSK_ID&gt;* with the customer managed key id you just created.
+# MAGIC
+# MAGIC Again, the cURL cell below and the Python cell after it are alternatives: run one or the other. The Python cell needs no substitutions, and picks up the workspace if it already exists rather than creating a second one.
 
 # COMMAND ----------
 
@@ -240,6 +304,23 @@ os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64e
 
 # COMMAND ----------
 
+existing = [w for w in account_api("GET", "/workspaces") if w["workspace_name"] == "dbacademy_test_workspace_csk"]
+if existing:
+    workspace = existing[0]
+    get_session().remember(workspace)
+else:
+    workspace = account_api("POST", "/workspaces", {
+        "workspace_name": "dbacademy_test_workspace_csk",
+        "deployment_name": "workspace_csk",
+        "credentials_id": "<CREDENTIALS_ID>",
+        "storage_configuration_id": "<STORAGE_CONFIGURATION_ID>",
+        "managed_services_customer_managed_key_id": "<CSK_ID>",
+        "storage_customer_managed_key_id": "<CSK_ID>"
+    })
+workspace
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC That's all there is to it! Functionally, this workspace is no different than others; data in both the control and data planes is always always secure and encrypted at rest. In this case, however, we retain full control of the key used in the encryption. Disabling the key in the AWS console will immediately render all data in the the control and data planes inaccessible.
 
@@ -252,6 +333,8 @@ os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64e
 # MAGIC *&lt;WORKSPACE_ID&gt;* with an appropriate value like we saw earlier when listing workpaces. Furthermore, replace both instances of <CSK_ID> with the customer managed key id you just created.
 # MAGIC
 # MAGIC Note that if you're updating storage encryption, be sure to shutdown any clusters prior to updating, and wait at least 20 minutes after updating to start new clusters or use the DBFS API.
+# MAGIC
+# MAGIC To do the same from Python instead, set *workspace_to_update* in the cell after the cURL cell; it fills in *&lt;CSK_ID&gt;* with the key configuration from earlier.
 
 # COMMAND ----------
 
@@ -264,6 +347,19 @@ os.environ["DBACADEMY_API_AUTHENTICATION"] = f"Authorization: Basic {base64.b64e
 
 # COMMAND ----------
 
+# The id of the existing workspace to update. The workspace created above already uses the key, so this cell
+# does nothing until an id is set here.
+workspace_to_update = ""
+
+if workspace_to_update:
+    get_session().ids["workspace_id"] = workspace_to_update
+    account_api("PATCH", "/workspaces/<WORKSPACE_ID>", {
+        "managed_services_customer_managed_key_id": "<CSK_ID>",
+        "storage_customer_managed_key_id": "<CSK_ID>"
+    })
+
+# COMMAND ----------
+
 # MAGIC %md-sandbox
 # MAGIC &copy; 2023 Databricks, Inc. All rights reserved.<br/>
 # MAGIC Apache, Apache Spark, Spark and the Spark logo are trademarks of the <a href="https://www.apache.org/">Apache Software Foundation</a>.<br/>
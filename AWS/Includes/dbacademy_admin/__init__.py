@@ -0,0 +1,123 @@
+"""
+Python helpers for automating the Databricks account administration labs.
+
+Notebooks make this package importable by adding the ``Includes`` folder to
+``sys.path`` in their authentication cell.
+"""
+
+from .auth import AuthProvider, ServicePrincipalAuth, StaticAuth, basic_authorization, provider_from_environment
+from .bulk import BulkResult, WorkspaceSpec, create_workspaces
+from .cache import InventoryCache
+from .capacity import CapacityReport, plan_capacity, plan_resizes
+from .cidr import AddressSpaceExhausted, SubnetAllocator, SubnetPair
+from .client import AccountApiError, AccountClient, ConnectionPool, get_pool
+from .export import load_snapshots, write_snapshot
+from .iam import RoleFactory, RoleSpec, role_handlers
+from .iam_sim import Decision, PolicySimulator
+from .inventory import Inventory, collect_inventory, fetch_inventory
+from .journal import Journal, create_object, create_once, journaled_handlers
+from .kms import KMSClients, kms_handlers
+from .magic import AccountApiSession, ApiList, ApiObject, UnresolvedPlaceholder, account_api, get_session
+from .metastores import AssignmentChange, AssignmentPlan, AssignmentPlanner, apply_changes, load_planner
+from .metrics import Histogram, MetricsRecorder, RequestRecord
+from .netgen import Operation, apply_plan, describe_vpc, plan_networks
+from .policies import TEMPLATES, PolicyTemplate, RenderedPolicy, canonical, render_batch
+from .provisioner import Output, ProvisionResult, Provisioner, Resource, account_handlers, workspace_resources
+from .query import FleetIndex, QueryError, load_fleet
+from .reconcile import LiveState
+from .retry import RetryPolicy, TokenBucket, call_with_retry
+from .rollout import KeyRolloutScheduler, RolloutEvent, TimerWheel
+from .s3 import BucketSpec, S3Clients, bucket_handlers, provision_buckets
+from .streaming import iter_json_array
+from .vpc import EC2Clients, RegionNetwork, provision_vpcs, vpc_handlers, vpc_resources
+from .watch import AdaptiveSchedule, WorkspaceEvent, WorkspaceWatcher
+
+__all__ = [
+    "AccountApiError",
+    "AccountApiSession",
+    "AccountClient",
+    "AdaptiveSchedule",
+    "AddressSpaceExhausted",
+    "ApiList",
+    "ApiObject",
+    "AssignmentChange",
+    "AssignmentPlan",
+    "AssignmentPlanner",
+    "AuthProvider",
+    "BucketSpec",
+    "BulkResult",
+    "CapacityReport",
+    "ConnectionPool",
+    "Decision",
+    "EC2Clients",
+    "FleetIndex",
+    "Histogram",
+    "Inventory",
+    "InventoryCache",
+    "Journal",
+    "KMSClients",
+    "KeyRolloutScheduler",
+    "LiveState",
+    "MetricsRecorder",
+    "Operation",
+    "Output",
+    "PolicySimulator",
+    "PolicyTemplate",
+    "ProvisionResult",
+    "Provisioner",
+    "QueryError",
+    "RegionNetwork",
+    "RenderedPolicy",
+    "RequestRecord",
+    "Resource",
+    "RetryPolicy",
+    "RoleFactory",
+    "RoleSpec",
+    "RolloutEvent",
+    "S3Clients",
+    "ServicePrincipalAuth",
+    "StaticAuth",
+    "SubnetAllocator",
+    "SubnetPair",
+    "TEMPLATES",
+    "TimerWheel",
+    "TokenBucket",
+    "UnresolvedPlaceholder",
+    "WorkspaceEvent",
+    "WorkspaceSpec",
+    "WorkspaceWatcher",
+    "account_api",
+    "account_handlers",
+    "apply_changes",
+    "apply_plan",
+    "basic_authorization",
+    "bucket_handlers",
+    "call_with_retry",
+    "canonical",
+    "collect_inventory",
+    "create_object",
+    "create_once",
+    "create_workspaces",
+    "describe_vpc",
+    "fetch_inventory",
+    "get_pool",
+    "get_session",
+    "iter_json_array",
+    "journaled_handlers",
+    "kms_handlers",
+    "load_fleet",
+    "load_planner",
+    "load_snapshots",
+    "plan_capacity",
+    "plan_networks",
+    "plan_resizes",
+    "provider_from_environment",
+    "provision_buckets",
+    "provision_vpcs",
+    "render_batch",
+    "role_handlers",
+    "vpc_handlers",
+    "vpc_resources",
+    "workspace_resources",
+    "write_snapshot",
+]
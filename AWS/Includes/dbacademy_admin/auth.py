@@ -0,0 +1,176 @@
+"""
+Credentials for the Account API.
+
+The labs' authentication cell base64-encodes ``username:password`` into a
+Basic ``Authorization`` header. ``AccountClient`` accepts that header value
+as a string, or any ``AuthProvider``:
+
+- ``StaticAuth`` wraps a fixed header value, e.g. ``StaticAuth.basic(user, password)``.
+- ``ServicePrincipalAuth`` exchanges the client id and secret of an OAuth
+  service principal for access tokens at the account's token endpoint.
+
+A ``ServicePrincipalAuth`` is meant to be shared by every client, thread and
+asyncio task of the process. Its token is read without locking; once the
+token enters its refresh window a single background thread fetches the next
+one while callers keep using the current one, so a long bulk run neither
+waits on token exchanges nor fails with HTTP 401 when a token expires.
+
+``provider_from_environment()`` uses a service principal when
+``DBACADEMY_CLIENT_ID`` and ``DBACADEMY_CLIENT_SECRET`` are set, and the
+``DBACADEMY_API_AUTHENTICATION`` header otherwise.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+from urllib.parse import urlencode, urlsplit
+
+from .client import DEFAULT_HOST, AccountApiError, authorization_from_environment, get_pool
+
+# Refresh this long before a token expires, or halfway through its lifetime if that is shorter.
+REFRESH_AHEAD = 5 * 60.0
+# Stop handing out a token this long before it expires, so it cannot expire in flight.
+EXPIRY_MARGIN = 30.0
+
+
+def basic_authorization(username: str, password: str) -> str:
+    """The Basic ``Authorization`` header value built by the labs' authentication cell."""
+    return "Basic " + base64.b64encode(f"{username}:{password}".encode("utf-8")).decode("ascii")
+
+
+class AuthProvider:
+    """Source of the ``Authorization`` header value sent with each call."""
+
+    def authorization(self) -> str:
+        raise NotImplementedError
+
+    async def authorization_async(self) -> str:
+        return self.authorization()
+
+    def invalidate(self) -> None:
+        """Forget the current credential after the server rejected it."""
+
+
+class StaticAuth(AuthProvider):
+    def __init__(self, value: str):
+        self.value = value
+
+    @classmethod
+    def basic(cls, username: str, password: str) -> "StaticAuth":
+        return cls(basic_authorization(username, password))
+
+    def authorization(self) -> str:
+        return self.value
+
+
+@dataclass(frozen=True)
+class Token:
+    """An access token; ``refresh_at`` and ``stale_at`` are times on the provider's clock."""
+
+    header: str
+    refresh_at: float
+    stale_at: float
+
+
+class ServicePrincipalAuth(AuthProvider):
+    """OAuth client-credentials tokens for a service principal, cached in process."""
+
+    def __init__(self, account_id: str, client_id: str, client_secret: str, host: str = DEFAULT_HOST,
+                 scheme: str = "https", scope: str = "all-apis", refresh_ahead: float = REFRESH_AHEAD,
+                 expiry_margin: float = EXPIRY_MARGIN, clock: Callable[[], float] = time.monotonic):
+        self.account_id = account_id
+        self.client_id = client_id
+        self.scope = scope
+        self.refresh_ahead = refresh_ahead
+        self.expiry_margin = expiry_margin
+        self.exchanges = 0
+        self.last_error: Optional[Exception] = None
+        self._path = f"/oidc/accounts/{account_id}/v1/token"
+        self._pool = get_pool(scheme, host)
+        self._credentials = basic_authorization(client_id, client_secret)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._token: Optional[Token] = None
+        self._refreshing = False
+
+    @classmethod
+    def for_url(cls, base_url: str, client_id: str, client_secret: str, **kwargs) -> "ServicePrincipalAuth":
+        """Provider for the account of a ``DBACADEMY_API_URL``-style URL."""
+        parts = urlsplit(base_url)
+        account_id = parts.path.rstrip("/").rsplit("/", 1)[-1]
+        return cls(account_id, client_id, client_secret, host=parts.netloc, scheme=parts.scheme, **kwargs)
+
+    def _exchange(self) -> Token:
+        body = urlencode({"grant_type": "client_credentials", "scope": self.scope}).encode("ascii")
+        headers = {"Authorization": self._credentials, "Content-Type": "application/x-www-form-urlencoded"}
+        started = self._clock()
+        status, data = self._pool.request("POST", self._path, body, headers)
+        if status != 200:
+            raise AccountApiError(status, "POST", self._path, data)
+        response = json.loads(data)
+        self.exchanges += 1
+        lifetime = float(response.get("expires_in", 3600))
+        expires_at = started + lifetime
+        return Token(
+            header=f"{response.get('token_type', 'Bearer')} {response['access_token']}",
+            refresh_at=expires_at - min(self.refresh_ahead, lifetime / 2),
+            stale_at=expires_at - min(self.expiry_margin, lifetime / 10),
+        )
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                token = self._exchange()
+                with self._lock:
+                    self._token = token
+            except Exception as e:
+                # The current token stays in use; the next call past refresh_at tries again.
+                self.last_error = e
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name="dbacademy-token-refresh", daemon=True).start()
+
+    def authorization(self) -> str:
+        token = self._token
+        now = self._clock()
+        if token is not None and now < token.stale_at:
+            if now >= token.refresh_at:
+                self._refresh_in_background()
+            return token.header
+        with self._lock:
+            token = self._token
+            if token is None or self._clock() >= token.stale_at:
+                token = self._token = self._exchange()
+            return token.header
+
+    async def authorization_async(self) -> str:
+        token = self._token
+        if token is not None and self._clock() < token.refresh_at:
+            return token.header
+        return await asyncio.get_running_loop().run_in_executor(None, self.authorization)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._token = None
+
+
+def provider_from_environment() -> AuthProvider:
+    """The provider for the credentials configured in the environment."""
+    client_id = os.environ.get("DBACADEMY_CLIENT_ID")
+    client_secret = os.environ.get("DBACADEMY_CLIENT_SECRET")
+    if client_id and client_secret:
+        return ServicePrincipalAuth.for_url(os.environ["DBACADEMY_API_URL"], client_id, client_secret)
+    return StaticAuth(authorization_from_environment())
@@ -0,0 +1,90 @@
+"""
+Bulk workspace creation.
+
+The labs create one workspace per hand-edited ``POST /workspaces`` cell. For
+onboarding batches, ``create_workspaces`` submits a list of ``WorkspaceSpec``
+through a bounded pool of workers that share one ``TokenBucket``, retrying
+throttled calls with jittered backoff. A ``POST /workspaces`` answered with a
+5xx status may have created the workspace anyway, so only throttled calls and
+calls that never reached the server are retried.
+"""
+
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, fields
+from typing import Iterable, List, Optional, Tuple
+
+from .client import JSON, AccountClient
+from .retry import CallStats, RetryPolicy, TokenBucket, call_with_retry, for_creates
+
+
+@dataclass
+class WorkspaceSpec:
+    """Payload of ``POST /workspaces``; unset optional fields are left out."""
+
+    workspace_name: str
+    credentials_id: str
+    storage_configuration_id: str
+    aws_region: str = "us-east-1"
+    deployment_name: Optional[str] = None
+    network_id: Optional[str] = None
+    managed_services_customer_managed_key_id: Optional[str] = None
+    storage_customer_managed_key_id: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: JSON) -> "WorkspaceSpec":
+        known = {f.name for f in fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"Unknown workspace fields: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    def to_payload(self) -> JSON:
+        return {key: value for key, value in asdict(self).items() if value is not None}
+
+
+@dataclass
+class BulkResult:
+    created: List[JSON] = field(default_factory=list)
+    failed: List[Tuple[WorkspaceSpec, Exception]] = field(default_factory=list)
+    retries: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def per_minute(self) -> float:
+        return 60.0 * len(self.created) / self.elapsed if self.elapsed else 0.0
+
+
+def create_workspaces(client: AccountClient, specs: Iterable[WorkspaceSpec], max_workers: int = 8,
+                      limiter: Optional[TokenBucket] = None,
+                      retry: Optional[RetryPolicy] = None) -> BulkResult:
+    """Create every workspace in ``specs`` with at most ``max_workers`` calls in flight.
+
+    ``limiter`` defaults to 5 calls per second. ``retry`` is narrowed with
+    ``retry.for_creates``. A spec whose creation still fails after retrying
+    lands in ``BulkResult.failed`` without stopping the others.
+    """
+    limiter = limiter or TokenBucket(rate=5.0)
+    retry = for_creates(retry)
+    stats = CallStats()
+    result = BulkResult()
+
+    def create(spec: WorkspaceSpec):
+        try:
+            return spec, call_with_retry(lambda: client.create_workspace(spec.to_payload()),
+                                         retry, limiter, stats), None
+        except Exception as e:
+            return spec, None, e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for spec, workspace, error in executor.map(create, specs):
+            if error is None:
+                result.created.append(workspace)
+            else:
+                result.failed.append((spec, error))
+    result.elapsed = time.perf_counter() - start
+    result.retries = stats.retries
+    return result
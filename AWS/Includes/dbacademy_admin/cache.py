@@ -0,0 +1,210 @@
+"""
+Persistent local cache of Account API objects.
+
+Notebooks tend to re-list workspaces only to recover IDs fetched minutes
+earlier. ``InventoryCache`` keeps list and item responses in a SQLite file with
+a time-to-live per resource type, fronted by an in-process dictionary so that
+repeated lookups cost microseconds. ``AccountClient`` consults it for ``GET``
+calls and invalidates the affected entries after successful writes. A write
+only marks the collection's list stale: ``lists`` and ``objects`` still return
+the last known state, which is what ``query.load_fleet`` indexes.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Seconds before a cached response is considered stale, by collection. Workspace
+# status changes while a workspace provisions; the configurations rarely change.
+DEFAULT_TTLS = {
+    "workspaces": 60.0,
+    "credentials": 3600.0,
+    "storage-configurations": 3600.0,
+    "networks": 3600.0,
+    "customer-managed-keys": 3600.0,
+}
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".dbacademy", "inventory.sqlite")
+
+# Key under which the full list of a collection is stored.
+LIST_KEY = ""
+
+# Storage time of a list invalidated by a write: never fresh, and evicted first.
+STALE = float("-inf")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    account_id TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (account_id, collection, key)
+);
+CREATE INDEX IF NOT EXISTS entries_stored_at ON entries (stored_at);
+"""
+
+_Key = Tuple[str, str, str]
+
+
+class InventoryCache:
+    """Size-bounded cache of Account API responses with a TTL per collection.
+
+    Entries are keyed by ``(account_id, collection, key)`` where ``collection``
+    is the endpoint name, e.g. ``storage-configurations``, and ``key`` is an
+    object id or ``LIST_KEY`` for the whole list. Once more than
+    ``max_entries`` are stored, the oldest ones are evicted.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, ttls: Optional[Dict[str, float]] = None,
+                 max_entries: int = 100000, clock: Callable[[], float] = time.time):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.executescript(_SCHEMA)
+        self._count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        # Decoded values with their storage time, most recently used last.
+        self._hot: "OrderedDict[_Key, Tuple[Any, float]]" = OrderedDict()
+        self._hot_size = min(max_entries, 4096)
+
+    def _fresh(self, collection: str, stored_at: float) -> bool:
+        return self._clock() - stored_at < self.ttls.get(collection, 0.0)
+
+    def _remember(self, key: _Key, value: Any, stored_at: float) -> None:
+        self._hot[key] = (value, stored_at)
+        self._hot.move_to_end(key)
+        if len(self._hot) > self._hot_size:
+            self._hot.popitem(last=False)
+
+    def get(self, account_id: str, collection: str, key: str = LIST_KEY) -> Optional[Any]:
+        """The cached value, or ``None`` if it is missing or stale."""
+        cache_key = (account_id, collection, key)
+        with self._lock:
+            hit = self._hot.get(cache_key)
+            if hit is None:
+                row = self._db.execute(
+                    "SELECT value, stored_at FROM entries WHERE account_id = ? AND collection = ? AND key = ?",
+                    cache_key).fetchone()
+                if row is None:
+                    return None
+                hit = (json.loads(row[0]), row[1])
+                self._remember(cache_key, *hit)
+            else:
+                self._hot.move_to_end(cache_key)
+            value, stored_at = hit
+            return value if self._fresh(collection, stored_at) else None
+
+    def lists(self, collection: str) -> Dict[str, Tuple[list, float]]:
+        """The last list stored for a collection in every account, with its storage time, fresh or not.
+
+        A list invalidated by a write since is returned with ``STALE`` as its storage time.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT account_id, value, stored_at FROM entries WHERE collection = ? AND key = ?",
+                                    (collection, LIST_KEY)).fetchall()
+        return {account_id: (json.loads(value), stored_at) for account_id, value, stored_at in rows}
+
+    def objects(self, collection: str) -> Dict[str, Dict[str, Any]]:
+        """Every object stored individually for a collection, fresh or not, by account and key."""
+        with self._lock:
+            rows = self._db.execute("SELECT account_id, key, value FROM entries WHERE collection = ? AND key != ?",
+                                    (collection, LIST_KEY)).fetchall()
+        objects: Dict[str, Dict[str, Any]] = {}
+        for account_id, key, value in rows:
+            objects.setdefault(account_id, {})[key] = json.loads(value)
+        return objects
+
+    def put(self, account_id: str, collection: str, key: str, value: Any) -> None:
+        self._store(account_id, collection, [(key, value)])
+
+    def put_list(self, account_id: str, collection: str, id_field: str, objects: list) -> None:
+        """Store a full list response along with each of its objects, in one transaction."""
+        items = [(LIST_KEY, objects)]
+        items.extend((str(obj[id_field]), obj) for obj in objects if id_field in obj)
+        self._store(account_id, collection, items)
+
+    def _store(self, account_id: str, collection: str, items: list) -> None:
+        stored_at = self._clock()
+        rows = [(account_id, collection, key, json.dumps(value), stored_at) for key, value in items]
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+            for key, value in items:
+                self._remember((account_id, collection, key), value, stored_at)
+            # Replaced rows are counted too, so _count may run high; _evict
+            # re-counts before deleting anything.
+            self._count += len(rows)
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        self._count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        excess = self._count - self.max_entries
+        if excess <= 0:
+            return
+        evicted = self._db.execute(
+            "SELECT account_id, collection, key FROM entries ORDER BY stored_at LIMIT ?", (excess,)).fetchall()
+        self._db.executemany("DELETE FROM entries WHERE account_id = ? AND collection = ? AND key = ?", evicted)
+        for key in evicted:
+            self._hot.pop(tuple(key), None)
+        self._count -= len(evicted)
+
+    def invalidate(self, account_id: str, collection: str, key: str = LIST_KEY) -> None:
+        """Mark the list of a collection stale and drop the object stored under ``key``."""
+        self._write_stale(account_id, collection, key)
+
+    def remove(self, account_id: str, collection: str, key: str, id_field: str) -> None:
+        """Like ``invalidate``, for a deleted object: it is taken out of the stale list too."""
+        self._write_stale(account_id, collection, key, lambda obj: str(obj.get(id_field)) != key)
+
+    def _write_stale(self, account_id: str, collection: str, key: str,
+                     keep: Optional[Callable[[Any], bool]] = None) -> None:
+        list_key = (account_id, collection, LIST_KEY)
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                if keep is None:
+                    self._db.execute("UPDATE entries SET stored_at = ? WHERE account_id = ? AND collection = ? "
+                                     "AND key = ?", (STALE,) + list_key)
+                else:
+                    row = self._db.execute("SELECT value FROM entries WHERE account_id = ? AND collection = ? "
+                                           "AND key = ?", list_key).fetchone()
+                    if row is not None:
+                        listed = [obj for obj in json.loads(row[0]) if keep(obj)]
+                        self._db.execute("UPDATE entries SET value = ?, stored_at = ? WHERE account_id = ? "
+                                         "AND collection = ? AND key = ?", (json.dumps(listed), STALE) + list_key)
+                cursor = self._db.execute("DELETE FROM entries WHERE account_id = ? AND collection = ? AND key = ?",
+                                          (account_id, collection, key)) if key != LIST_KEY else None
+            self._hot.pop(list_key, None)
+            self._hot.pop((account_id, collection, key), None)
+            if cursor is not None:
+                self._count -= max(cursor.rowcount, 0)
+
+    def invalidate_collection(self, account_id: str, collection: str) -> None:
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM entries WHERE account_id = ? AND collection = ?", (account_id, collection))
+            for cache_key in [k for k in self._hot if k[:2] == (account_id, collection)]:
+                del self._hot[cache_key]
+            self._count -= max(cursor.rowcount, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._hot.clear()
+            self._count = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,162 @@
+"""
+Allocation of private subnet pairs inside a customer-managed VPC.
+
+Each workspace in a customer-managed VPC needs two private subnets that do not
+overlap any other subnet of the VPC and that sit in different availability
+zones. ``SubnetAllocator`` models the VPC address space as a buddy system: one
+set of free blocks per prefix length, splitting a larger block on allocation
+and merging a block with its free buddy on release. Both take time
+proportional to the number of prefix lengths, that is logarithmic in the size
+of the address space.
+"""
+
+from __future__ import annotations
+
+import heapq
+import ipaddress
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+# Netmask range Databricks accepts for workspace subnets.
+MIN_PREFIXLEN = 17
+MAX_PREFIXLEN = 26
+
+
+class AddressSpaceExhausted(ValueError):
+    """Raised when no free block of the requested size is left in the VPC."""
+
+
+@dataclass(frozen=True)
+class SubnetPair:
+    """Two private subnets for one workspace, each with its availability zone."""
+
+    subnets: Tuple[ipaddress.IPv4Network, ipaddress.IPv4Network]
+    availability_zones: Tuple[str, str]
+
+    @property
+    def cidrs(self) -> Tuple[str, str]:
+        return str(self.subnets[0]), str(self.subnets[1])
+
+
+class SubnetAllocator:
+    """Buddy allocator over the address space of one VPC.
+
+    ``existing`` lists the CIDR blocks of subnets already in the VPC, such as
+    the public and private subnets created by the VPC wizard.
+    """
+
+    def __init__(self, vpc_cidr: str, existing: Iterable[str] = ()):
+        self.vpc = ipaddress.IPv4Network(vpc_cidr)
+        # Prefix length -> network addresses of free blocks, as a min-heap and a
+        # set. Heap entries missing from the set are stale and skipped.
+        self._heaps: Dict[int, List[int]] = {p: [] for p in range(self.vpc.prefixlen, 33)}
+        self._free: Dict[int, Set[int]] = {p: set() for p in range(self.vpc.prefixlen, 33)}
+        self._add(int(self.vpc.network_address), self.vpc.prefixlen)
+        for cidr in existing:
+            self.reserve(cidr)
+
+    @staticmethod
+    def _size(prefixlen: int) -> int:
+        return 1 << (32 - prefixlen)
+
+    def _add(self, address: int, prefixlen: int) -> None:
+        self._free[prefixlen].add(address)
+        heapq.heappush(self._heaps[prefixlen], address)
+
+    def _pop_lowest(self, prefixlen: int):
+        heap, free = self._heaps[prefixlen], self._free[prefixlen]
+        while heap:
+            address = heapq.heappop(heap)
+            if address in free:
+                free.remove(address)
+                return address
+        return None
+
+    def _network(self, address: int, prefixlen: int) -> ipaddress.IPv4Network:
+        return ipaddress.IPv4Network((address, prefixlen))
+
+    def allocate(self, prefixlen: int) -> ipaddress.IPv4Network:
+        """Take the lowest free block of the given size."""
+        if not self.vpc.prefixlen <= prefixlen <= 32:
+            raise ValueError(f"/{prefixlen} does not fit in {self.vpc}")
+        for level in range(prefixlen, self.vpc.prefixlen - 1, -1):
+            address = self._pop_lowest(level)
+            if address is None:
+                continue
+            # Split down to the requested size, freeing the upper halves.
+            for split in range(level + 1, prefixlen + 1):
+                self._add(address + self._size(split), split)
+            return self._network(address, prefixlen)
+        raise AddressSpaceExhausted(f"No free /{prefixlen} left in {self.vpc}")
+
+    def reserve(self, cidr: str) -> ipaddress.IPv4Network:
+        """Mark a specific block as used, e.g. a subnet that already exists."""
+        network = ipaddress.IPv4Network(cidr)
+        if not network.subnet_of(self.vpc):
+            raise ValueError(f"{network} is not within {self.vpc}")
+        address, prefixlen = int(network.network_address), network.prefixlen
+        for level in range(prefixlen, self.vpc.prefixlen - 1, -1):
+            block = address & ~(self._size(level) - 1)
+            if block not in self._free[level]:
+                continue
+            self._free[level].remove(block)
+            # Split towards the reserved block, freeing the halves beside it.
+            for split in range(level + 1, prefixlen + 1):
+                half = self._size(split)
+                if address & half:
+                    self._add(block, split)
+                    block += half
+                else:
+                    self._add(block + half, split)
+            return network
+        raise ValueError(f"{network} overlaps a block that is already in use")
+
+    def release(self, network: ipaddress.IPv4Network) -> None:
+        """Return a block, merging it with its buddy while both are free."""
+        address, prefixlen = int(network.network_address), network.prefixlen
+        while prefixlen > self.vpc.prefixlen:
+            buddy = address ^ self._size(prefixlen)
+            if buddy not in self._free[prefixlen]:
+                break
+            self._free[prefixlen].remove(buddy)
+            address = min(address, buddy)
+            prefixlen -= 1
+        self._add(address, prefixlen)
+
+    def free_addresses(self) -> int:
+        return sum(len(blocks) * self._size(p) for p, blocks in self._free.items())
+
+    def allocate_pair(self, prefixlen: int, availability_zones: Sequence[str]) -> SubnetPair:
+        """Allocate the two subnets of one workspace in the first two given zones."""
+        if not MIN_PREFIXLEN <= prefixlen <= MAX_PREFIXLEN:
+            raise ValueError(f"Workspace subnets must be between /{MIN_PREFIXLEN} and /{MAX_PREFIXLEN}")
+        if len(availability_zones) < 2 or availability_zones[0] == availability_zones[1]:
+            raise ValueError("The two subnets of a workspace need different availability zones")
+        first = self.allocate(prefixlen)
+        try:
+            second = self.allocate(prefixlen)
+        except AddressSpaceExhausted:
+            self.release(first)
+            raise
+        return SubnetPair((first, second), (availability_zones[0], availability_zones[1]))
+
+    def plan(self, count: int, prefixlen: int, availability_zones: Sequence[str]) -> List[SubnetPair]:
+        """Allocate subnet pairs for ``count`` workspaces, rotating through the zones.
+
+        Either every pair is allocated or, if the VPC runs out of space, none is.
+        """
+        zones = list(dict.fromkeys(availability_zones))
+        if len(zones) < 2:
+            raise ValueError("At least two distinct availability zones are needed")
+        pairs: List[SubnetPair] = []
+        try:
+            for i in range(count):
+                first = zones[(2 * i) % len(zones)]
+                second = zones[(2 * i + 1) % len(zones)]
+                pairs.append(self.allocate_pair(prefixlen, (first, second)))
+        except AddressSpaceExhausted:
+            for pair in pairs:
+                for subnet in pair.subnets:
+                    self.release(subnet)
+            raise
+        return pairs
@@ -0,0 +1,492 @@
+"""
+In-process client for the Databricks Account API.
+
+The labs issue every Account API call through ``%sh curl``, which costs a
+process spawn and a fresh TLS handshake per call. ``AccountClient`` keeps a
+pool of keep-alive connections per host instead, so a notebook sets it up once
+in its authentication cell and reuses it for every call that follows.
+"""
+
+from __future__ import annotations
+
+import email.utils
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlsplit
+
+from .cache import InventoryCache
+from .metrics import NO_RESPONSE, RequestRecord, endpoint_template, retry_attempt
+from .streaming import iter_json_array
+
+if TYPE_CHECKING:
+    from .auth import AuthProvider
+
+DEFAULT_HOST = "accounts.cloud.databricks.com"
+API_PREFIX = "/api/2.0/accounts"
+
+JSON = Dict[str, Any]
+
+# Methods that may be sent again when a connection fails after the request was written.
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+
+# Account API collections used by the labs -> name of the id field of their objects.
+COLLECTIONS = {
+    "workspaces": "workspace_id",
+    "credentials": "credentials_id",
+    "storage-configurations": "storage_configuration_id",
+    "networks": "network_id",
+    "customer-managed-keys": "customer_managed_key_id",
+}
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Seconds to wait according to a ``Retry-After`` header, given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+class AccountApiError(Exception):
+    """Raised when the Account API answers with a non-2xx status.
+
+    ``retry_after`` holds the seconds requested by a ``Retry-After`` header, if any.
+    """
+
+    def __init__(self, status: int, method: str, path: str, body: bytes, retry_after: Optional[float] = None):
+        self.status = status
+        self.method = method
+        self.path = path
+        self.body = body
+        self.retry_after = retry_after
+        try:
+            detail = json.loads(body).get("message", "")
+        except (ValueError, AttributeError):
+            detail = body[:200].decode("utf-8", "replace")
+        super().__init__(f"{method} {path} returned HTTP {status}: {detail}")
+
+
+class ConnectionPool:
+    """Thread-safe pool of keep-alive HTTP(S) connections to a single host."""
+
+    def __init__(self, scheme: str, netloc: str, maxsize: int = 16, timeout: float = 60.0):
+        if scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported scheme: {scheme}")
+        self.scheme = scheme
+        self.netloc = netloc
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize)
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(self.netloc, timeout=self.timeout)
+
+    def _acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _send(self, method: str, path: str, body: Optional[bytes], headers: Optional[Dict[str, str]],
+              timings: Optional[Dict[str, float]] = None,
+              ) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        # A connection taken from the pool may have been closed by the server
+        # while idle; such a request is retried on a fresh connection. Once the
+        # request has been written, the server may have acted on it, so only
+        # idempotent methods are retried from then on.
+        while True:
+            conn, reused = self._acquire()
+            written = False
+            try:
+                started = time.perf_counter()
+                if not reused:
+                    conn.connect()
+                connected = time.perf_counter()
+                conn.request(method, path, body=body, headers=headers or {})
+                written = True
+                response = conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if not reused or (written and method not in IDEMPOTENT_METHODS):
+                    raise
+                continue
+            if timings is not None:
+                timings["connect"] = connected - started
+                timings["wait"] = time.perf_counter() - connected
+                timings["reused"] = reused
+            return conn, response
+
+    def _finish(self, conn: http.client.HTTPConnection, response: http.client.HTTPResponse) -> None:
+        if response.will_close or not response.isclosed():
+            conn.close()
+        else:
+            self._release(conn)
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None,
+                timings: Optional[Dict[str, float]] = None,
+                response_headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        """Send one request and return ``(status, body)``.
+
+        With ``timings``, the ``connect``, ``wait`` and ``read`` phases of the
+        call are stored in it, in seconds, along with whether the connection
+        was ``reused``. With ``response_headers``, the headers of the response
+        are stored in it under lower-case names.
+        """
+        conn, response = self._send(method, path, body, headers, timings)
+        started = time.perf_counter()
+        try:
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            raise
+        if timings is not None:
+            timings["read"] = time.perf_counter() - started
+        if response_headers is not None:
+            response_headers.update((name.lower(), value) for name, value in response.getheaders())
+        self._finish(conn, response)
+        return response.status, data
+
+    @contextmanager
+    def stream(self, method: str, path: str, body: Optional[bytes] = None,
+               headers: Optional[Dict[str, str]] = None,
+               timings: Optional[Dict[str, float]] = None) -> Iterator[http.client.HTTPResponse]:
+        """Send one request and yield the response without reading its body.
+
+        The connection goes back to the pool only if the body was read to the
+        end; otherwise it is closed.
+        """
+        conn, response = self._send(method, path, body, headers, timings)
+        try:
+            yield response
+        finally:
+            self._finish(conn, response)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools: Dict[Tuple[str, str], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(scheme: str, netloc: str, maxsize: int = 16) -> ConnectionPool:
+    """Return the process-wide pool for a host, creating it on first use."""
+    with _pools_lock:
+        pool = _pools.get((scheme, netloc))
+        if pool is None:
+            pool = _pools[(scheme, netloc)] = ConnectionPool(scheme, netloc, maxsize)
+        return pool
+
+
+def authorization_from_environment() -> str:
+    """The ``Authorization`` header value stored in ``DBACADEMY_API_AUTHENTICATION``."""
+    name, _, value = os.environ["DBACADEMY_API_AUTHENTICATION"].partition(":")
+    if name.strip().lower() != "authorization":
+        raise ValueError("DBACADEMY_API_AUTHENTICATION must be an Authorization header")
+    return value.strip()
+
+
+class AccountClient:
+    """Client for the Account API endpoints used throughout the labs.
+
+    ``base_url`` has the same form as ``DBACADEMY_API_URL``, that is
+    ``https://accounts.cloud.databricks.com/api/2.0/accounts/<ACCOUNT_ID>``,
+    and ``authorization`` is the value of the ``Authorization`` header or an
+    ``AuthProvider``. With a provider, a call answered with HTTP 401 is
+    retried once with a fresh credential. Clients for the same host share one
+    connection pool.
+
+    Each callable in ``hooks`` is given a ``metrics.RequestRecord`` for every
+    call made, including calls that fail without a response; timings are only
+    taken when there is a hook.
+
+    With an ``InventoryCache``, ``GET`` calls on the collections in
+    ``COLLECTIONS`` are answered from the cache while fresh, and successful
+    ``POST``, ``PATCH`` and ``DELETE`` calls invalidate what they touched.
+    """
+
+    def __init__(self, base_url: str, authorization: Union[str, AuthProvider], pool: Optional[ConnectionPool] = None,
+                 cache: Optional[InventoryCache] = None, hooks: Iterable[Callable[[RequestRecord], None]] = ()):
+        parts = urlsplit(base_url)
+        self.cache = cache
+        self.hooks = list(hooks)
+        self.base_url = base_url.rstrip("/")
+        self.account_id = parts.path.rstrip("/").rsplit("/", 1)[-1]
+        self._prefix = parts.path.rstrip("/")
+        self._pool = pool or get_pool(parts.scheme, parts.netloc)
+        self._auth = None if isinstance(authorization, str) else authorization
+        self._headers = {
+            "Authorization": authorization if self._auth is None else "",
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+        }
+
+    @classmethod
+    def for_account(cls, account_id: str, authorization: Union[str, AuthProvider], host: str = DEFAULT_HOST,
+                    scheme: str = "https", **kwargs) -> "AccountClient":
+        return cls(f"{scheme}://{host}{API_PREFIX}/{account_id}", authorization, **kwargs)
+
+    @classmethod
+    def from_environment(cls, **kwargs) -> "AccountClient":
+        """Build a client from the variables set by the labs' authentication cell.
+
+        A service principal configured in the environment takes precedence
+        over ``DBACADEMY_API_AUTHENTICATION``; see ``auth.provider_from_environment``.
+        """
+        from .auth import provider_from_environment
+
+        return cls(os.environ["DBACADEMY_API_URL"], provider_from_environment(), **kwargs)
+
+    def _request_headers(self) -> Dict[str, str]:
+        if self._auth is None:
+            return self._headers
+        return dict(self._headers, Authorization=self._auth.authorization())
+
+    def request(self, method: str, endpoint: str, payload: Optional[JSON] = None) -> Any:
+        """Issue a call against an endpoint relative to the account, e.g. ``/workspaces``."""
+        collection, _, key = endpoint.strip("/").partition("/")
+        cached = self.cache is not None and collection in COLLECTIONS and "/" not in key
+        if cached and method == "GET":
+            value = self.cache.get(self.account_id, collection, key)
+            if value is not None:
+                return value
+
+        path = self._prefix + endpoint
+        body = None if payload is None else json.dumps(payload).encode("utf-8")
+        timings: Optional[Dict[str, float]] = {} if self.hooks else None
+        headers: Dict[str, str] = {}
+        try:
+            status, data = self._pool.request(method, path, body, self._request_headers(), timings, headers)
+            if status == 401 and self._auth is not None:
+                self._auth.invalidate()
+                headers.clear()
+                status, data = self._pool.request(method, path, body, self._request_headers(), timings, headers)
+        except (http.client.HTTPException, OSError):
+            if timings is not None:
+                self._emit(method, endpoint, NO_RESPONSE, body, b"", timings, 0.0)
+            raise
+        if not 200 <= status < 300:
+            if timings is not None:
+                self._emit(method, endpoint, status, body, data, timings, 0.0)
+            raise AccountApiError(status, method, path, data, parse_retry_after(headers.get("retry-after")))
+        started = time.perf_counter()
+        try:
+            value = json.loads(data) if data else None
+        except ValueError:
+            if timings is not None:
+                self._emit(method, endpoint, NO_RESPONSE, body, data, timings, time.perf_counter() - started)
+            raise
+        if timings is not None:
+            self._emit(method, endpoint, status, body, data, timings, time.perf_counter() - started)
+
+        if cached:
+            if method == "DELETE" and key:
+                self.cache.remove(self.account_id, collection, key, COLLECTIONS[collection])
+            elif method != "GET":
+                self.cache.invalidate(self.account_id, collection, key)
+            elif key:
+                self.cache.put(self.account_id, collection, key, value)
+            else:
+                self.cache.put_list(self.account_id, collection, COLLECTIONS[collection], value)
+        return value
+
+    def stream_list(self, endpoint: str, fields: Optional[Sequence[str]] = None,
+                    chunk_size: int = 64 * 1024) -> Iterator[JSON]:
+        """Yield the objects of a list endpoint one at a time as the response arrives.
+
+        Only the keys in ``fields`` are kept when it is given, so memory use
+        stays flat however long the list is.
+        """
+        path = self._prefix + endpoint
+        timings: Optional[Dict[str, float]] = {} if self.hooks else None
+        received = 0
+
+        def chunks() -> Iterator[bytes]:
+            nonlocal received
+            for chunk in iter(lambda: response.read(chunk_size), b""):
+                received += len(chunk)
+                yield chunk
+
+        retried = False
+        started: Optional[float] = None
+        try:
+            while True:
+                with self._pool.stream("GET", path, None, self._request_headers(), timings) as response:
+                    if response.status == 401 and self._auth is not None and not retried:
+                        # As in request(): the token may have expired since it was issued.
+                        response.read()
+                        self._auth.invalidate()
+                        retried = True
+                        continue
+                    if not 200 <= response.status < 300:
+                        raise AccountApiError(response.status, "GET", path, response.read(),
+                                              parse_retry_after(response.getheader("Retry-After")))
+                    started = time.perf_counter()
+                    yield from iter_json_array(chunks(), fields)
+                    break
+        except (AccountApiError, http.client.HTTPException, OSError, ValueError) as e:
+            if timings is not None:
+                failed = isinstance(e, AccountApiError)
+                timings["read"] = 0.0
+                self._emit("GET", endpoint, e.status if failed else NO_RESPONSE, None, e.body if failed else b"",
+                           timings, 0.0 if started is None else time.perf_counter() - started,
+                           None if failed else received)
+            raise
+        if timings is not None:
+            # Reading and parsing are interleaved; the whole stream counts as parsing.
+            timings["read"] = 0.0
+            self._emit("GET", endpoint, response.status, None, b"", timings, time.perf_counter() - started, received)
+
+    def _emit(self, method: str, endpoint: str, status: int, body: Optional[bytes], data: bytes,
+              timings: Dict[str, float], parse: float, received: Optional[int] = None) -> None:
+        record = RequestRecord(
+            endpoint=endpoint_template(endpoint), method=method, status=status, attempt=retry_attempt.get(),
+            bytes_sent=len(body) if body else 0, bytes_received=len(data) if received is None else received,
+            connect=timings.get("connect", 0.0), wait=timings.get("wait", 0.0), read=timings.get("read", 0.0),
+            parse=parse, reused=bool(timings.get("reused")),
+        )
+        for hook in self.hooks:
+            hook(record)
+
+    # Workspaces
+
+    def list_workspaces(self) -> List[JSON]:
+        return self.request("GET", "/workspaces")
+
+    def iter_workspaces(self, fields: Optional[Sequence[str]] = None) -> Iterator[JSON]:
+        return self.stream_list("/workspaces", fields)
+
+    def get_workspace(self, workspace_id: int) -> JSON:
+        return self.request("GET", f"/workspaces/{workspace_id}")
+
+    def create_workspace(self, spec: JSON) -> JSON:
+        return self.request("POST", "/workspaces", spec)
+
+    def update_workspace(self, workspace_id: int, changes: JSON) -> JSON:
+        return self.request("PATCH", f"/workspaces/{workspace_id}", changes)
+
+    def delete_workspace(self, workspace_id: int) -> None:
+        self.request("DELETE", f"/workspaces/{workspace_id}")
+
+    # Credential configurations
+
+    def list_credentials(self) -> List[JSON]:
+        return self.request("GET", "/credentials")
+
+    def get_credentials(self, credentials_id: str) -> JSON:
+        return self.request("GET", f"/credentials/{credentials_id}")
+
+    def create_credentials(self, credentials_name: str, role_arn: str) -> JSON:
+        return self.request("POST", "/credentials", {
+            "credentials_name": credentials_name,
+            "aws_credentials": {"sts_role": {"role_arn": role_arn}},
+        })
+
+    def delete_credentials(self, credentials_id: str) -> None:
+        self.request("DELETE", f"/credentials/{credentials_id}")
+
+    # Storage configurations
+
+    def list_storage_configurations(self) -> List[JSON]:
+        return self.request("GET", "/storage-configurations")
+
+    def get_storage_configuration(self, storage_configuration_id: str) -> JSON:
+        return self.request("GET", f"/storage-configurations/{storage_configuration_id}")
+
+    def create_storage_configuration(self, storage_configuration_name: str, bucket_name: str) -> JSON:
+        return self.request("POST", "/storage-configurations", {
+            "storage_configuration_name": storage_configuration_name,
+            "root_bucket_info": {"bucket_name": bucket_name},
+        })
+
+    def delete_storage_configuration(self, storage_configuration_id: str) -> None:
+        self.request("DELETE", f"/storage-configurations/{storage_configuration_id}")
+
+    # Network configurations
+
+    def list_networks(self) -> List[JSON]:
+        return self.request("GET", "/networks")
+
+    def get_network(self, network_id: str) -> JSON:
+        return self.request("GET", f"/networks/{network_id}")
+
+    def create_network(self, network_name: str, vpc_id: str, subnet_ids: List[str],
+                       security_group_ids: List[str]) -> JSON:
+        return self.request("POST", "/networks", {
+            "network_name": network_name,
+            "vpc_id": vpc_id,
+            "subnet_ids": list(subnet_ids),
+            "security_group_ids": list(security_group_ids),
+        })
+
+    def delete_network(self, network_id: str) -> None:
+        self.request("DELETE", f"/networks/{network_id}")
+
+    # Key configurations
+
+    def list_customer_managed_keys(self) -> List[JSON]:
+        return self.request("GET", "/customer-managed-keys")
+
+    def get_customer_managed_key(self, customer_managed_key_id: str) -> JSON:
+        return self.request("GET", f"/customer-managed-keys/{customer_managed_key_id}")
+
+    def create_customer_managed_key(self, key_arn: str, key_alias: str,
+                                    use_cases: Tuple[str, ...] = ("STORAGE", "MANAGED_SERVICES"),
+                                    reuse_key_for_cluster_volumes: bool = True) -> JSON:
+        return self.request("POST", "/customer-managed-keys", {
+            "use_cases": list(use_cases),
+            "aws_key_info": {
+                "key_arn": key_arn,
+                "key_alias": key_alias,
+                "reuse_key_for_cluster_volumes": reuse_key_for_cluster_volumes,
+            },
+        })
+
+    def delete_customer_managed_key(self, customer_managed_key_id: str) -> None:
+        self.request("DELETE", f"/customer-managed-keys/{customer_managed_key_id}")
+
+    # Unity Catalog metastores
+
+    def list_metastores(self) -> List[JSON]:
+        return (self.request("GET", "/metastores") or {}).get("metastores", [])
+
+    def create_metastore(self, name: str, region: str, storage_root: str) -> JSON:
+        return self.request("POST", "/metastores", {
+            "metastore_info": {"name": name, "region": region, "storage_root": storage_root},
+        })["metastore_info"]
+
+    def list_metastore_workspaces(self, metastore_id: str) -> List[int]:
+        return (self.request("GET", f"/metastores/{metastore_id}/workspaces") or {}).get("workspace_ids", [])
+
+    def assign_metastore(self, workspace_id: int, metastore_id: str) -> None:
+        self.request("POST", f"/workspaces/{workspace_id}/metastores/{metastore_id}", {
+            "metastore_assignment": {"metastore_id": metastore_id},
+        })
+
+    def unassign_metastore(self, workspace_id: int, metastore_id: str) -> None:
+        self.request("DELETE", f"/workspaces/{workspace_id}/metastores/{metastore_id}")
@@ -0,0 +1,242 @@
+"""
+Columnar export of the fleet inventory.
+
+``write_snapshot`` turns an ``Inventory`` into one typed table per resource
+type and writes it as Arrow IPC and/or Parquet under a root directory:
+
+    <root>/workspaces/2024-05-01.parquet
+    <root>/workspaces/2024-05-01.arrow
+    <root>/credentials/2024-05-01.parquet
+    ...
+
+Each day only adds files, so existing snapshots are never rewritten. An
+account whose listing of a resource type failed is not written as empty:
+it gets a single row with its ``listing_error`` set and every other column
+null, so readers can tell it apart from an account that has no objects.
+Object rows have a null ``listing_error``. Region,
+status, account and configuration id columns are dictionary-encoded: a year
+of daily snapshots repeats the same few hundred values millions of times.
+``load_snapshots`` reads a date range back as a single table.
+
+The two formats serve different readers. Arrow IPC files are memory-mapped
+on load, without copying or decoding, so a year of daily snapshots of 10,000
+workspaces loads in a few tens of milliseconds. Parquet files are about a
+tenth of the size and are what other analytics tools read, but each file has
+to be decoded.
+
+    python -m dbacademy_admin.export <ROOT> <ACCOUNT_ID> [<ACCOUNT_ID> ...]
+
+Requires ``pyarrow``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .client import DEFAULT_HOST, JSON, authorization_from_environment
+from .inventory import RESOURCES, Inventory, collect_inventory
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pq = None
+
+FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+
+def _path(*keys: str) -> Callable[[JSON], Any]:
+    def get(obj: JSON) -> Any:
+        for key in keys:
+            if not isinstance(obj, dict):
+                return None
+            obj = obj.get(key)
+        return obj
+
+    return get
+
+
+# Column kinds: "dict" (dictionary-encoded string), "string", "int", "timestamp", "list" (of dictionary strings).
+Column = Tuple[str, str, Callable[[JSON], Any]]
+
+COLUMNS: Dict[str, List[Column]] = {
+    "workspaces": [
+        ("workspace_id", "int", _path("workspace_id")),
+        ("workspace_name", "string", _path("workspace_name")),
+        ("deployment_name", "string", _path("deployment_name")),
+        ("aws_region", "dict", _path("aws_region")),
+        ("workspace_status", "dict", _path("workspace_status")),
+        ("pricing_tier", "dict", _path("pricing_tier")),
+        ("credentials_id", "dict", _path("credentials_id")),
+        ("storage_configuration_id", "dict", _path("storage_configuration_id")),
+        ("network_id", "dict", _path("network_id")),
+        ("managed_services_customer_managed_key_id", "dict", _path("managed_services_customer_managed_key_id")),
+        ("storage_customer_managed_key_id", "dict", _path("storage_customer_managed_key_id")),
+        ("creation_time", "timestamp", _path("creation_time")),
+    ],
+    "credentials": [
+        ("credentials_id", "dict", _path("credentials_id")),
+        ("credentials_name", "string", _path("credentials_name")),
+        ("role_arn", "string", _path("aws_credentials", "sts_role", "role_arn")),
+        ("external_id", "dict", _path("aws_credentials", "sts_role", "external_id")),
+        ("creation_time", "timestamp", _path("creation_time")),
+    ],
+    "storage_configurations": [
+        ("storage_configuration_id", "dict", _path("storage_configuration_id")),
+        ("storage_configuration_name", "string", _path("storage_configuration_name")),
+        ("bucket_name", "string", _path("root_bucket_info", "bucket_name")),
+        ("creation_time", "timestamp", _path("creation_time")),
+    ],
+    "networks": [
+        ("network_id", "dict", _path("network_id")),
+        ("network_name", "string", _path("network_name")),
+        ("vpc_id", "dict", _path("vpc_id")),
+        ("vpc_status", "dict", _path("vpc_status")),
+        ("subnet_ids", "list", _path("subnet_ids")),
+        ("security_group_ids", "list", _path("security_group_ids")),
+        ("creation_time", "timestamp", _path("creation_time")),
+    ],
+    "customer_managed_keys": [
+        ("customer_managed_key_id", "dict", _path("customer_managed_key_id")),
+        ("key_arn", "string", _path("aws_key_info", "key_arn")),
+        ("key_alias", "string", _path("aws_key_info", "key_alias")),
+        ("key_region", "dict", _path("aws_key_info", "key_region")),
+        ("use_cases", "list", _path("use_cases")),
+        ("creation_time", "timestamp", _path("creation_time")),
+    ],
+}
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("The columnar export needs pyarrow: pip install pyarrow")
+
+
+def _types() -> Dict[str, Any]:
+    return {
+        "dict": pa.dictionary(pa.int32(), pa.string()),
+        "string": pa.string(),
+        "int": pa.int64(),
+        "timestamp": pa.timestamp("ms", tz="UTC"),
+        "list": pa.list_(pa.dictionary(pa.int32(), pa.string())),
+    }
+
+
+def schema(resource: str) -> "pa.Schema":
+    _require_pyarrow()
+    types = _types()
+    return pa.schema([("snapshot_date", pa.date32()), ("account_id", types["dict"]), ("listing_error", pa.string())]
+                     + [(name, types[kind]) for name, kind, _ in COLUMNS[resource]])
+
+
+def _array(values: List[Any], kind: str) -> "pa.Array":
+    if kind == "dict":
+        return pa.array(values, pa.string()).dictionary_encode().cast(pa.dictionary(pa.int32(), pa.string()))
+    if kind == "list":
+        flat = pa.array([v for items in values for v in (items or [])], pa.string()).dictionary_encode()
+        offsets, position = [0], 0
+        for items in values:
+            position += len(items or [])
+            offsets.append(position)
+        items_type = pa.dictionary(pa.int32(), pa.string())
+        # A missing list stays null rather than becoming an empty one.
+        return pa.ListArray.from_arrays(pa.array(offsets, pa.int32()), flat.cast(items_type),
+                                        mask=pa.array([items is None for items in values], pa.bool_()))
+    return pa.array(values, _types()[kind])
+
+
+def to_table(objects: Sequence[JSON], resource: str, snapshot_date: datetime.date) -> "pa.Table":
+    """One resource type of a merged inventory (objects tagged with ``account_id``) as a table."""
+    _require_pyarrow()
+    columns = [pa.array([snapshot_date] * len(objects), pa.date32()),
+               _array([o.get("account_id") for o in objects], "dict"),
+               pa.array([o.get("listing_error") for o in objects], pa.string())]
+    for _, kind, get in COLUMNS[resource]:
+        columns.append(_array([get(o) for o in objects], kind))
+    return pa.Table.from_arrays(columns, schema=schema(resource))
+
+
+def _write(table: "pa.Table", path: str, fmt: str) -> None:
+    # Written aside and renamed, so a crash never leaves a half-written snapshot behind.
+    partial = path + ".partial"
+    if fmt == "parquet":
+        pq.write_table(table, partial, compression="zstd")
+    else:
+        with pa.OSFile(partial, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(partial, path)
+
+
+def write_snapshot(inventory: Inventory, root: str, snapshot_date: Optional[datetime.date] = None,
+                   formats: Sequence[str] = tuple(FORMATS)) -> List[str]:
+    """Write one day's snapshot of every resource type; returns the files written.
+
+    Writing the same day again replaces that day's files only. Accounts
+    whose listing of a resource type failed get one row marking the error.
+    """
+    _require_pyarrow()
+    snapshot_date = snapshot_date or datetime.date.today()
+    written = []
+    for resource in RESOURCES:
+        failed = [{"account_id": account_id, "listing_error": account.errors[resource]}
+                  for account_id, account in inventory.accounts.items() if resource in account.errors]
+        table = to_table(inventory.merged(resource) + failed, resource, snapshot_date)
+        directory = os.path.join(root, resource)
+        os.makedirs(directory, exist_ok=True)
+        for fmt in formats:
+            path = os.path.join(directory, snapshot_date.isoformat() + FORMATS[fmt])
+            _write(table, path, fmt)
+            written.append(path)
+    return written
+
+
+def snapshot_dates(root: str, resource: str, fmt: str = "arrow") -> List[datetime.date]:
+    directory = os.path.join(root, resource)
+    if not os.path.isdir(directory):
+        return []
+    suffix = FORMATS[fmt]
+    return sorted(datetime.date.fromisoformat(name[:-len(suffix)])
+                  for name in os.listdir(directory) if name.endswith(suffix))
+
+
+def load_snapshots(root: str, resource: str, start: Optional[datetime.date] = None,
+                   end: Optional[datetime.date] = None, fmt: str = "arrow",
+                   columns: Optional[Sequence[str]] = None) -> "pa.Table":
+    """Snapshots of one resource type between ``start`` and ``end`` (inclusive) as one table."""
+    _require_pyarrow()
+    tables = []
+    for day in snapshot_dates(root, resource, fmt):
+        if (start is not None and day < start) or (end is not None and day > end):
+            continue
+        path = os.path.join(root, resource, day.isoformat() + FORMATS[fmt])
+        if fmt == "arrow":
+            table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+            tables.append(table.select(list(columns)) if columns else table)
+        else:
+            tables.append(pq.read_table(path, columns=list(columns) if columns else None))
+    if not tables:
+        target = schema(resource)
+        return target.empty_table().select(list(columns)) if columns else target.empty_table()
+    return pa.concat_tables(tables)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Write today's inventory snapshot as Arrow IPC and/or Parquet.")
+    parser.add_argument("root", help="directory holding the snapshots")
+    parser.add_argument("account_ids", nargs="+", metavar="ACCOUNT_ID")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--format", choices=["arrow", "parquet", "both"], default="both")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, help="snapshot date (default: today)")
+    args = parser.parse_args(argv)
+
+    inventory = collect_inventory(args.account_ids, authorization_from_environment(), host=args.host)
+    formats = list(FORMATS) if args.format == "both" else [args.format]
+    for path in write_snapshot(inventory, args.root, args.date, formats):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
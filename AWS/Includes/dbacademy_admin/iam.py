@@ -0,0 +1,334 @@
+"""
+Bulk IAM role creation, pipelined around IAM's propagation delay.
+
+The labs build three kinds of role by hand: the cross-account role with the
+EC2 inline policy, its reduced variant for customer-managed VPCs, and the
+Unity Catalog metastore role with its custom trust policy. ``RoleFactory``
+creates them from ``RoleSpec`` in batches: each role with its trust policy,
+then its permissions policy inline. The labs attach the metastore
+permissions as a separate managed policy; inline, the role is complete after
+two calls and there is nothing left to detach when it is deleted.
+
+IAM is eventually consistent: a role is not accepted by Databricks (or
+anything else) until it has propagated, which usually takes a few seconds.
+Rather than sleeping, every role is probed until it is ready, with
+exponentially growing delays. Probes are scheduled by due time rather than
+run by threads that sleep, so while one batch propagates the next batch is
+already being created.
+
+    python -m dbacademy_admin.iam <DATABRICKS_ACCOUNT_ID> dbacademy-a dbacademy-b --kind cross_account
+
+Works against a local stand-in such as moto with ``--endpoint-url``.
+
+Requires ``boto3``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import itertools
+import json
+import time
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .client import JSON
+from .policies import TEMPLATES, canonical
+from .retry import CallStats, RetryPolicy, TokenBucket, call_with_retry
+from .s3 import error_code
+
+try:
+    import boto3
+    from botocore.config import Config
+except ImportError:  # pragma: no cover - optional dependency
+    boto3 = Config = None
+
+# Role kind -> (trust policy template, permissions policy template).
+KINDS = {
+    "cross_account": ("cross_account_trust", "cross_account"),
+    "cross_account_novpc": ("cross_account_trust", "cross_account_novpc"),
+    "metastore": ("metastore_trust", "metastore"),
+}
+
+POLICY_NAME = "dbacademy-permissions"
+
+RETRYABLE_CODES = {"Throttling", "ThrottlingException", "ServiceFailure", "ConcurrentModification", "NoSuchEntity"}
+
+
+def _require_boto3() -> None:
+    if boto3 is None:
+        raise ImportError("Role creation needs boto3: pip install boto3")
+
+
+def is_retryable(error: Exception) -> bool:
+    return error_code(error) in RETRYABLE_CODES
+
+
+class NotReady(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class RoleSpec:
+    role_name: str
+    kind: str = "cross_account"
+    bucket_name: Optional[str] = None
+
+    def __post_init__(self):
+        if self.kind not in KINDS:
+            raise ValueError(f"Unknown role kind {self.kind!r}; expected one of {', '.join(KINDS)}")
+        if self.kind == "metastore" and not self.bucket_name:
+            raise ValueError(f"Metastore role {self.role_name} needs a bucket_name")
+
+    def trust_policy(self, databricks_account_id: str) -> str:
+        return TEMPLATES[KINDS[self.kind][0]].render({"DATABRICKS_ACCOUNT_ID": databricks_account_id})
+
+    def permissions_policy(self, aws_account_id: str) -> str:
+        return TEMPLATES[KINDS[self.kind][1]].render({"BUCKET": self.bucket_name or "",
+                                                      "AWS_ACCOUNT_ID": aws_account_id,
+                                                      "AWS_IAM_ROLE_NAME": self.role_name})
+
+
+def _document(value: Any) -> Optional[str]:
+    """A policy document as returned by IAM (URL-encoded text or already decoded) in canonical form."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(urllib.parse.unquote(value))
+    return canonical(value)
+
+
+def _account_of(role_arn: str) -> str:
+    return role_arn.split(":")[4]
+
+
+def iam_probe(iam: Any, spec: RoleSpec, policy: str) -> bool:
+    """Ready once IAM reads back the role and its permissions policy as written."""
+    try:
+        iam.get_role(RoleName=spec.role_name)
+        document = iam.get_role_policy(RoleName=spec.role_name, PolicyName=POLICY_NAME)["PolicyDocument"]
+    except Exception as e:
+        if error_code(e) == "NoSuchEntity":
+            return False
+        raise
+    return _document(document) == policy
+
+
+Probe = Callable[[Any, RoleSpec, str], bool]
+
+
+@dataclass
+class RoleResult:
+    spec: RoleSpec
+    role_arn: Optional[str] = None
+    created: bool = False
+    probes: int = 0
+    # Seconds from the end of creation until the role was ready.
+    propagation: float = 0.0
+    error: Optional[Exception] = None
+
+
+@dataclass
+class RoleBatch:
+    results: List[RoleResult] = field(default_factory=list)
+    retries: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def failed(self) -> List[RoleResult]:
+        return [r for r in self.results if r.error is not None]
+
+    @property
+    def per_minute(self) -> float:
+        done = len(self.results) - len(self.failed)
+        return 60.0 * done / self.elapsed if self.elapsed else 0.0
+
+
+class RoleFactory:
+    """Creates roles in batches and waits for them to propagate, overlapping the two.
+
+    ``readiness`` sets the probe backoff: its ``base`` and ``cap`` bound the
+    delays and ``max_attempts`` how long a role may take. ``probe`` decides
+    whether a role is ready; the default reads it back from IAM.
+    """
+
+    def __init__(self, databricks_account_id: str, iam: Any = None, max_workers: int = 8,
+                 limiter: Optional[TokenBucket] = None, retry: Optional[RetryPolicy] = None,
+                 readiness: Optional[RetryPolicy] = None, probe: Probe = iam_probe,
+                 sleep: Callable[[float], None] = time.sleep, clock: Callable[[], float] = time.monotonic):
+        if iam is None:
+            _require_boto3()
+            iam = boto3.client("iam", config=Config(max_pool_connections=2 * max_workers,
+                                                    retries={"mode": "standard"}))
+        self.databricks_account_id = databricks_account_id
+        self.iam = iam
+        self.max_workers = max_workers
+        self.limiter = limiter
+        self.retry = retry or RetryPolicy(retryable=is_retryable)
+        self.readiness = readiness or RetryPolicy(max_attempts=12, base=0.25, cap=8.0,
+                                                  retryable=lambda e: isinstance(e, NotReady))
+        self.probe = probe
+        self.stats = CallStats()
+        self._sleep = sleep
+        self._clock = clock
+
+    def _call(self, call: Callable[[], Any]) -> Any:
+        return call_with_retry(call, self.retry, self.limiter, self.stats, self._sleep)
+
+    def create(self, spec: RoleSpec) -> RoleResult:
+        """Create one role with its trust and permissions policies; an existing role is brought up to date."""
+        result = RoleResult(spec)
+        trust = spec.trust_policy(self.databricks_account_id)
+        try:
+            role = self._call(lambda: self.iam.create_role(RoleName=spec.role_name, AssumeRolePolicyDocument=trust,
+                                                           Tags=[{"Key": "Name", "Value": spec.role_name}]))["Role"]
+            result.created = True
+        except Exception as e:
+            if error_code(e) != "EntityAlreadyExists":
+                raise
+            role = self._call(lambda: self.iam.get_role(RoleName=spec.role_name))["Role"]
+            if _document(role.get("AssumeRolePolicyDocument")) != trust:
+                self._call(lambda: self.iam.update_assume_role_policy(RoleName=spec.role_name, PolicyDocument=trust))
+        result.role_arn = role["Arn"]
+        policy = spec.permissions_policy(_account_of(role["Arn"]))
+        self._call(lambda: self.iam.put_role_policy(RoleName=spec.role_name, PolicyName=POLICY_NAME,
+                                                    PolicyDocument=policy))
+        return result
+
+    def _probe(self, result: RoleResult) -> bool:
+        result.probes += 1
+        return self.probe(self.iam, result.spec, result.spec.permissions_policy(_account_of(result.role_arn)))
+
+    def wait_ready(self, result: RoleResult) -> RoleResult:
+        """Probe with exponential backoff until the role is ready; records how long that took."""
+        start = self._clock()
+
+        def probe() -> None:
+            if not self._probe(result):
+                raise NotReady(result.spec.role_name)
+
+        call_with_retry(probe, self.readiness, sleep=self._sleep)
+        result.propagation = self._clock() - start
+        return result
+
+    def create_all(self, specs: Iterable[RoleSpec], batch_size: int = 20, pipeline: bool = True) -> RoleBatch:
+        """Create roles ``batch_size`` at a time, returning once every role is ready or has failed.
+
+        A batch is started once the previous one has been created; with
+        ``pipeline=False``, only once it is ready as well. Probes are
+        scheduled on a heap by due time and run on the same workers as the
+        creates, so a propagating role occupies no thread between probes.
+        """
+        specs = list(specs)
+        batches = [specs[i:i + batch_size] for i in range(0, len(specs), batch_size)]
+        batch = RoleBatch()
+        start = self._clock()
+        due: List[Tuple[float, int, RoleResult]] = []
+        sequence = itertools.count()
+        attempts: Dict[int, int] = {}
+        created_at: Dict[int, float] = {}
+        running: Dict[Future, Tuple[str, RoleResult]] = {}
+        next_batch = 0
+        unfinished = 0
+
+        def finish(result: RoleResult, error: Optional[Exception] = None) -> None:
+            nonlocal unfinished
+            result.error = error
+            batch.results.append(result)
+            unfinished -= 1
+
+        def schedule(result: RoleResult, at: float) -> None:
+            heapq.heappush(due, (at, next(sequence), result))
+
+        with ThreadPoolExecutor(self.max_workers, "dbacademy-iam") as executor:
+            while True:
+                creating = any(kind == "create" for kind, _ in running.values())
+                if next_batch < len(batches) and not creating and (pipeline or unfinished == 0):
+                    for spec in batches[next_batch]:
+                        running[executor.submit(self.create, spec)] = ("create", RoleResult(spec))
+                    unfinished += len(batches[next_batch])
+                    next_batch += 1
+                now = self._clock()
+                while due and due[0][0] <= now:
+                    result = heapq.heappop(due)[2]
+                    running[executor.submit(self._probe, result)] = ("probe", result)
+                if not running and not due:
+                    if next_batch == len(batches):
+                        break
+                    continue
+                timeout = max(0.0, due[0][0] - now) if due else None
+                if not running:
+                    self._sleep(timeout)
+                    continue
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, result = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        finish(result, error)
+                    elif kind == "create":
+                        result = future.result()
+                        created_at[id(result)] = self._clock()
+                        schedule(result, created_at[id(result)])
+                    elif future.result():
+                        result.propagation = self._clock() - created_at[id(result)]
+                        finish(result)
+                    else:
+                        attempt = attempts[id(result)] = attempts.get(id(result), 0) + 1
+                        if attempt >= self.readiness.max_attempts:
+                            finish(result, NotReady(result.spec.role_name))
+                        else:
+                            schedule(result, self._clock() + self.readiness.delay(attempt - 1))
+        order = {spec.role_name: i for i, spec in enumerate(specs)}
+        batch.results.sort(key=lambda r: order[r.spec.role_name])
+        batch.elapsed = self._clock() - start
+        batch.retries = self.stats.retries
+        return batch
+
+
+def role_handlers(factory: RoleFactory) -> Dict[str, Callable[[JSON], JSON]]:
+    """Provisioner handler for the ``iam_role`` kind of ``workspace_resources``; returns once the role is ready."""
+
+    def role(p: JSON) -> JSON:
+        spec = RoleSpec(p["role_name"], p.get("role_kind", "cross_account"), p.get("bucket_name"))
+        result = factory.wait_ready(factory.create(spec))
+        return {"role_arn": result.role_arn}
+
+    return {"iam_role": role}
+
+
+def lab_roles(prefixes: Sequence[str], kind: str = "cross_account") -> List[RoleSpec]:
+    """Roles named as in the labs: ``<prefix>-cross-account-role`` or ``<prefix>-metastore-role``."""
+    if kind == "metastore":
+        return [RoleSpec(f"{p}-metastore-role", kind, f"{p}-metastore-bucket") for p in prefixes]
+    return [RoleSpec(f"{p}-cross-account-role", kind) for p in prefixes]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Create the labs' IAM roles in pipelined batches.")
+    parser.add_argument("databricks_account_id", metavar="DATABRICKS_ACCOUNT_ID")
+    parser.add_argument("prefixes", nargs="+", metavar="PREFIX")
+    parser.add_argument("--kind", choices=list(KINDS), default="cross_account")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--endpoint-url", help="IAM endpoint, e.g. a local moto server")
+    args = parser.parse_args(argv)
+
+    _require_boto3()
+    iam = boto3.client("iam", endpoint_url=args.endpoint_url,
+                       config=Config(max_pool_connections=2 * args.workers, retries={"mode": "standard"}))
+    factory = RoleFactory(args.databricks_account_id, iam, max_workers=args.workers)
+    batch = factory.create_all(lab_roles(args.prefixes, args.kind), args.batch_size)
+    for result in batch.results:
+        status = "failed: " + str(result.error) if result.error else (
+            f"ready after {result.propagation:.1f}s, {result.probes} probes")
+        print(f"{result.spec.role_name:<50} {status}")
+    print(f"{len(batch.results) - len(batch.failed)}/{len(batch.results)} roles in {batch.elapsed:.2f}s "
+          f"({batch.per_minute:.0f} roles/min), {batch.retries} retries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Offline evaluation of IAM policies.
+
+``PolicySimulator`` answers "is this action on this resource allowed?" for the
+policies of the labs, such as the cross-account roles and the metastore role,
+without calling AWS. Statements are indexed by service prefix: exact action
+names go into a dictionary and wildcard patterns such as ``kms:ReEncrypt*``
+into a character trie, so finding the statements that apply to an action does
+not depend on how many statements there are. ``Condition`` blocks are
+evaluated against a request context, e.g. ``{"sts:ExternalId": "..."}``.
+Explicit denies win over allows; anything not allowed is implicitly denied.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+Context = Mapping[str, Any]
+
+
+def _as_list(value: Any) -> List[Any]:
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _glob(pattern: str, ignore_case: bool = False) -> "re.Pattern[str]":
+    regex = "".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern)
+    return re.compile(regex, re.IGNORECASE | re.DOTALL if ignore_case else re.DOTALL)
+
+
+class _Trie:
+    """Character trie over lower-case action patterns that may contain ``*`` and ``?``."""
+
+    def __init__(self):
+        self.children: Dict[str, "_Trie"] = {}
+        self.statements: List[int] = []
+
+    def insert(self, pattern: str, statement: int) -> None:
+        node = self
+        for char in pattern:
+            node = node.children.setdefault(char, _Trie())
+        node.statements.append(statement)
+
+    def match(self, text: str) -> List[int]:
+        found: List[int] = []
+        seen = set()
+
+        def walk(node: "_Trie", i: int) -> None:
+            if (id(node), i) in seen:
+                return
+            seen.add((id(node), i))
+            star = node.children.get("*")
+            if star is not None:
+                for j in range(i, len(text) + 1):
+                    walk(star, j)
+            if i == len(text):
+                found.extend(node.statements)
+                return
+            for key in (text[i], "?"):
+                child = node.children.get(key)
+                if child is not None:
+                    walk(child, i + 1)
+
+        walk(self, 0)
+        return found
+
+
+class _ActionIndex:
+    """Statements by service prefix, then by exact action name or wildcard pattern."""
+
+    def __init__(self):
+        self.exact: Dict[Tuple[str, str], List[int]] = {}
+        self.wildcards: Dict[str, _Trie] = {}
+
+    def add(self, action: str, statement: int) -> None:
+        action = action.lower()
+        service, _, name = action.partition(":") if action != "*" else ("*", "", "*")
+        if "*" in service or "?" in service:
+            self.wildcards.setdefault("*", _Trie()).insert(action, statement)
+        elif "*" in name or "?" in name:
+            self.wildcards.setdefault(service, _Trie()).insert(name, statement)
+        else:
+            self.exact.setdefault((service, name), []).append(statement)
+
+    def lookup(self, action: str) -> List[int]:
+        action = action.lower()
+        service, _, name = action.partition(":")
+        found = list(self.exact.get((service, name), ()))
+        trie = self.wildcards.get(service)
+        if trie is not None:
+            found.extend(trie.match(name))
+        trie = self.wildcards.get("*")
+        if trie is not None:
+            found.extend(trie.match(action))
+        return found
+
+
+def _string_equals(value: str, expected: str) -> bool:
+    return value == expected
+
+
+def _string_equals_ignore_case(value: str, expected: str) -> bool:
+    return value.lower() == expected.lower()
+
+
+def _string_like(value: str, expected: str) -> bool:
+    return _glob(expected).fullmatch(value) is not None
+
+
+def _bool(value: Any, expected: Any) -> bool:
+    return str(value).lower() == str(expected).lower()
+
+
+# Condition operator -> (comparison, negated).
+_OPERATORS: Dict[str, Tuple[Callable[[Any, Any], bool], bool]] = {
+    "StringEquals": (_string_equals, False),
+    "StringNotEquals": (_string_equals, True),
+    "StringEqualsIgnoreCase": (_string_equals_ignore_case, False),
+    "StringNotEqualsIgnoreCase": (_string_equals_ignore_case, True),
+    "StringLike": (_string_like, False),
+    "StringNotLike": (_string_like, True),
+    "ArnEquals": (_string_equals, False),
+    "ArnNotEquals": (_string_equals, True),
+    "ArnLike": (_string_like, False),
+    "ArnNotLike": (_string_like, True),
+    "Bool": (_bool, False),
+}
+
+
+def _condition_holds(operator: str, key: str, expected: Any, context: Dict[str, List[Any]]) -> bool:
+    qualifier, _, operator = operator.rpartition(":")
+    if_exists = operator.endswith("IfExists")
+    operator = operator[:-len("IfExists")] if if_exists else operator
+    values = context.get(key.lower())
+    if operator == "Null":
+        return (values is None) == _bool(_as_list(expected)[0], True)
+    if operator not in _OPERATORS:
+        raise ValueError(f"Unsupported condition operator: {operator}")
+    compare, negated = _OPERATORS[operator]
+    expected = _as_list(expected)
+    # AWS evaluates ForAllValues over a missing or empty key as vacuously true,
+    # and ForAnyValue as false whatever the operator, unless IfExists covers a missing key.
+    if qualifier == "ForAllValues" and not values:
+        return True
+    if qualifier == "ForAnyValue" and not values:
+        return values is None and if_exists
+    if values is None:
+        return if_exists or negated
+
+    def matches(value) -> bool:
+        hit = any(compare(value, e) for e in expected)
+        return not hit if negated else hit
+
+    if qualifier == "ForAllValues":
+        return all(matches(v) for v in values)
+    return any(matches(v) for v in values)
+
+
+@dataclass
+class _Statement:
+    sid: str
+    effect: str
+    resources: List["re.Pattern[str]"]
+    not_resources: List["re.Pattern[str]"]
+    principals: Optional[List["re.Pattern[str]"]]
+    conditions: List[Tuple[str, str, Any]] = field(default_factory=list)
+
+    def applies(self, resource: str, principal: Optional[str], context: Dict[str, List[Any]]) -> bool:
+        if self.not_resources:
+            if any(p.fullmatch(resource) for p in self.not_resources):
+                return False
+        elif not any(p.fullmatch(resource) for p in self.resources):
+            return False
+        if principal is not None and self.principals is not None:
+            if not any(p.fullmatch(principal) for p in self.principals):
+                return False
+        return all(_condition_holds(op, key, expected, context) for op, key, expected in self.conditions)
+
+
+def _principal_patterns(principal: Any) -> Optional[List["re.Pattern[str]"]]:
+    if principal is None:
+        return None
+    if principal == "*":
+        return [_glob("*")]
+    patterns = []
+    for value in _as_list(principal.get("AWS", [])) + _as_list(principal.get("Service", [])):
+        # An account root principal stands for every principal in that account.
+        if value.endswith(":root"):
+            value = value[:-len("root")] + "*"
+        patterns.append(_glob(value))
+    return patterns
+
+
+@dataclass(frozen=True)
+class Decision:
+    action: str
+    resource: str
+    allowed: bool
+    reason: str
+    statements: Tuple[str, ...] = ()
+
+
+class PolicySimulator:
+    """Evaluate (action, resource, context) requests against a set of policy documents."""
+
+    def __init__(self, documents: Iterable[Mapping[str, Any]] = ()):
+        self._statements: List[_Statement] = []
+        self._allow = _ActionIndex()
+        self._deny = _ActionIndex()
+        # Statements using NotAction cannot be indexed by action; they are checked on every request.
+        self._not_action: List[Tuple[int, List["re.Pattern[str]"]]] = []
+        self._candidates: Dict[str, Tuple[List[int], List[int]]] = {}
+        for document in documents:
+            self.add_policy(document)
+
+    def add_policy(self, document: Mapping[str, Any]) -> None:
+        for raw in _as_list(document.get("Statement", [])):
+            index = len(self._statements)
+            conditions = [(op, key, expected)
+                          for op, block in (raw.get("Condition") or {}).items()
+                          for key, expected in block.items()]
+            self._statements.append(_Statement(
+                sid=raw.get("Sid", f"#{index}"),
+                effect=raw["Effect"],
+                resources=[_glob(r) for r in _as_list(raw.get("Resource", "*"))],
+                not_resources=[_glob(r) for r in _as_list(raw.get("NotResource", []))],
+                principals=_principal_patterns(raw.get("Principal")),
+                conditions=conditions,
+            ))
+            if "NotAction" in raw:
+                self._not_action.append((index, [_glob(a, True) for a in _as_list(raw["NotAction"])]))
+                continue
+            target = self._allow if raw["Effect"] == "Allow" else self._deny
+            for action in _as_list(raw.get("Action", [])):
+                target.add(action, index)
+        self._candidates.clear()
+
+    def _lookup(self, action: str) -> Tuple[List[int], List[int]]:
+        key = action.lower()
+        candidates = self._candidates.get(key)
+        if candidates is None:
+            allow, deny = self._allow.lookup(key), self._deny.lookup(key)
+            for index, patterns in self._not_action:
+                if not any(p.fullmatch(key) for p in patterns):
+                    (allow if self._statements[index].effect == "Allow" else deny).append(index)
+            candidates = self._candidates[key] = (allow, deny)
+        return candidates
+
+    def evaluate(self, action: str, resource: str = "*", context: Optional[Context] = None,
+                 principal: Optional[str] = None) -> Decision:
+        """Decide one request. ``principal`` is only checked against statements that name one."""
+        ctx = {k.lower(): _as_list(v) for k, v in (context or {}).items()}
+        allow, deny = self._lookup(action)
+        denied = [self._statements[i].sid for i in deny if self._statements[i].applies(resource, principal, ctx)]
+        if denied:
+            return Decision(action, resource, False, "explicit deny", tuple(denied))
+        allowed = [self._statements[i].sid for i in allow if self._statements[i].applies(resource, principal, ctx)]
+        if allowed:
+            return Decision(action, resource, True, "allowed", tuple(allowed))
+        return Decision(action, resource, False, "implicit deny")
+
+    def is_allowed(self, action: str, resource: str = "*", context: Optional[Context] = None,
+                   principal: Optional[str] = None) -> bool:
+        return self.evaluate(action, resource, context, principal).allowed
+
+    def denied(self, requests: Iterable[Sequence[Any]]) -> List[Decision]:
+        """Decisions for the requests, given as ``(action, resource[, context])``, that are not allowed."""
+        result = []
+        for request in requests:
+            decision = self.evaluate(*request)
+            if not decision.allowed:
+                result.append(decision)
+        return result
@@ -0,0 +1,139 @@
+"""
+Concurrent inventory of workspaces and cloud resources across many accounts.
+
+Every (account, resource type) listing is an independent call, so they are
+all issued at once under a shared concurrency limit and the total latency is
+close to that of the slowest account rather than the sum over all accounts.
+
+    python -m dbacademy_admin.inventory <ACCOUNT_ID> [<ACCOUNT_ID> ...]
+
+reads the ``Authorization`` header from ``DBACADEMY_API_AUTHENTICATION`` and
+prints the merged inventory as JSON.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from .client import DEFAULT_HOST, JSON, AccountApiError, AccountClient, authorization_from_environment
+
+# Inventory attribute -> AccountClient method listing it.
+RESOURCES = {
+    "workspaces": "list_workspaces",
+    "credentials": "list_credentials",
+    "storage_configurations": "list_storage_configurations",
+    "networks": "list_networks",
+    "customer_managed_keys": "list_customer_managed_keys",
+}
+
+
+@dataclass
+class AccountInventory:
+    account_id: str
+    workspaces: List[JSON] = field(default_factory=list)
+    credentials: List[JSON] = field(default_factory=list)
+    storage_configurations: List[JSON] = field(default_factory=list)
+    networks: List[JSON] = field(default_factory=list)
+    customer_managed_keys: List[JSON] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Inventory:
+    accounts: Dict[str, AccountInventory] = field(default_factory=dict)
+
+    def merged(self, resource: str) -> List[JSON]:
+        """All objects of one resource type across accounts, tagged with ``account_id``."""
+        return [dict(obj, account_id=account.account_id)
+                for account in self.accounts.values()
+                for obj in getattr(account, resource)]
+
+    def to_json(self) -> JSON:
+        result: JSON = {resource: self.merged(resource) for resource in RESOURCES}
+        result["errors"] = {account_id: account.errors
+                            for account_id, account in self.accounts.items() if account.errors}
+        return result
+
+
+async def fetch_inventory(account_ids: Iterable[str], authorization: str, host: str = DEFAULT_HOST,
+                          scheme: str = "https", max_concurrency: int = 16) -> Inventory:
+    """List every resource type of every account with at most ``max_concurrency`` calls in flight.
+
+    A failing call, whether an API error or a connection reset, timeout or
+    DNS failure, is recorded in ``AccountInventory.errors`` instead of
+    aborting the whole inventory.
+    """
+    loop = asyncio.get_running_loop()
+    inventory = Inventory({account_id: AccountInventory(account_id) for account_id in account_ids})
+    limit = asyncio.Semaphore(max_concurrency)
+
+    async def fetch(executor, client: AccountClient, account: AccountInventory, resource: str):
+        async with limit:
+            try:
+                objects = await loop.run_in_executor(executor, getattr(client, RESOURCES[resource]))
+            except AccountApiError as e:
+                account.errors[resource] = str(e)
+            except OSError as e:
+                account.errors[resource] = f"{type(e).__name__}: {e}"
+            else:
+                setattr(account, resource, objects or [])
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        tasks = []
+        for account in inventory.accounts.values():
+            client = AccountClient.for_account(account.account_id, authorization, host, scheme)
+            tasks.extend(fetch(executor, client, account, resource) for resource in RESOURCES)
+        await asyncio.gather(*tasks)
+    return inventory
+
+
+def collect_inventory(account_ids: Iterable[str], authorization: str, **kwargs) -> Inventory:
+    """Blocking wrapper around ``fetch_inventory``.
+
+    Notebook kernels may already be running an event loop, in which case the
+    inventory is collected on a helper thread with its own loop.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(fetch_inventory(account_ids, authorization, **kwargs))
+
+    result: List[Inventory] = []
+    errors: List[BaseException] = []
+
+    def run():
+        try:
+            result.append(asyncio.run(fetch_inventory(account_ids, authorization, **kwargs)))
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if errors:
+        raise errors[0]
+    return result[0]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Inventory workspaces and cloud resources across accounts.")
+    parser.add_argument("account_ids", nargs="+", metavar="ACCOUNT_ID")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    inventory = collect_inventory(args.account_ids, authorization_from_environment(), host=args.host,
+                                  max_concurrency=args.max_concurrency)
+    json.dump(inventory.to_json(), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
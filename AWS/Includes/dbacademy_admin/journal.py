@@ -0,0 +1,257 @@
+"""
+Crash-safe journal of provisioning calls.
+
+A bulk run that dies between ``POST /customer-managed-keys`` and the
+``POST /workspaces`` using its id loses that id, and running it again creates
+a second key configuration. ``Journal`` is an append-only JSONL file in which
+every call is recorded as an ``intent``, with its payload, before it is made
+and as a ``result``, with the response, after it. Opening an existing journal
+replays it, so a resumed run gets the results of completed steps back without
+calling the API.
+
+The Account API takes no idempotency token, so ``create_once`` makes creates
+idempotent on the client: each step has a key, a completed key is never
+created again, and whenever the outcome of an earlier attempt is unknown (an
+intent without a result, or a retry after a timeout or 5xx) it first looks
+for an object with the step's natural name and adopts it. Updates, deletes
+and metastore detachments can be repeated safely, so ``call_once`` only skips
+them once completed. ``reconcile.apply`` and ``provisioner.account_handlers``
+journal all their calls when given a journal.
+
+Records are made durable with group commit: one writer thread fsyncs
+everything appended since its previous fsync in a single batch, so
+concurrent workers share fsyncs instead of paying for one each.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, Set
+
+from .client import JSON, AccountClient
+from .reconcile import SECTIONS, identity, spec_hash
+from .retry import RetryPolicy, TokenBucket, call_with_retry
+
+# Account API collection -> desired-state section, for looking objects up by name.
+_SECTION_OF = {collection: section for section, collection in SECTIONS.items()}
+
+
+class Journal:
+    """Append-only, fsync-batched JSONL journal of intents and results."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.results: Dict[str, Any] = {}
+        # Keys with an intent but no result: the call may or may not have happened.
+        self.pending: Set[str] = set()
+        self.syncs = 0
+        self._seq = 0
+        self._durable = 0
+        self._buffer: List[str] = []
+        self._closed = False
+        # Set when the writer thread fails; appends raise it instead of waiting forever.
+        self._failure: Optional[BaseException] = None
+        self._replay()
+        self._file = open(path, "a", encoding="utf-8")
+        self._cond = threading.Condition()
+        self._writer = threading.Thread(target=self._write_loop, name="dbacademy-journal", daemon=True)
+        self._writer.start()
+
+    def _replay(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        good = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                good += len(line)
+                key = entry["key"]
+                if entry["type"] == "intent":
+                    self.pending.add(key)
+                elif entry["type"] == "result":
+                    self.pending.discard(key)
+                    self.results[key] = entry["data"]
+        # A crash can leave half a line at the end; drop it so appends start clean.
+        if good != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer and self._closed:
+                    return
+                batch, self._buffer = self._buffer, []
+                seq = self._seq
+            try:
+                self._file.write("".join(batch))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except Exception as e:
+                with self._cond:
+                    self._failure = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self.syncs += 1
+                self._durable = seq
+                self._cond.notify_all()
+
+    def append(self, kind: str, key: str, data: Any = None, durable: bool = True) -> None:
+        """Append one entry; with ``durable``, return only once it has been fsynced.
+
+        Raises the writer's error if writing to the journal has failed.
+        """
+        line = json.dumps({"type": kind, "key": key, "time": time.time(), "data": data},
+                          separators=(",", ":")) + "\n"
+        with self._cond:
+            if self._closed:
+                raise ValueError("Journal is closed")
+            if self._failure is not None:
+                raise self._failure
+            self._buffer.append(line)
+            self._seq += 1
+            seq = self._seq
+            self._cond.notify_all()
+            if kind == "intent":
+                self.pending.add(key)
+            elif kind == "result":
+                self.pending.discard(key)
+                self.results[key] = data
+            while durable and self._durable < seq:
+                if self._failure is not None:
+                    raise self._failure
+                self._cond.wait()
+
+    def intent(self, key: str, payload: Any = None) -> None:
+        self.append("intent", key, payload)
+
+    def result(self, key: str, data: Any) -> None:
+        self.append("result", key, data)
+
+    def error(self, key: str, error: Exception) -> None:
+        """Record a failed call, if the journal can still be written.
+
+        Callers raise ``error`` next, so a failing journal must not replace it;
+        the journal's own failure surfaces on the next intent or result.
+        """
+        try:
+            self.append("error", key, f"{type(error).__name__}: {error}", durable=False)
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        self._file.close()
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def find_by_name(client: AccountClient, collection: str, name: str) -> Optional[JSON]:
+    """The object of a collection whose natural name (key ARN for key configurations) is ``name``.
+
+    The list is always read from the API: a cached one can predate the
+    object an interrupted attempt created.
+    """
+    section = _SECTION_OF[collection]
+    for obj in client.stream_list(f"/{collection}"):
+        if identity(section, obj) == name:
+            return obj
+    return None
+
+
+def create_once(journal: Journal, key: str, create: Callable[[], JSON], find: Callable[[], Optional[JSON]],
+                retry: Optional[RetryPolicy] = None, limiter: Optional[TokenBucket] = None,
+                payload: Any = None) -> JSON:
+    """Run ``create`` at most once for ``key`` across retries and resumed runs.
+
+    ``find`` returns the object ``create`` would have made if it exists
+    already. ``payload`` is recorded with the intent.
+    """
+    if key in journal.results:
+        return journal.results[key]
+    uncertain = key in journal.pending
+
+    def attempt() -> JSON:
+        nonlocal uncertain
+        if uncertain:
+            existing = find()
+            if existing is not None:
+                return existing
+        uncertain = True
+        return create()
+
+    journal.intent(key, payload)
+    try:
+        result = call_with_retry(attempt, retry, limiter)
+    except Exception as e:
+        journal.error(key, e)
+        raise
+    journal.result(key, result)
+    return result
+
+
+def create_object(client: AccountClient, journal: Journal, collection: str, payload: JSON,
+                  retry: Optional[RetryPolicy] = None, limiter: Optional[TokenBucket] = None) -> JSON:
+    """Idempotent ``POST /<collection>``, keyed by the payload's natural name."""
+    name = identity(_SECTION_OF[collection], payload)
+    return create_once(journal, f"{collection}/{name}", lambda: client.request("POST", f"/{collection}", payload),
+                       lambda: find_by_name(client, collection, name), retry, limiter, payload)
+
+
+def call_once(journal: Journal, key: str, call: Callable[[], Any], payload: Any = None,
+              retry: Optional[RetryPolicy] = None, limiter: Optional[TokenBucket] = None) -> Any:
+    """Journal a call that is safe to repeat, such as a ``PATCH``, and skip it once completed for ``key``."""
+    if key in journal.results:
+        return journal.results[key]
+    journal.intent(key, payload)
+    try:
+        result = call_with_retry(call, retry, limiter)
+    except Exception as e:
+        journal.error(key, e)
+        raise
+    journal.result(key, result)
+    return result
+
+
+def journaled_handlers(journal: Journal, handlers: Mapping[str, Callable[[JSON], JSON]]
+                       ) -> Dict[str, Callable[[JSON], JSON]]:
+    """Provisioner handlers that record their outputs and are skipped once completed.
+
+    Steps are keyed by kind and a hash of their parameters. Use this for
+    handlers that cannot look their objects up by name; ``account_handlers``
+    takes the journal itself.
+    """
+
+    def wrap(kind: str, handler: Callable[[JSON], JSON]) -> Callable[[JSON], JSON]:
+        def run(params: JSON) -> JSON:
+            key = f"{kind}/{spec_hash(params)}"
+            if key in journal.results:
+                return journal.results[key]
+            journal.intent(key, params)
+            try:
+                outputs = handler(params)
+            except Exception as e:
+                journal.error(key, e)
+                raise
+            journal.result(key, outputs)
+            return outputs
+
+        return run
+
+    return {kind: wrap(kind, handler) for kind, handler in handlers.items()}
@@ -0,0 +1,128 @@
+"""
+Customer-managed KMS keys for workspace storage and managed services.
+
+The customer-managed keys lab creates a symmetric key in the KMS console,
+adds the Databricks statements to its key policy and gives it an alias.
+``kms_handlers`` does the same for the ``kms_key`` kind of
+``provisioner.workspace_resources``, with the ``kms_key`` policy template.
+Keys are found by alias, so a repeated or resumed run reuses the key it
+created instead of creating another one.
+
+Requires ``boto3``.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from .client import JSON
+from .policies import TEMPLATES
+from .retry import RetryPolicy, call_with_retry
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - optional dependency
+    boto3 = Config = ClientError = None
+
+RETRYABLE_CODES = {"ThrottlingException", "KMSInternalException", "DependencyTimeoutException"}
+
+# Days before a key created by a run that lost the race for its alias is deleted.
+PENDING_WINDOW_DAYS = 7
+
+
+def _require_boto3() -> None:
+    if boto3 is None:
+        raise ImportError("KMS key provisioning needs boto3: pip install boto3")
+
+
+def error_code(error: Exception) -> Optional[str]:
+    if ClientError is not None and isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code")
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    return error_code(error) in RETRYABLE_CODES
+
+
+class KMSClients:
+    """One KMS client per region, created on first use and shared by all threads."""
+
+    def __init__(self, session: Any = None, max_pool_connections: int = 16, endpoint_url: Optional[str] = None):
+        _require_boto3()
+        self.session = session or boto3.session.Session()
+        self.max_pool_connections = max_pool_connections
+        self.endpoint_url = endpoint_url
+        self._clients: Dict[str, Any] = {}
+        self._account_id: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def client(self, region: str) -> Any:
+        with self._lock:
+            client = self._clients.get(region)
+            if client is None:
+                config = Config(max_pool_connections=self.max_pool_connections, retries={"mode": "standard"})
+                client = self._clients[region] = self.session.client("kms", region_name=region, config=config,
+                                                                     endpoint_url=self.endpoint_url)
+            return client
+
+    def account_id(self) -> str:
+        """The AWS account the session's credentials belong to, which the key policy names."""
+        with self._lock:
+            if self._account_id is None:
+                sts = self.session.client("sts", region_name="us-east-1", endpoint_url=self.endpoint_url)
+                self._account_id = sts.get_caller_identity()["Account"]
+            return self._account_id
+
+
+def find_key(kms: Any, alias: str, retry: Optional[RetryPolicy] = None) -> Optional[JSON]:
+    """The metadata of the key ``alias`` refers to, or None if there is no such alias."""
+    retry = retry or RetryPolicy(retryable=is_retryable)
+    try:
+        return call_with_retry(lambda: kms.describe_key(KeyId=alias), retry)["KeyMetadata"]
+    except Exception as e:
+        if error_code(e) == "NotFoundException":
+            return None
+        raise
+
+
+def create_key(kms: Any, alias: str, policy: str, retry: Optional[RetryPolicy] = None) -> JSON:
+    """Create a symmetric key with ``policy`` and point ``alias`` at it; reuses the key if the alias exists."""
+    retry = retry or RetryPolicy(retryable=is_retryable)
+    existing = find_key(kms, alias, retry)
+    if existing is not None:
+        return existing
+    # A throttled CreateKey did nothing; any other failure may have created a key, so it is not retried.
+    throttled = dataclasses.replace(retry, retryable=lambda e: error_code(e) == "ThrottlingException")
+    metadata = call_with_retry(lambda: kms.create_key(
+        Policy=policy, Description=f"Databricks workspace storage and managed services ({alias})",
+        KeySpec="SYMMETRIC_DEFAULT", KeyUsage="ENCRYPT_DECRYPT",
+        Tags=[{"TagKey": "Name", "TagValue": alias}]), throttled)["KeyMetadata"]
+    try:
+        call_with_retry(lambda: kms.create_alias(AliasName=alias, TargetKeyId=metadata["KeyId"]), retry)
+    except Exception as e:
+        if error_code(e) != "AlreadyExistsException":
+            raise
+        # Another run created the alias first: use its key and drop ours.
+        kms.schedule_key_deletion(KeyId=metadata["KeyId"], PendingWindowInDays=PENDING_WINDOW_DAYS)
+        return find_key(kms, alias, retry)
+    return metadata
+
+
+def kms_handlers(clients: KMSClients, databricks_account_id: str,
+                 retry: Optional[RetryPolicy] = None) -> Dict[str, Callable[[JSON], JSON]]:
+    """Provisioner handler for the ``kms_key`` kind of ``workspace_resources``."""
+    retry = retry or RetryPolicy(retryable=is_retryable)
+
+    def key(p: JSON) -> JSON:
+        region = p.get("region", "us-east-1")
+        policy = TEMPLATES["kms_key"].render({"AWS_ACCOUNT_ID": clients.account_id(),
+                                              "DATABRICKS_ACCOUNT_ID": databricks_account_id})
+        metadata = create_key(clients.client(region), p["alias"], policy, retry)
+        return {"key_arn": metadata["Arn"], "key_alias": p["alias"]}
+
+    return {"kms_key": key}
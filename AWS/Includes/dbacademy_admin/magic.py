@@ -0,0 +1,239 @@
+"""
+``%account_api``: Account API calls from notebook cells, in process.
+
+The labs' API cells run ``%sh curl ... | json_pp``, which spawns a shell,
+``curl`` and ``json_pp`` for every call and prints a response that no later
+cell can use. ``account_api`` issues the same call through one shared,
+pooled ``AccountClient`` and returns the parsed response, shown as a compact
+table:
+
+    workspaces = account_api("GET", "/workspaces", fields=["workspace_id", "workspace_name"])
+    key = account_api("POST", "/customer-managed-keys", {"use_cases": ["STORAGE"], "aws_key_info": {...}})
+
+The ids in a response made of one object (``workspace_id``,
+``customer_managed_key_id`` and the other ids in ``client.COLLECTIONS``) are
+remembered, so later calls can use the labs' placeholders instead of pasting
+them, e.g. ``account_api("GET", "/workspaces/<WORKSPACE_ID>")``. ``<CSK_ID>``
+stands for ``customer_managed_key_id``; other values, such as ``<KEY_ARN>``,
+can be set in ``get_session().ids``. A call with a placeholder that has no
+value fails before anything is sent.
+
+In an IPython notebook, ``%load_ext dbacademy_admin.magic`` adds the same as
+a magic, with the JSON payload in the body of a cell magic:
+
+    %account_api GET /workspaces --fields workspace_id,workspace_name
+
+    %%account_api PATCH /workspaces/<WORKSPACE_ID>
+    {"managed_services_customer_managed_key_id": "<CSK_ID>"}
+"""
+
+from __future__ import annotations
+
+import html
+import json
+import re
+import shlex
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from .client import COLLECTIONS, AccountClient, JSON
+from .streaming import project
+
+PLACEHOLDER = re.compile(r"<([A-Z][A-Z0-9_]*)>")
+
+# Placeholders used by the labs that are not simply the upper-cased id field.
+ALIASES = {"CSK_ID": "customer_managed_key_id"}
+
+MAX_CELL_WIDTH = 40
+
+
+class UnresolvedPlaceholder(ValueError):
+    """Raised when a call still contains a placeholder that has no remembered value."""
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    text = value if isinstance(value, str) else json.dumps(value, separators=(",", ":"))
+    return text if len(text) <= MAX_CELL_WIDTH else text[:MAX_CELL_WIDTH - 1] + "…"
+
+
+class _Rendered:
+    """Compact table rendering shared by ``ApiObject`` and ``ApiList``."""
+
+    elapsed: float = 0.0
+
+    def _rows(self) -> List[JSON]:
+        raise NotImplementedError
+
+    def _table(self) -> List[List[str]]:
+        rows = self._rows()
+        columns: Dict[str, None] = {}
+        for row in rows:
+            columns.update(dict.fromkeys(row))
+        if len(rows) == 1:
+            # One object reads better transposed, one field per line.
+            return [["field", "value"]] + [[key, _cell(value)] for key, value in rows[0].items()]
+        return [list(columns)] + [[_cell(row.get(column)) for column in columns] for row in rows]
+
+    def _footer(self) -> str:
+        rows = len(self._rows())
+        return f"{rows} row{'' if rows == 1 else 's'} in {self.elapsed * 1000:.0f} ms"
+
+    def table(self) -> str:
+        """The response as a plain-text table."""
+        table = self._table()
+        widths = [max(len(row[i]) for row in table) for i in range(len(table[0]))] if table[0] else []
+        if not widths:
+            return self._footer()
+        lines = ["  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in table]
+        lines.insert(1, "  ".join("-" * width for width in widths))
+        return "\n".join(lines + [self._footer()])
+
+    def _repr_pretty_(self, printer: Any, cycle: bool) -> None:
+        printer.text(self.table())
+
+    def _repr_html_(self) -> str:
+        table = self._table()
+        head = "".join(f"<th>{html.escape(value)}</th>" for value in table[0])
+        body = "".join("<tr>" + "".join(f"<td>{html.escape(value)}</td>" for value in row) + "</tr>"
+                       for row in table[1:])
+        return (f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+                f"<small>{html.escape(self._footer())}</small>")
+
+
+class ApiObject(_Rendered, dict):
+    """A response made of one JSON object."""
+
+    def _rows(self) -> List[JSON]:
+        return [self]
+
+
+class ApiList(_Rendered, list):
+    """A response made of a JSON array."""
+
+    def _rows(self) -> List[JSON]:
+        return [row if isinstance(row, dict) else {"value": row} for row in self]
+
+
+class AccountApiSession:
+    """One ``AccountClient`` plus the ids remembered from the responses it returned.
+
+    The client is built with ``AccountClient.from_environment`` on first use
+    unless one is given, so the session can be created before the
+    authentication cell has run.
+    """
+
+    def __init__(self, client: Optional[AccountClient] = None):
+        self._client = client
+        self._lock = threading.Lock()
+        self.ids: Dict[str, Any] = {}
+        self.last: Any = None
+
+    @property
+    def client(self) -> AccountClient:
+        with self._lock:
+            if self._client is None:
+                self._client = AccountClient.from_environment()
+            return self._client
+
+    def _lookup(self, match: re.Match) -> Any:
+        name = match.group(1)
+        key = ALIASES.get(name, name.lower())
+        if key not in self.ids:
+            raise UnresolvedPlaceholder(f"{match.group(0)} has no value: replace it, or set "
+                                        f"get_session().ids[{key!r}]")
+        return self.ids[key]
+
+    def substitute(self, value: Any) -> Any:
+        """Replace the placeholders in a path or payload with remembered ids.
+
+        A string that is nothing but a placeholder takes the id as is, so a
+        numeric ``workspace_id`` stays a number.
+        """
+        if isinstance(value, str):
+            whole = PLACEHOLDER.fullmatch(value)
+            if whole is not None:
+                return self._lookup(whole)
+            return PLACEHOLDER.sub(lambda m: str(self._lookup(m)), value)
+        if isinstance(value, dict):
+            return {key: self.substitute(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.substitute(item) for item in value]
+        return value
+
+    def remember(self, value: Any) -> None:
+        """Remember the ids of one object, e.g. the one picked from a listed response; lists are ignored."""
+        if isinstance(value, dict):
+            self.ids.update({key: value[key] for key in COLLECTIONS.values() if value.get(key) is not None})
+
+    def call(self, method: str, endpoint: str, payload: Union[JSON, str, None] = None,
+             fields: Optional[Sequence[str]] = None) -> Any:
+        """Issue a call and return the parsed response as an ``ApiObject`` or ``ApiList``.
+
+        ``payload`` may be a JSON string, as pasted from a lab's ``curl``
+        cell. With ``fields``, only those keys of each object are kept.
+        """
+        if isinstance(payload, str):
+            payload = json.loads(payload) if payload.strip() else None
+        endpoint = self.substitute(endpoint)
+        payload = self.substitute(payload)
+
+        started = time.perf_counter()
+        value = self.client.request(method.upper(), endpoint, payload)
+        elapsed = time.perf_counter() - started
+        self.remember(value)
+
+        if isinstance(value, list):
+            value = ApiList(project(item, fields) for item in value)
+        elif isinstance(value, dict):
+            value = ApiObject(project(value, fields))
+        if isinstance(value, _Rendered):
+            value.elapsed = elapsed
+        self.last = value
+        return value
+
+
+_session: Optional[AccountApiSession] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> AccountApiSession:
+    """The session shared by ``account_api`` and the ``%account_api`` magic."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = AccountApiSession()
+        return _session
+
+
+def account_api(method: str, endpoint: str, payload: Union[JSON, str, None] = None,
+                fields: Optional[Sequence[str]] = None) -> Any:
+    """Issue an Account API call through the shared session; see ``AccountApiSession.call``."""
+    return get_session().call(method, endpoint, payload, fields)
+
+
+def _parse_line(line: str) -> Tuple[str, str, Optional[List[str]]]:
+    words = shlex.split(line)
+    fields = None
+    if "--fields" in words:
+        i = words.index("--fields")
+        if i + 1 >= len(words):
+            raise ValueError("--fields needs a comma-separated list of fields")
+        fields = [f for f in words[i + 1].split(",") if f]
+        del words[i:i + 2]
+    if len(words) != 2:
+        raise ValueError("usage: %account_api METHOD /endpoint [--fields a,b]")
+    return words[0], words[1], fields
+
+
+def account_api_magic(line: str, cell: Optional[str] = None) -> Any:
+    """``%account_api METHOD /endpoint [--fields a,b]``; as a cell magic the body is the JSON payload."""
+    method, endpoint, fields = _parse_line(line)
+    return account_api(method, endpoint, cell, fields)
+
+
+def load_ipython_extension(ipython: Any) -> None:
+    """Register ``%account_api`` and ``%%account_api``; called by ``%load_ext dbacademy_admin.magic``."""
+    ipython.register_magic_function(account_api_magic, "line_cell", "account_api")
@@ -0,0 +1,161 @@
+"""
+Planning and applying metastore assignments in bulk.
+
+Assigning a metastore is a per-workspace click path in the account console,
+subject to three rules: one metastore per region, a metastore can only be
+assigned to workspaces in its own region, and a workspace has at most one
+metastore. ``AssignmentPlanner`` indexes the account inventory by region and
+by workspace so each rule is a dictionary lookup, and turns a desired state
+into the minimal set of detach and assign calls. ``apply_changes`` then
+carries them out concurrently.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from .client import JSON, AccountClient
+from .retry import RetryPolicy, TokenBucket, call_with_retry
+
+
+@dataclass(frozen=True)
+class AssignmentChange:
+    """Calls needed for one workspace: detach from ``unassign``, then attach to ``assign``."""
+
+    workspace_id: int
+    unassign: Optional[str] = None
+    assign: Optional[str] = None
+
+
+@dataclass
+class AssignmentPlan:
+    changes: List[AssignmentChange] = field(default_factory=list)
+    errors: Dict[int, str] = field(default_factory=dict)
+
+    @property
+    def calls(self) -> int:
+        return sum((c.unassign is not None) + (c.assign is not None) for c in self.changes)
+
+
+class AssignmentPlanner:
+    """Region and assignment indexes over the metastores and workspaces of an account.
+
+    ``assignments`` maps workspace ids to the id of their current metastore.
+    """
+
+    def __init__(self, metastores: Iterable[JSON], workspaces: Iterable[JSON], assignments: Mapping[int, str]):
+        self.metastore_region: Dict[str, str] = {}
+        self.region_metastore: Dict[str, str] = {}
+        self.violations: List[str] = []
+        for metastore in metastores:
+            metastore_id, region = metastore["metastore_id"], metastore["region"]
+            self.metastore_region[metastore_id] = region
+            if region in self.region_metastore:
+                self.violations.append(f"Region {region} has more than one metastore")
+            else:
+                self.region_metastore[region] = metastore_id
+
+        self.workspace_region: Dict[int, str] = {int(w["workspace_id"]): w.get("aws_region", "") for w in workspaces}
+        self.region_workspaces: Dict[str, List[int]] = {}
+        for workspace_id, region in self.workspace_region.items():
+            self.region_workspaces.setdefault(region, []).append(workspace_id)
+
+        self.assignment: Dict[int, str] = {int(w): m for w, m in assignments.items()}
+        for workspace_id, metastore_id in self.assignment.items():
+            if self.metastore_region.get(metastore_id) != self.workspace_region.get(workspace_id):
+                self.violations.append(f"Workspace {workspace_id} is assigned to metastore {metastore_id} "
+                                       f"in another region")
+
+    def check(self, workspace_id: int, metastore_id: Optional[str]) -> Optional[str]:
+        """Why ``metastore_id`` cannot be assigned to the workspace, or ``None`` if it can."""
+        region = self.workspace_region.get(workspace_id)
+        if region is None:
+            return f"Workspace {workspace_id} does not exist"
+        if metastore_id is None:
+            return None
+        metastore_region = self.metastore_region.get(metastore_id)
+        if metastore_region is None:
+            return f"Metastore {metastore_id} does not exist"
+        if metastore_region != region:
+            return f"Metastore {metastore_id} is in {metastore_region}, workspace {workspace_id} is in {region}"
+        return None
+
+    def plan(self, desired: Mapping[int, Optional[str]]) -> AssignmentPlan:
+        """Changes bringing each listed workspace to its desired metastore (``None`` to detach)."""
+        result = AssignmentPlan()
+        for workspace_id, metastore_id in desired.items():
+            workspace_id = int(workspace_id)
+            error = self.check(workspace_id, metastore_id)
+            if error is not None:
+                result.errors[workspace_id] = error
+                continue
+            current = self.assignment.get(workspace_id)
+            if current == metastore_id:
+                continue
+            result.changes.append(AssignmentChange(workspace_id, current, metastore_id))
+        return result
+
+    def plan_region(self, region: str, metastore_id: Optional[str] = None) -> AssignmentPlan:
+        """Point every workspace of a region at ``metastore_id``, by default the region's metastore."""
+        metastore_id = metastore_id or self.region_metastore.get(region)
+        if metastore_id is None:
+            raise ValueError(f"Region {region} has no metastore")
+        return self.plan({w: metastore_id for w in self.region_workspaces.get(region, [])})
+
+    def record(self, change: AssignmentChange) -> None:
+        """Update the indexes after a change has been applied."""
+        if change.assign is None:
+            self.assignment.pop(change.workspace_id, None)
+        else:
+            self.assignment[change.workspace_id] = change.assign
+
+
+def load_planner(client: AccountClient, max_workers: int = 16) -> AssignmentPlanner:
+    """Build a planner from the live account, listing each metastore's workspaces concurrently."""
+    metastores = client.list_metastores()
+    workspaces = client.list_workspaces()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        workspace_lists = executor.map(lambda m: client.list_metastore_workspaces(m["metastore_id"]), metastores)
+        assignments = {int(w): m["metastore_id"] for m, ids in zip(metastores, workspace_lists) for w in ids}
+    return AssignmentPlanner(metastores, workspaces, assignments)
+
+
+def apply_changes(client: AccountClient, plan: AssignmentPlan, planner: Optional[AssignmentPlanner] = None,
+                  max_workers: int = 16, limiter: Optional[TokenBucket] = None,
+                  retry: Optional[RetryPolicy] = None) -> List[Tuple[AssignmentChange, Optional[Exception]]]:
+    """Apply the changes of a plan concurrently; the two calls of one workspace run in order.
+
+    Returns each change with the exception that stopped it, or ``None``. When
+    a workspace is detached but the assign call then fails, the two calls are
+    returned as separate changes, the detach with ``None``, so that the
+    workspace is known to have no metastore. Successful changes are recorded
+    in ``planner`` when one is given.
+    """
+
+    def apply(change: AssignmentChange) -> List[Tuple[AssignmentChange, Optional[Exception]]]:
+        if change.unassign is not None:
+            try:
+                call_with_retry(lambda: client.unassign_metastore(change.workspace_id, change.unassign),
+                                retry, limiter)
+            except Exception as e:
+                return [(change, e)]
+        if change.assign is None:
+            return [(change, None)]
+        try:
+            call_with_retry(lambda: client.assign_metastore(change.workspace_id, change.assign), retry, limiter)
+        except Exception as e:
+            if change.unassign is None:
+                return [(change, e)]
+            return [(AssignmentChange(change.workspace_id, unassign=change.unassign), None),
+                    (AssignmentChange(change.workspace_id, assign=change.assign), e)]
+        return [(change, None)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = [result for results in executor.map(apply, plan.changes) for result in results]
+    if planner is not None:
+        for change, error in results:
+            if error is None:
+                planner.record(change)
+    return results
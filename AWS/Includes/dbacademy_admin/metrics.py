@@ -0,0 +1,258 @@
+"""
+Per-request instrumentation for Account API calls.
+
+Every ``AccountClient`` call can be reported to hooks as a ``RequestRecord``:
+templated endpoint, method, status (``NO_RESPONSE`` when the call failed
+before a response could be used), retry attempt, bytes sent and received,
+and the time spent in each phase of the call:
+
+- ``connect``: DNS lookup, TCP and TLS handshake; zero on a reused connection,
+- ``wait``: sending the request until the response headers arrive,
+- ``read``: reading the response body,
+- ``parse``: decoding the JSON.
+
+``MetricsRecorder`` is such a hook. It aggregates records into log-linear
+``Histogram`` objects, which keep every value within 1% at a fixed cost per
+record, and dumps them in the Prometheus text format or as JSONL:
+
+    metrics = MetricsRecorder()
+    api = AccountClient.from_environment(hooks=[metrics])
+    ...
+    print(metrics.to_prometheus())
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import threading
+from dataclasses import asdict, dataclass
+from typing import IO, Dict, Iterator, List, Optional, Sequence, Tuple
+
+PHASES = ("connect", "wait", "read", "parse")
+
+# Prometheus bucket boundaries, in seconds.
+DEFAULT_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Status of a record whose call failed without a usable response: the
+# connection failed, or the body could not be read or parsed.
+NO_RESPONSE = 0
+
+# Attempt number of the call being made, set by ``call_with_retry``.
+retry_attempt: "contextvars.ContextVar[int]" = contextvars.ContextVar("retry_attempt", default=0)
+
+
+def endpoint_template(endpoint: str) -> str:
+    """``/workspaces/123/metastores/abc`` -> ``/workspaces/{id}/metastores/{id}``.
+
+    Account API paths alternate between collection names and ids, so every
+    second segment is an id.
+    """
+    parts = endpoint.strip("/").split("/")
+    return "/" + "/".join("{id}" if i % 2 else part for i, part in enumerate(parts))
+
+
+@dataclass
+class RequestRecord:
+    endpoint: str
+    method: str
+    status: int
+    attempt: int
+    bytes_sent: int
+    bytes_received: int
+    connect: float
+    wait: float
+    read: float
+    parse: float
+    reused: bool
+
+    @property
+    def total(self) -> float:
+        return self.connect + self.wait + self.read + self.parse
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), separators=(",", ":"))
+
+
+class Histogram:
+    """Log-linear histogram of durations in the manner of HdrHistogram.
+
+    Values are counted in ``unit`` steps (1 microsecond by default). Each power
+    of two is split into ``2 ** (sub_bits - 1)`` equal buckets, so a value's
+    bucket is found with a few integer operations and bounds it to within
+    ``2 ** (1 - sub_bits)`` of its size.
+    """
+
+    def __init__(self, unit: float = 1e-6, sub_bits: int = 8):
+        self.unit = unit
+        self._sub_bits = sub_bits
+        self._sub_count = 1 << sub_bits
+        self._half = self._sub_count >> 1
+        self._counts: List[int] = []
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def _index(self, units: int) -> int:
+        if units < self._sub_count:
+            return units
+        shift = units.bit_length() - self._sub_bits
+        return (shift * self._half) + (units >> shift)
+
+    def _bounds(self, index: int) -> Tuple[int, int]:
+        """Lowest and highest unit count of a bucket."""
+        if index < self._sub_count:
+            return index, index
+        shift = index // self._half - 1
+        low = (index - shift * self._half) << shift
+        return low, low + (1 << shift) - 1
+
+    def record(self, value: float) -> None:
+        index = self._index(int(value / self.unit))
+        if index >= len(self._counts):
+            self._counts.extend([0] * (index + 1 - len(self._counts)))
+        self._counts[index] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram") -> None:
+        if (other.unit, other._sub_bits) != (self.unit, self._sub_bits):
+            raise ValueError("Histograms must have the same unit and precision")
+        if len(other._counts) > len(self._counts):
+            self._counts.extend([0] * (len(other._counts) - len(self._counts)))
+        for index, count in enumerate(other._counts):
+            self._counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def buckets(self) -> Iterator[Tuple[float, int]]:
+        """``(highest value, count)`` of every non-empty bucket, in increasing order."""
+        for index, count in enumerate(self._counts):
+            if count:
+                yield (self._bounds(index)[1] + 1) * self.unit, count
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, -(-q * self.count // 100))
+        seen = 0
+        for value, count in self.buckets():
+            seen += count
+            if seen >= rank:
+                return min(value, self.max)
+        return self.max
+
+    def cumulative(self, bounds: Sequence[float] = DEFAULT_BOUNDS) -> List[Tuple[float, int]]:
+        """Counts of values at most each bound, as Prometheus ``le`` buckets."""
+        result = []
+        buckets = list(self.buckets())
+        seen = position = 0
+        for bound in bounds:
+            while position < len(buckets) and buckets[position][0] <= bound + self.unit / 2:
+                seen += buckets[position][1]
+                position += 1
+            result.append((bound, seen))
+        return result
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+        }
+
+
+@dataclass
+class _Series:
+    phases: Dict[str, Histogram]
+    total: Histogram
+    requests: int = 0
+    errors: int = 0
+    retries: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+
+class MetricsRecorder:
+    """Hook aggregating ``RequestRecord`` objects per method and endpoint template.
+
+    With ``jsonl``, every record is also written to that file as one JSON line.
+    """
+
+    def __init__(self, jsonl: Optional[IO[str]] = None, bounds: Sequence[float] = DEFAULT_BOUNDS):
+        self.jsonl = jsonl
+        self.bounds = tuple(bounds)
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self._statuses: Dict[Tuple[str, str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record: RequestRecord) -> None:
+        key = (record.method, record.endpoint)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series({phase: Histogram() for phase in PHASES}, Histogram())
+            series.requests += 1
+            series.errors += record.status == NO_RESPONSE or record.status >= 400
+            series.retries += record.attempt > 0
+            series.bytes_sent += record.bytes_sent
+            series.bytes_received += record.bytes_received
+            for phase in PHASES:
+                series.phases[phase].record(getattr(record, phase))
+            series.total.record(record.total)
+            status_key = (record.method, record.endpoint, record.status)
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+            if self.jsonl is not None:
+                self.jsonl.write(record.to_json() + "\n")
+
+    def histogram(self, method: str, endpoint: str, phase: str = "total") -> Histogram:
+        series = self._series[(method, endpoint)]
+        return series.total if phase == "total" else series.phases[phase]
+
+    def to_prometheus(self, prefix: str = "dbacademy_account_api") -> str:
+        lines = [f"# TYPE {prefix}_requests_total counter"]
+        with self._lock:
+            for (method, endpoint, status), count in sorted(self._statuses.items()):
+                lines.append(f'{prefix}_requests_total{{method="{method}",endpoint="{endpoint}",'
+                             f'status="{status}"}} {count}')
+            for name, attribute in (("retries_total", "retries"), ("sent_bytes_total", "bytes_sent"),
+                                    ("received_bytes_total", "bytes_received")):
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                for (method, endpoint), series in sorted(self._series.items()):
+                    lines.append(f'{prefix}_{name}{{method="{method}",endpoint="{endpoint}"}} '
+                                 f'{getattr(series, attribute)}')
+            lines.append(f"# TYPE {prefix}_duration_seconds histogram")
+            for (method, endpoint), series in sorted(self._series.items()):
+                for phase, histogram in (("total", series.total), *series.phases.items()):
+                    labels = f'method="{method}",endpoint="{endpoint}",phase="{phase}"'
+                    for bound, count in histogram.cumulative(self.bounds):
+                        lines.append(f'{prefix}_duration_seconds_bucket{{{labels},le="{bound:g}"}} {count}')
+                    lines.append(f'{prefix}_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f"{prefix}_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                    lines.append(f"{prefix}_duration_seconds_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_jsonl(self) -> str:
+        """One line per method, endpoint and phase with counters and latency percentiles."""
+        lines = []
+        with self._lock:
+            for (method, endpoint), series in sorted(self._series.items()):
+                for phase, histogram in (("total", series.total), *series.phases.items()):
+                    lines.append(json.dumps(dict(
+                        method=method, endpoint=endpoint, phase=phase, requests=series.requests,
+                        errors=series.errors, retries=series.retries, bytes_sent=series.bytes_sent,
+                        bytes_received=series.bytes_received, **histogram.summary(),
+                    ), separators=(",", ":")))
+        return "".join(line + "\n" for line in lines)
@@ -0,0 +1,391 @@
+"""
+Local stand-in for the Account API endpoints used by the labs.
+
+The server keeps all state in memory and speaks HTTP/1.1 with keep-alive, so
+it can be used to exercise and benchmark admin automation without a live
+Databricks account. It can also be started on its own, e.g. for the labs'
+``%sh curl`` cells with ``DBACADEMY_API_URL`` pointed at it:
+
+    python -m dbacademy_admin.mock_server --port 8080 --latency 0.1 --provisioning-delay 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import collections
+import itertools
+import json
+import random
+import secrets
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from .client import API_PREFIX, COLLECTIONS
+from .retry import TokenBucket
+
+
+class _AccountState:
+    def __init__(self, limiter: Optional[TokenBucket]):
+        self.limiter = limiter
+        self.objects: Dict[str, Dict[str, Dict[str, Any]]] = {name: {} for name in COLLECTIONS}
+        # Workspace id -> time at which a provisioning workspace becomes RUNNING.
+        self.ready_at: Dict[str, float] = {}
+        self.metastores: Dict[str, Dict[str, Any]] = {}
+        # Workspace id -> id of the metastore assigned to it.
+        self.assignments: Dict[str, str] = {}
+
+
+class MockAccountServer:
+    """In-memory Account API served on ``127.0.0.1``.
+
+    Use it as a context manager, or call ``start()`` and ``stop()``. New and
+    patched workspaces report ``PROVISIONING`` for ``provisioning_delay``
+    seconds before turning ``RUNNING``. With ``rate_limit``, each account
+    accepts that many calls per second, in bursts of up to ``burst``, and
+    answers HTTP 429 beyond it. Every response is delayed by ``latency``
+    seconds plus a uniformly random share of up to ``jitter`` seconds, and
+    with ``retry_after``, HTTP 429 responses carry a ``Retry-After`` header of
+    that many seconds. ``fail_next`` makes upcoming calls fail with a given
+    status, before or after they take effect.
+
+    Any Basic ``Authorization`` header is accepted. Service principals added
+    with ``add_service_principal`` can also exchange their secret for a Bearer
+    token at ``/oidc/accounts/<ACCOUNT_ID>/v1/token``; tokens are valid for
+    ``token_lifetime`` seconds, after which calls using them get HTTP 401.
+    """
+
+    def __init__(self, port: int = 0, provisioning_delay: float = 0.0, rate_limit: Optional[float] = None,
+                 burst: Optional[float] = None, token_lifetime: float = 3600.0, latency: float = 0.0,
+                 jitter: float = 0.0, retry_after: Optional[float] = None):
+        self.provisioning_delay = provisioning_delay
+        self.retry_after = retry_after
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.token_lifetime = token_lifetime
+        self.throttled = 0
+        self.tokens_issued = 0
+        self.rejected_tokens = 0
+        # (status, method or None for any, whether the call takes effect first), oldest first.
+        self._failures: "collections.deque[Tuple[int, Optional[str], bool]]" = collections.deque()
+        self._service_principals: Dict[str, str] = {}
+        # Access token -> time at which it expires.
+        self._tokens: Dict[str, float] = {}
+        self._accounts: Dict[str, _AccountState] = {}
+        self._lock = threading.Lock()
+        self._workspace_ids = itertools.count(1000000000000000)
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def url_for(self, account_id: str) -> str:
+        """The value ``DBACADEMY_API_URL`` would have for ``account_id``."""
+        return f"http://127.0.0.1:{self.port}{API_PREFIX}/{account_id}"
+
+    def start(self) -> "MockAccountServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serve on the calling thread until interrupted."""
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockAccountServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def delay(self) -> None:
+        """Sleep for the configured latency; called by each request thread outside the lock."""
+        delay = self.latency + (random.uniform(0.0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def fail_next(self, status: int, count: int = 1, method: Optional[str] = None,
+                  after_commit: bool = False) -> None:
+        """Answer the next ``count`` API calls (of ``method`` only, if given) with ``status``.
+
+        With ``after_commit``, each call is carried out before it fails, as
+        when a gateway times out on a call the backend completed.
+        """
+        with self._lock:
+            self._failures.extend([(status, method, after_commit)] * count)
+
+    def _take_failure(self, method: str) -> Optional[Tuple[int, Optional[str], bool]]:
+        for failure in self._failures:
+            if failure[1] in (None, method):
+                self._failures.remove(failure)
+                return failure
+        return None
+
+    def add_service_principal(self, client_id: str, client_secret: str) -> None:
+        self._service_principals[client_id] = client_secret
+
+    def issue_token(self, authorization: str, form: Dict[str, List[str]]):
+        """Answer a client-credentials token request; returns ``(status, body)``."""
+        scheme, _, encoded = authorization.partition(" ")
+        try:
+            client_id, _, client_secret = base64.b64decode(encoded).decode("utf-8").partition(":")
+        except ValueError:
+            client_id, client_secret = "", ""
+        if scheme != "Basic" or self._service_principals.get(client_id) != client_secret or not client_id:
+            return 401, {"error": "invalid_client", "error_description": "Client authentication failed"}
+        if form.get("grant_type") != ["client_credentials"]:
+            return 400, {"error": "unsupported_grant_type"}
+        token = secrets.token_urlsafe(24)
+        with self._lock:
+            self._tokens[token] = time.monotonic() + self.token_lifetime
+            self.tokens_issued += 1
+        return 200, {"access_token": token, "token_type": "Bearer", "scope": form.get("scope", ["all-apis"])[0],
+                     "expires_in": self.token_lifetime}
+
+    def authenticate(self, authorization: Optional[str]) -> bool:
+        if not authorization:
+            return False
+        scheme, _, token = authorization.partition(" ")
+        if scheme != "Bearer":
+            return True
+        with self._lock:
+            valid = self._tokens.get(token, 0.0) > time.monotonic()
+            if not valid:
+                self.rejected_tokens += 1
+            return valid
+
+    def _account(self, account_id: str) -> _AccountState:
+        state = self._accounts.get(account_id)
+        if state is None:
+            limiter = None if self.rate_limit is None else TokenBucket(self.rate_limit, self.burst)
+            state = self._accounts[account_id] = _AccountState(limiter)
+        return state
+
+    def handle(self, method: str, account_id: str, parts: List[str], payload: Optional[Dict[str, Any]]):
+        """Apply one call to the in-memory state and return ``(status, body)``.
+
+        ``parts`` is the path after the account id, split on ``/``. ``body`` is
+        already encoded as JSON: it is serialized while the lock is held, since
+        it may be the live state that concurrent calls change.
+        """
+        with self._lock:
+            status, body = self._handle(method, account_id, parts, payload)
+            return status, json.dumps(body).encode("utf-8")
+
+    def _handle(self, method, account_id, parts, payload):
+        state = self._account(account_id)
+        if state.limiter is not None and not state.limiter.try_acquire():
+            self.throttled += 1
+            return 429, {"error_code": "REQUEST_LIMIT_EXCEEDED", "message": "Too many requests"}
+        failure = self._take_failure(method)
+        if failure is None:
+            return self._apply(method, state, account_id, parts, payload)
+        if failure[2]:
+            self._apply(method, state, account_id, parts, payload)
+        return failure[0], {"error_code": "TEMPORARILY_UNAVAILABLE", "message": f"Injected HTTP {failure[0]}"}
+
+    def _apply(self, method: str, state: _AccountState, account_id: str, parts: List[str],
+               payload: Optional[Dict[str, Any]]):
+        if parts[0] == "metastores" or (parts[0] == "workspaces" and len(parts) > 2):
+            return self._handle_metastores(method, state, parts, payload)
+        if parts[0] not in COLLECTIONS or len(parts) > 2:
+            return 404, {"error_code": "ENDPOINT_NOT_FOUND", "message": "/".join(parts)}
+        return self._handle_collection(method, state, account_id, parts, payload)
+
+    def _handle_collection(self, method, state, account_id, parts, payload):
+        collection = parts[0]
+        object_id = parts[1] if len(parts) == 2 else None
+        id_field = COLLECTIONS[collection]
+        objects = state.objects[collection]
+        if collection == "workspaces":
+            self._advance(state)
+        if object_id is None:
+            if method == "GET":
+                return 200, list(objects.values())
+            if method == "POST":
+                return 200, self._create(state, account_id, collection, id_field, payload or {})
+            return 405, {"error_code": "METHOD_NOT_ALLOWED", "message": method}
+        obj = objects.get(object_id)
+        if obj is None:
+            return 404, {"error_code": "RESOURCE_DOES_NOT_EXIST",
+                         "message": f"{collection} {object_id} does not exist"}
+        if method == "GET":
+            return 200, obj
+        if method == "PATCH" and collection == "workspaces":
+            obj.update(payload or {})
+            self._provision(state, obj)
+            return 200, {}
+        if method == "DELETE":
+            del objects[object_id]
+            return 200, {}
+        return 405, {"error_code": "METHOD_NOT_ALLOWED", "message": method}
+
+    def _handle_metastores(self, method, state, parts, payload):
+        if parts[0] == "metastores":
+            if len(parts) == 1 and method == "GET":
+                return 200, {"metastores": list(state.metastores.values())}
+            if len(parts) == 1 and method == "POST":
+                info = dict((payload or {}).get("metastore_info", {}), metastore_id=str(uuid.uuid4()))
+                if any(m.get("region") == info.get("region") for m in state.metastores.values()):
+                    return 400, {"error_code": "INVALID_STATE",
+                                 "message": f"A metastore already exists in region {info.get('region')}"}
+                state.metastores[info["metastore_id"]] = info
+                return 200, {"metastore_info": info}
+            if len(parts) == 3 and parts[2] == "workspaces" and method == "GET":
+                return 200, {"workspace_ids": [int(w) for w, m in state.assignments.items() if m == parts[1]]}
+            return 404, {"error_code": "ENDPOINT_NOT_FOUND", "message": "/".join(parts)}
+
+        workspace_id = parts[1]
+        workspace = state.objects["workspaces"].get(workspace_id)
+        if workspace is None:
+            return 404, {"error_code": "RESOURCE_DOES_NOT_EXIST", "message": f"workspaces {workspace_id} does not exist"}
+        if len(parts) == 3 and parts[2] == "metastore" and method == "GET":
+            if workspace_id not in state.assignments:
+                return 404, {"error_code": "RESOURCE_DOES_NOT_EXIST", "message": "No metastore assigned"}
+            return 200, {"metastore_assignment": {"workspace_id": int(workspace_id),
+                                                  "metastore_id": state.assignments[workspace_id]}}
+        if len(parts) != 4 or parts[2] != "metastores":
+            return 404, {"error_code": "ENDPOINT_NOT_FOUND", "message": "/".join(parts)}
+        metastore = state.metastores.get(parts[3])
+        if metastore is None:
+            return 404, {"error_code": "RESOURCE_DOES_NOT_EXIST", "message": f"metastores {parts[3]} does not exist"}
+        if method in ("POST", "PUT"):
+            if metastore.get("region") != workspace.get("aws_region"):
+                return 400, {"error_code": "INVALID_PARAMETER_VALUE",
+                             "message": "Metastore and workspace must be in the same region"}
+            if method == "POST" and workspace_id in state.assignments:
+                return 400, {"error_code": "INVALID_STATE", "message": "Workspace already has a metastore"}
+            state.assignments[workspace_id] = parts[3]
+            return 200, {}
+        if method == "DELETE":
+            if state.assignments.get(workspace_id) != parts[3]:
+                return 404, {"error_code": "RESOURCE_DOES_NOT_EXIST", "message": "Metastore is not assigned"}
+            del state.assignments[workspace_id]
+            return 200, {}
+        return 405, {"error_code": "METHOD_NOT_ALLOWED", "message": method}
+
+    def _create(self, state, account_id, collection, id_field, payload):
+        obj = dict(payload, account_id=account_id, creation_time=int(time.time() * 1000))
+        if collection == "workspaces":
+            obj[id_field] = next(self._workspace_ids)
+            self._provision(state, obj)
+        else:
+            obj[id_field] = str(uuid.uuid4())
+        state.objects[collection][str(obj[id_field])] = obj
+        return dict(obj)
+
+    def _provision(self, state, workspace):
+        if self.provisioning_delay > 0:
+            workspace["workspace_status"] = "PROVISIONING"
+            workspace["workspace_status_message"] = "Workspace resources are being set up."
+            state.ready_at[str(workspace["workspace_id"])] = time.monotonic() + self.provisioning_delay
+        else:
+            workspace["workspace_status"] = "RUNNING"
+            workspace["workspace_status_message"] = "Workspace is running."
+
+    def _advance(self, state):
+        now = time.monotonic()
+        for workspace_id, ready_at in list(state.ready_at.items()):
+            if ready_at <= now:
+                del state.ready_at[workspace_id]
+                workspace = state.objects["workspaces"].get(workspace_id)
+                if workspace is not None:
+                    workspace["workspace_status"] = "RUNNING"
+                    workspace["workspace_status_message"] = "Workspace is running."
+
+
+def _make_handler(server: MockAccountServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _dispatch(self, method: str):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            status, body = self._route(method, raw)
+            server.delay()
+            data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            if status == 429 and server.retry_after is not None:
+                self.send_header("Retry-After", f"{server.retry_after:g}")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _route(self, method: str, raw: bytes):
+            if self.path.startswith("/oidc/accounts/") and self.path.endswith("/v1/token") and method == "POST":
+                form = parse_qs(raw.decode("utf-8"))
+                return server.issue_token(self.headers.get("Authorization", ""), form)
+            if not server.authenticate(self.headers.get("Authorization")):
+                return 401, {"error_code": "UNAUTHENTICATED", "message": "Invalid or expired credentials"}
+            if not self.path.startswith(API_PREFIX + "/"):
+                return 404, {"error_code": "ENDPOINT_NOT_FOUND", "message": self.path}
+            parts = self.path[len(API_PREFIX) + 1:].split("?", 1)[0].strip("/").split("/")
+            if len(parts) < 2:
+                return 404, {"error_code": "ENDPOINT_NOT_FOUND", "message": self.path}
+            try:
+                payload = json.loads(raw) if raw else None
+            except ValueError:
+                return 400, {"error_code": "MALFORMED_REQUEST", "message": "Invalid JSON"}
+            return server.handle(method, parts[0], parts[1:], payload)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_PATCH(self):
+            self._dispatch("PATCH")
+
+        def do_PUT(self):
+            self._dispatch("PUT")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+    return Handler
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve an in-memory Account API on 127.0.0.1.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra random seconds")
+    parser.add_argument("--rate-limit", type=float, help="calls/s accepted per account")
+    parser.add_argument("--burst", type=float, help="burst size for --rate-limit")
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with HTTP 429")
+    parser.add_argument("--provisioning-delay", type=float, default=0.0,
+                        help="seconds a new or patched workspace stays PROVISIONING")
+    args = parser.parse_args(argv)
+
+    server = MockAccountServer(args.port, args.provisioning_delay, args.rate_limit, args.burst,
+                               latency=args.latency, jitter=args.jitter, retry_after=args.retry_after)
+    print(f"Serving the Account API on {server.url_for('<ACCOUNT_ID>')}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Generation of the EC2 and Account API calls behind additional workspaces.
+
+"Creating additional workspaces" in the customer-managed VPC lab takes about
+fifteen console steps per workspace: two subnets, two route tables with a
+quad-zero route to the NAT gateway, their associations and a network
+configuration. ``plan_networks`` produces the same work, for any number of
+workspaces, as an ordered list of ``Operation`` from a description of the VPC:
+
+    {
+      "region": "us-east-1",
+      "vpc_id": "vpc-0123",
+      "cidr_block": "10.0.0.0/16",
+      "security_group_ids": ["sg-0123"],
+      "subnets": [{"subnet_id": "subnet-0123", "cidr_block": "10.0.0.0/20", "availability_zone": "us-east-1a"}],
+      "nat_gateways": [{"nat_gateway_id": "nat-0123", "availability_zone": "us-east-1a"}],
+      "route_tables": [{"route_table_id": "rtb-0123", "nat_gateway_id": "nat-0123"}]
+    }
+
+Subnets behind the same NAT gateway share one route table, reusing a listed
+route table that already sends quad-zero traffic to it, so a VPC with one NAT
+gateway needs at most one new route table however many workspaces are added.
+``describe_vpc`` builds the description from a live (or moto) EC2 client and
+``apply_plan`` carries the operations out.
+
+    python -m dbacademy_admin.netgen vpc.json --workspaces 3 --name-prefix dbacademy-test
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from .cidr import SubnetAllocator
+from .client import JSON, AccountClient
+
+QUAD_ZERO = "0.0.0.0/0"
+
+
+@dataclass(frozen=True)
+class Ref:
+    """Placeholder for the id produced by an earlier operation."""
+
+    name: str
+
+
+@dataclass
+class Operation:
+    """One call: ``service`` is ``ec2`` or ``account``, ``action`` the API operation."""
+
+    service: str
+    action: str
+    params: Dict[str, Any]
+    ref: Optional[str] = None
+
+    def to_json(self) -> JSON:
+        def encode(value):
+            if isinstance(value, Ref):
+                return "${" + value.name + "}"
+            if isinstance(value, list):
+                return [encode(v) for v in value]
+            if isinstance(value, dict):
+                return {k: encode(v) for k, v in value.items()}
+            return value
+
+        result = {"service": self.service, "action": self.action, "params": encode(self.params)}
+        if self.ref is not None:
+            result["ref"] = self.ref
+        return result
+
+
+def _nat_for_zone(nat_gateways: Sequence[JSON], zone: str) -> JSON:
+    """The NAT gateway in the subnet's zone if there is one, otherwise the first."""
+    for nat in nat_gateways:
+        if nat.get("availability_zone") == zone:
+            return nat
+    return nat_gateways[0]
+
+
+def plan_networks(vpc: JSON, count: int, prefixlen: int = 20, name_prefix: str = "dbacademy",
+                  availability_zones: Optional[Sequence[str]] = None, first_index: int = 1) -> List[Operation]:
+    """Operations creating subnets, routing and a network configuration for ``count`` workspaces."""
+    if not vpc.get("nat_gateways"):
+        raise ValueError("Workspace subnets need a NAT gateway in the VPC")
+    zones = list(availability_zones or vpc.get("availability_zones")
+                 or sorted({s["availability_zone"] for s in vpc.get("subnets", [])}))
+    allocator = SubnetAllocator(vpc["cidr_block"], [s["cidr_block"] for s in vpc.get("subnets", [])])
+    pairs = allocator.plan(count, prefixlen, zones)
+
+    operations: List[Operation] = []
+    route_tables: Dict[str, Any] = {
+        rt["nat_gateway_id"]: rt["route_table_id"] for rt in vpc.get("route_tables", []) if rt.get("nat_gateway_id")
+    }
+
+    def route_table_for(nat: JSON):
+        nat_id = nat["nat_gateway_id"]
+        if nat_id not in route_tables:
+            ref = f"route-table-{nat_id}"
+            operations.append(Operation("ec2", "CreateRouteTable", {
+                "VpcId": vpc["vpc_id"],
+                "TagSpecifications": _name_tag("route-table", f"{name_prefix}-rtb-{nat_id}"),
+            }, ref))
+            operations.append(Operation("ec2", "CreateRoute", {
+                "RouteTableId": Ref(ref), "DestinationCidrBlock": QUAD_ZERO, "NatGatewayId": nat_id,
+            }))
+            route_tables[nat_id] = Ref(ref)
+        return route_tables[nat_id]
+
+    for index, pair in enumerate(pairs, start=first_index):
+        subnet_refs = []
+        for side, (cidr, zone) in enumerate(zip(pair.cidrs, pair.availability_zones), start=1):
+            ref = f"subnet-{index}-{side}"
+            operations.append(Operation("ec2", "CreateSubnet", {
+                "VpcId": vpc["vpc_id"],
+                "CidrBlock": cidr,
+                "AvailabilityZone": zone,
+                "TagSpecifications": _name_tag("subnet", f"{name_prefix}-subnet-ws{index}-{side}"),
+            }, ref))
+            operations.append(Operation("ec2", "AssociateRouteTable", {
+                "RouteTableId": route_table_for(_nat_for_zone(vpc["nat_gateways"], zone)), "SubnetId": Ref(ref),
+            }))
+            subnet_refs.append(Ref(ref))
+        operations.append(Operation("account", "CreateNetwork", {
+            "network_name": f"{name_prefix}-network-configuration-ws{index}",
+            "vpc_id": vpc["vpc_id"],
+            "subnet_ids": subnet_refs,
+            "security_group_ids": list(vpc["security_group_ids"]),
+        }, f"network-{index}"))
+    return operations
+
+
+def _name_tag(resource_type: str, name: str) -> List[JSON]:
+    return [{"ResourceType": resource_type, "Tags": [{"Key": "Name", "Value": name}]}]
+
+
+# EC2 action -> (boto3 method, function extracting the id to bind to the ref).
+_EC2_ACTIONS = {
+    "CreateSubnet": ("create_subnet", lambda r: r["Subnet"]["SubnetId"]),
+    "CreateRouteTable": ("create_route_table", lambda r: r["RouteTable"]["RouteTableId"]),
+    "CreateRoute": ("create_route", lambda r: None),
+    "AssociateRouteTable": ("associate_route_table", lambda r: r["AssociationId"]),
+}
+
+
+def apply_plan(operations: Sequence[Operation], ec2, account: AccountClient) -> Dict[str, Any]:
+    """Run the operations in order and return the ids bound to their refs.
+
+    ``ec2`` is a boto3 EC2 client for the VPC's region.
+    """
+    bound: Dict[str, Any] = {}
+
+    def resolve(value):
+        if isinstance(value, Ref):
+            return bound[value.name]
+        if isinstance(value, list):
+            return [resolve(v) for v in value]
+        if isinstance(value, dict):
+            return {k: resolve(v) for k, v in value.items()}
+        return value
+
+    for operation in operations:
+        params = resolve(operation.params)
+        if operation.service == "ec2":
+            method, extract = _EC2_ACTIONS[operation.action]
+            result = extract(getattr(ec2, method)(**params))
+        elif operation.action == "CreateNetwork":
+            result = account.create_network(**params)["network_id"]
+        else:
+            raise ValueError(f"Unsupported operation {operation.service}:{operation.action}")
+        if operation.ref is not None:
+            bound[operation.ref] = result
+    return bound
+
+
+def describe_vpc(ec2, vpc_id: str) -> JSON:
+    """Build the VPC description ``plan_networks`` expects from an EC2 client."""
+    vpc_filter = [{"Name": "vpc-id", "Values": [vpc_id]}]
+    vpc = ec2.describe_vpcs(VpcIds=[vpc_id])["Vpcs"][0]
+    subnets = ec2.describe_subnets(Filters=vpc_filter)["Subnets"]
+    nat_gateways = [n for n in ec2.describe_nat_gateways(Filter=vpc_filter)["NatGateways"]
+                    if n.get("State") in ("pending", "available")]
+    subnet_zones = {s["SubnetId"]: s["AvailabilityZone"] for s in subnets}
+    route_tables = []
+    for table in ec2.describe_route_tables(Filters=vpc_filter)["RouteTables"]:
+        for route in table.get("Routes", []):
+            if route.get("DestinationCidrBlock") == QUAD_ZERO and route.get("NatGatewayId"):
+                route_tables.append({"route_table_id": table["RouteTableId"], "nat_gateway_id": route["NatGatewayId"]})
+    groups = ec2.describe_security_groups(Filters=vpc_filter)["SecurityGroups"]
+    return {
+        "region": ec2.meta.region_name,
+        "vpc_id": vpc_id,
+        "cidr_block": vpc["CidrBlock"],
+        "security_group_ids": [g["GroupId"] for g in groups if g.get("GroupName") == "default"][:1],
+        "subnets": [{"subnet_id": s["SubnetId"], "cidr_block": s["CidrBlock"],
+                     "availability_zone": s["AvailabilityZone"]} for s in subnets],
+        "nat_gateways": [{"nat_gateway_id": n["NatGatewayId"],
+                          "availability_zone": subnet_zones.get(n.get("SubnetId"))} for n in nat_gateways],
+        "route_tables": route_tables,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Plan subnets, routing and network configurations for new workspaces.")
+    parser.add_argument("vpc", help="JSON file describing the VPC")
+    parser.add_argument("--workspaces", type=int, default=1)
+    parser.add_argument("--prefixlen", type=int, default=20)
+    parser.add_argument("--name-prefix", default="dbacademy")
+    parser.add_argument("--first-index", type=int, default=1, help="number of the first new workspace")
+    args = parser.parse_args(argv)
+
+    with open(args.vpc) as f:
+        vpc = json.load(f)
+    operations = plan_networks(vpc, args.workspaces, args.prefixlen, args.name_prefix,
+                               first_index=args.first_index)
+    json.dump([op.to_json() for op in operations], sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
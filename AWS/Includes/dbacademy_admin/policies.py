@@ -0,0 +1,276 @@
+"""
+Compiled templates for the IAM, trust, bucket and KMS policies used in the labs.
+
+The labs embed these policies with placeholders such as ``<BUCKET>`` and
+``<DATABRICKS_ACCOUNT_ID>`` to be filled in by hand. A ``PolicyTemplate`` is
+serialized once into canonical JSON (sorted keys, no whitespace) and split
+around its placeholders, so rendering is a string join. Rendered policies are
+byte-stable: the same parameters always give the same bytes, and
+``canonical(json.loads(text)) == text``, so policies can be compared by hash,
+including against documents read back from AWS.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Tuple
+
+# AWS account in which the Databricks control plane runs.
+DATABRICKS_AWS_ACCOUNT_ID = "414351767826"
+UC_MASTER_ROLE_ARN = f"arn:aws:iam::{DATABRICKS_AWS_ACCOUNT_ID}:role/unity-catalog-prod-UCMasterRole-14S5ZJVKOTYTL"
+
+_PLACEHOLDER = re.compile(r"<([A-Z][A-Z0-9_]*)>")
+
+_SPOT_SERVICE_LINKED_ROLE_STATEMENT = {
+    "Effect": "Allow",
+    "Action": ["iam:CreateServiceLinkedRole", "iam:PutRolePolicy"],
+    "Resource": "arn:aws:iam::*:role/aws-service-role/spot.amazonaws.com/AWSServiceRoleForEC2Spot",
+    "Condition": {"StringLike": {"iam:AWSServiceName": "spot.amazonaws.com"}},
+}
+
+# Inline policy of the cross-account role for Databricks-managed VPCs.
+CROSS_ACCOUNT_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Sid": "Stmt1403287045000",
+            "Effect": "Allow",
+            "Action": [
+                "ec2:AllocateAddress", "ec2:AssociateDhcpOptions", "ec2:AssociateIamInstanceProfile",
+                "ec2:AssociateRouteTable", "ec2:AttachInternetGateway", "ec2:AttachVolume",
+                "ec2:AuthorizeSecurityGroupEgress", "ec2:AuthorizeSecurityGroupIngress",
+                "ec2:CancelSpotInstanceRequests", "ec2:CreateDhcpOptions", "ec2:CreateInternetGateway",
+                "ec2:CreateNatGateway", "ec2:CreateRoute", "ec2:CreateRouteTable", "ec2:CreateSecurityGroup",
+                "ec2:CreateSubnet", "ec2:CreateTags", "ec2:CreateVolume", "ec2:CreateVpc",
+                "ec2:CreateVpcEndpoint", "ec2:DeleteDhcpOptions", "ec2:DeleteInternetGateway",
+                "ec2:DeleteNatGateway", "ec2:DeleteRoute", "ec2:DeleteRouteTable", "ec2:DeleteSecurityGroup",
+                "ec2:DeleteSubnet", "ec2:DeleteTags", "ec2:DeleteVolume", "ec2:DeleteVpc",
+                "ec2:DeleteVpcEndpoints", "ec2:DescribeAvailabilityZones",
+                "ec2:DescribeIamInstanceProfileAssociations", "ec2:DescribeInstanceStatus",
+                "ec2:DescribeInstances", "ec2:DescribeInternetGateways", "ec2:DescribeNatGateways",
+                "ec2:DescribePrefixLists", "ec2:DescribeReservedInstancesOfferings", "ec2:DescribeRouteTables",
+                "ec2:DescribeSecurityGroups", "ec2:DescribeSpotInstanceRequests",
+                "ec2:DescribeSpotPriceHistory", "ec2:DescribeSubnets", "ec2:DescribeVolumes",
+                "ec2:DescribeVpcs", "ec2:DetachInternetGateway", "ec2:DisassociateIamInstanceProfile",
+                "ec2:DisassociateRouteTable", "ec2:ModifyVpcAttribute", "ec2:ReleaseAddress",
+                "ec2:ReplaceIamInstanceProfileAssociation", "ec2:RequestSpotInstances",
+                "ec2:RevokeSecurityGroupEgress", "ec2:RevokeSecurityGroupIngress", "ec2:RunInstances",
+                "ec2:TerminateInstances",
+            ],
+            "Resource": ["*"],
+        },
+        _SPOT_SERVICE_LINKED_ROLE_STATEMENT,
+    ],
+}
+
+# Reduced inline policy of the cross-account role for customer-managed VPCs.
+CROSS_ACCOUNT_POLICY_NOVPC = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Sid": "Stmt1403287045000",
+            "Effect": "Allow",
+            "Action": [
+                "ec2:AssociateIamInstanceProfile", "ec2:AttachVolume", "ec2:AuthorizeSecurityGroupEgress",
+                "ec2:AuthorizeSecurityGroupIngress", "ec2:CancelSpotInstanceRequests", "ec2:CreateTags",
+                "ec2:CreateVolume", "ec2:DeleteTags", "ec2:DeleteVolume", "ec2:DescribeAvailabilityZones",
+                "ec2:DescribeIamInstanceProfileAssociations", "ec2:DescribeInstanceStatus",
+                "ec2:DescribeInstances", "ec2:DescribeInternetGateways", "ec2:DescribeNatGateways",
+                "ec2:DescribeNetworkAcls", "ec2:DescribePrefixLists", "ec2:DescribeReservedInstancesOfferings",
+                "ec2:DescribeRouteTables", "ec2:DescribeSecurityGroups", "ec2:DescribeSpotInstanceRequests",
+                "ec2:DescribeSpotPriceHistory", "ec2:DescribeSubnets", "ec2:DescribeVolumes",
+                "ec2:DescribeVpcAttribute", "ec2:DescribeVpcs", "ec2:DetachInternetGateway",
+                "ec2:DetachVolume", "ec2:DisassociateIamInstanceProfile",
+                "ec2:ReplaceIamInstanceProfileAssociation", "ec2:RequestSpotInstances",
+                "ec2:RevokeSecurityGroupEgress", "ec2:RevokeSecurityGroupIngress", "ec2:RunInstances",
+                "ec2:TerminateInstances",
+            ],
+            "Resource": ["*"],
+        },
+        _SPOT_SERVICE_LINKED_ROLE_STATEMENT,
+    ],
+}
+
+# Trust policy of the cross-account role ("Another AWS account" with an external id).
+CROSS_ACCOUNT_TRUST_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Principal": {"AWS": f"arn:aws:iam::{DATABRICKS_AWS_ACCOUNT_ID}:root"},
+            "Action": "sts:AssumeRole",
+            "Condition": {"StringEquals": {"sts:ExternalId": "<DATABRICKS_ACCOUNT_ID>"}},
+        }
+    ],
+}
+
+# Bucket policy produced by "Generate policy" for workspace root storage.
+ROOT_BUCKET_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Sid": "Grant Databricks Access",
+            "Effect": "Allow",
+            "Principal": {"AWS": f"arn:aws:iam::{DATABRICKS_AWS_ACCOUNT_ID}:root"},
+            "Action": [
+                "s3:GetObject", "s3:GetObjectVersion", "s3:PutObject", "s3:DeleteObject",
+                "s3:ListBucket", "s3:GetBucketLocation",
+            ],
+            "Resource": ["arn:aws:s3:::<BUCKET>/*", "arn:aws:s3:::<BUCKET>"],
+            "Condition": {"StringEquals": {"aws:PrincipalTag/DatabricksAccountId": ["<DATABRICKS_ACCOUNT_ID>"]}},
+        }
+    ],
+}
+
+# Permissions policy of the Unity Catalog metastore role.
+METASTORE_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Action": [
+                "s3:GetObject", "s3:PutObject", "s3:DeleteObject", "s3:ListBucket",
+                "s3:GetBucketLocation", "s3:GetLifecycleConfiguration", "s3:PutLifecycleConfiguration",
+            ],
+            "Resource": ["arn:aws:s3:::<BUCKET>/*", "arn:aws:s3:::<BUCKET>"],
+            "Effect": "Allow",
+        },
+        {
+            "Action": ["sts:AssumeRole"],
+            "Resource": ["arn:aws:iam::<AWS_ACCOUNT_ID>:role/<AWS_IAM_ROLE_NAME>"],
+            "Effect": "Allow",
+        },
+    ],
+}
+
+# Custom trust policy of the Unity Catalog metastore role.
+METASTORE_TRUST_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Principal": {"AWS": UC_MASTER_ROLE_ARN},
+            "Action": "sts:AssumeRole",
+            "Condition": {"StringEquals": {"sts:ExternalId": "<DATABRICKS_ACCOUNT_ID>"}},
+        }
+    ],
+}
+
+_DATABRICKS_ACCOUNT_CONDITION = {"StringEquals": {"aws:PrincipalTag/DatabricksAccountId": "<DATABRICKS_ACCOUNT_ID>"}}
+
+# Default key policy plus the four statements from the customer-managed keys lab.
+KMS_KEY_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Sid": "Enable IAM User Permissions",
+            "Effect": "Allow",
+            "Principal": {"AWS": "arn:aws:iam::<AWS_ACCOUNT_ID>:root"},
+            "Action": "kms:*",
+            "Resource": "*",
+        },
+        {
+            "Sid": "Allow Databricks to use KMS key for DBFS",
+            "Effect": "Allow",
+            "Principal": {"AWS": f"arn:aws:iam::{DATABRICKS_AWS_ACCOUNT_ID}:root"},
+            "Action": ["kms:Encrypt", "kms:Decrypt", "kms:ReEncrypt*", "kms:GenerateDataKey*", "kms:DescribeKey"],
+            "Resource": "*",
+            "Condition": _DATABRICKS_ACCOUNT_CONDITION,
+        },
+        {
+            "Sid": "Allow Databricks to use KMS key for DBFS (Grants)",
+            "Effect": "Allow",
+            "Principal": {"AWS": f"arn:aws:iam::{DATABRICKS_AWS_ACCOUNT_ID}:root"},
+            "Action": ["kms:CreateGrant", "kms:ListGrants", "kms:RevokeGrant"],
+            "Resource": "*",
+            "Condition": dict(_DATABRICKS_ACCOUNT_CONDITION, Bool={"kms:GrantIsForAWSResource": "true"}),
+        },
+        {
+            "Sid": "Allow Databricks to use KMS key for EBS",
+            "Effect": "Allow",
+            "Principal": {"AWS": f"arn:aws:iam::{DATABRICKS_AWS_ACCOUNT_ID}:root"},
+            "Action": ["kms:Decrypt", "kms:GenerateDataKey*", "kms:CreateGrant", "kms:DescribeKey"],
+            "Resource": "*",
+            "Condition": {"ForAnyValue:StringLike": {"kms:ViaService": "ec2.*.amazonaws.com"}},
+        },
+        {
+            "Sid": "Allow Databricks to use KMS key for managed services in the control plane",
+            "Effect": "Allow",
+            "Principal": {"AWS": f"arn:aws:iam::{DATABRICKS_AWS_ACCOUNT_ID}:root"},
+            "Action": ["kms:Encrypt", "kms:Decrypt"],
+            "Resource": "*",
+            "Condition": _DATABRICKS_ACCOUNT_CONDITION,
+        },
+    ],
+}
+
+
+def canonical(document: Any) -> str:
+    """Serialize a policy document the way rendered templates are serialized."""
+    return json.dumps(document, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PolicyTemplate:
+    """A policy document with ``<NAME>`` placeholders, compiled for fast rendering."""
+
+    def __init__(self, document: Any):
+        pieces = _PLACEHOLDER.split(canonical(document))
+        # Literal text alternates with placeholder names: lit, name, lit, ..., lit.
+        self._literals: List[str] = pieces[0::2]
+        self._slots: List[str] = pieces[1::2]
+        self.placeholders: Tuple[str, ...] = tuple(dict.fromkeys(self._slots))
+
+    def render(self, params: Mapping[str, str]) -> str:
+        try:
+            # JSON-escape each value once, without the surrounding quotes.
+            values = {name: json.dumps(str(params[name]), ensure_ascii=False)[1:-1] for name in self.placeholders}
+        except KeyError as e:
+            raise ValueError(f"Missing value for placeholder <{e.args[0]}>") from None
+        literals = self._literals
+        out = [literals[0]]
+        for i, name in enumerate(self._slots, start=1):
+            out.append(values[name])
+            out.append(literals[i])
+        return "".join(out)
+
+    def render_many(self, rows: Iterable[Mapping[str, str]]) -> Iterator[str]:
+        for params in rows:
+            yield self.render(params)
+
+
+TEMPLATES: Dict[str, PolicyTemplate] = {
+    "cross_account": PolicyTemplate(CROSS_ACCOUNT_POLICY),
+    "cross_account_novpc": PolicyTemplate(CROSS_ACCOUNT_POLICY_NOVPC),
+    "cross_account_trust": PolicyTemplate(CROSS_ACCOUNT_TRUST_POLICY),
+    "root_bucket": PolicyTemplate(ROOT_BUCKET_POLICY),
+    "metastore": PolicyTemplate(METASTORE_POLICY),
+    "metastore_trust": PolicyTemplate(METASTORE_TRUST_POLICY),
+    "kms_key": PolicyTemplate(KMS_KEY_POLICY),
+}
+
+
+@dataclass(frozen=True)
+class RenderedPolicy:
+    template: str
+    key: str
+    text: str
+    sha256: str
+
+
+def render_batch(jobs: Iterable[Tuple[str, str, Mapping[str, str]]]) -> List[RenderedPolicy]:
+    """Render ``(template name, key, parameters)`` jobs, e.g. one per workspace, metastore and key.
+
+    ``key`` identifies the rendered policy in the result, such as a bucket or
+    role name.
+    """
+    result = []
+    for name, key, params in jobs:
+        text = TEMPLATES[name].render(params)
+        result.append(RenderedPolicy(name, key, text, digest(text)))
+    return result
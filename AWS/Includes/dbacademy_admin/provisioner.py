@@ -0,0 +1,330 @@
+"""
+Provisioning a workspace and everything it depends on as a dependency graph.
+
+The labs set a workspace up in a fixed manual order: the cross-account IAM
+role, the credential configuration, the root bucket and its policy, the
+storage configuration, the VPC and the network configuration, the key
+configuration, then the workspace and its metastore assignment. Only some of
+those steps depend on each other. ``Provisioner`` takes the steps as typed
+``Resource`` objects, whose parameters may refer to the ``Output`` of other
+resources, and runs every resource as soon as the ones it depends on are
+done, so the IAM role, the bucket and the VPC proceed in parallel and the
+whole setup takes as long as its critical path.
+
+Each resource ``kind`` is carried out by a handler, a function from the
+resolved parameters to the resource's outputs. ``account_handlers`` provides
+the handlers for the Account API resources. The AWS resources of
+``workspace_resources`` get theirs from ``iam.role_handlers``,
+``s3.bucket_handlers``, ``vpc.vpc_handlers`` and ``kms.kms_handlers``.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+from .client import JSON, AccountClient
+from .journal import Journal, create_once, find_by_name
+from .retry import RetryPolicy, TokenBucket, call_with_retry, for_creates
+from .watch import AdaptiveSchedule, WorkspaceWatcher
+
+Handler = Callable[[JSON], JSON]
+
+
+@dataclass(frozen=True)
+class Output:
+    """The value of ``key`` in the outputs of resource ``resource``."""
+
+    resource: str
+    key: str
+
+
+def _walk(value: Any, visit: Callable[[Output], Any]) -> Any:
+    if isinstance(value, Output):
+        return visit(value)
+    if isinstance(value, list):
+        return [_walk(v, visit) for v in value]
+    if isinstance(value, dict):
+        return {k: _walk(v, visit) for k, v in value.items()}
+    return value
+
+
+@dataclass
+class Resource:
+    name: str
+    kind: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    depends_on: Tuple[str, ...] = ()
+
+    def dependencies(self) -> Set[str]:
+        """Resources named in ``depends_on`` or referred to by an ``Output`` in the parameters."""
+        found = set(self.depends_on)
+        _walk(self.params, lambda output: found.add(output.resource))
+        return found
+
+
+@dataclass
+class StepRecord:
+    started: float = 0.0
+    finished: float = 0.0
+    error: Optional[Exception] = None
+
+    @property
+    def duration(self) -> float:
+        return self.finished - self.started
+
+
+@dataclass
+class ProvisionResult:
+    outputs: Dict[str, JSON] = field(default_factory=dict)
+    steps: Dict[str, StepRecord] = field(default_factory=dict)
+    # Resources not attempted because something they depend on failed.
+    skipped: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def failed(self) -> Dict[str, Exception]:
+        return {name: step.error for name, step in self.steps.items() if step.error is not None}
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed and not self.skipped
+
+
+class Provisioner:
+    """Runs a set of resources concurrently in dependency order."""
+
+    def __init__(self, resources: Sequence[Resource], handlers: Mapping[str, Handler]):
+        self.resources: Dict[str, Resource] = {}
+        for resource in resources:
+            if resource.name in self.resources:
+                raise ValueError(f"Duplicate resource name: {resource.name}")
+            if resource.kind not in handlers:
+                raise ValueError(f"No handler for {resource.name} of kind {resource.kind}")
+            self.resources[resource.name] = resource
+        self.handlers = dict(handlers)
+        self.dependencies: Dict[str, Set[str]] = {}
+        self.dependents: Dict[str, List[str]] = {name: [] for name in self.resources}
+        for name, resource in self.resources.items():
+            dependencies = resource.dependencies()
+            unknown = dependencies - set(self.resources)
+            if unknown:
+                raise ValueError(f"{name} depends on unknown resources: {', '.join(sorted(unknown))}")
+            self.dependencies[name] = dependencies
+            for dependency in dependencies:
+                self.dependents[dependency].append(name)
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        remaining = {name: len(deps) for name, deps in self.dependencies.items()}
+        ready = [name for name, count in remaining.items() if count == 0]
+        order = []
+        while ready:
+            name = ready.pop()
+            order.append(name)
+            for dependent in self.dependents[name]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) != len(self.resources):
+            cycle = sorted(name for name, count in remaining.items() if count > 0)
+            raise ValueError(f"Dependency cycle between: {', '.join(cycle)}")
+        return order
+
+    def levels(self) -> List[List[str]]:
+        """Resources grouped by their depth in the graph; each group could run at once."""
+        depth: Dict[str, int] = {}
+        for name in self.order:
+            depth[name] = 1 + max((depth[d] for d in self.dependencies[name]), default=-1)
+        result: List[List[str]] = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+        for name in self.order:
+            result[depth[name]].append(name)
+        return result
+
+    def run(self, max_workers: int = 8, clock: Callable[[], float] = time.monotonic) -> ProvisionResult:
+        """Provision every resource; a failure only stops the resources that depend on it."""
+        result = ProvisionResult()
+        remaining = {name: len(deps) for name, deps in self.dependencies.items()}
+        lock = threading.Lock()
+        started = clock()
+
+        def execute(name: str) -> JSON:
+            resource = self.resources[name]
+            with lock:
+                params = _walk(resource.params, lambda o: result.outputs[o.resource][o.key])
+            return self.handlers[resource.kind](params) or {}
+
+        def skip(name: str) -> None:
+            for dependent in self.dependents[name]:
+                if dependent not in result.skipped:
+                    result.skipped.append(dependent)
+                    skip(dependent)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running: Dict[Future, str] = {}
+
+            def submit(name: str) -> None:
+                result.steps[name] = StepRecord(started=clock() - started)
+                running[executor.submit(execute, name)] = name
+
+            for name in self.order:
+                if remaining[name] == 0:
+                    submit(name)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    step = result.steps[name]
+                    step.finished = clock() - started
+                    step.error = future.exception()
+                    if step.error is not None:
+                        skip(name)
+                        continue
+                    with lock:
+                        result.outputs[name] = future.result()
+                    for dependent in self.dependents[name]:
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0 and dependent not in result.skipped:
+                            submit(dependent)
+        result.elapsed = clock() - started
+        return result
+
+    def critical_path(self, result: ProvisionResult) -> Tuple[List[str], float]:
+        """The chain of dependent resources with the longest total duration in a run."""
+        best: Dict[str, Tuple[float, Optional[str]]] = {}
+        for name in self.order:
+            step = result.steps.get(name)
+            if step is None:
+                continue
+            previous = max(((best[d][0], d) for d in self.dependencies[name] if d in best), default=(0.0, None))
+            best[name] = (previous[0] + step.duration, previous[1])
+        if not best:
+            return [], 0.0
+        name: Optional[str] = max(best, key=lambda n: best[n][0])
+        total = best[name][0]
+        path = []
+        while name is not None:
+            path.append(name)
+            name = best[name][1]
+        return path[::-1], total
+
+
+def account_handlers(client: AccountClient, limiter: Optional[TokenBucket] = None,
+                     retry: Optional[RetryPolicy] = None, schedule: Optional[AdaptiveSchedule] = None,
+                     journal: Optional[Journal] = None) -> Dict[str, Handler]:
+    """Handlers for the Account API resource kinds.
+
+    ``workspace`` resources wait until the workspace is ``RUNNING``, polling on
+    ``schedule``, so that resources depending on them see a usable workspace.
+    With a ``journal``, every create goes through ``journal.create_once``: a
+    resumed run reuses what an interrupted one created instead of creating
+    it again; without one, creates are only retried as ``retry.for_creates``
+    allows.
+    """
+
+    def call(function, *args):
+        return call_with_retry(lambda: function(*args), retry, limiter)
+
+    def create(collection: str, name: str, params: JSON, function, *args) -> JSON:
+        if journal is None:
+            return call_with_retry(lambda: function(*args), for_creates(retry), limiter)
+        return create_once(journal, f"{collection}/{name}", lambda: function(*args),
+                           lambda: find_by_name(client, collection, name), retry, limiter, params)
+
+    def workspace(params: JSON) -> JSON:
+        created = create("workspaces", params["workspace_name"], params, client.create_workspace, params)
+        watcher = WorkspaceWatcher(client, schedule)
+        watcher.add(created["workspace_id"])
+        for event in watcher.watch():
+            if event.done and event.status != "RUNNING":
+                raise RuntimeError(f"Workspace {params.get('workspace_name')} is {event.status}: {event.message}")
+        return created
+
+    def metastore_assignment(params: JSON) -> JSON:
+        workspace_id, metastore_id = params["workspace_id"], params["metastore_id"]
+        if journal is None:
+            call(client.assign_metastore, workspace_id, metastore_id)
+            return dict(params)
+
+        def assign() -> JSON:
+            client.assign_metastore(workspace_id, metastore_id)
+            return dict(params)
+
+        def find() -> Optional[JSON]:
+            return dict(params) if int(workspace_id) in client.list_metastore_workspaces(metastore_id) else None
+
+        return create_once(journal, f"metastores/{metastore_id}/workspaces/{workspace_id}", assign, find,
+                           retry, limiter, params)
+
+    return {
+        "credentials": lambda p: create("credentials", p["credentials_name"], p, client.create_credentials,
+                                        p["credentials_name"], p["role_arn"]),
+        "storage_configuration": lambda p: create("storage-configurations", p["storage_configuration_name"], p,
+                                                  client.create_storage_configuration,
+                                                  p["storage_configuration_name"], p["bucket_name"]),
+        "network": lambda p: create("networks", p["network_name"], p, client.create_network, p["network_name"],
+                                    p["vpc_id"], p["subnet_ids"], p["security_group_ids"]),
+        "customer_managed_key": lambda p: create("customer-managed-keys", p["key_arn"], p,
+                                                 client.create_customer_managed_key, p["key_arn"], p["key_alias"],
+                                                 tuple(p.get("use_cases", ("STORAGE", "MANAGED_SERVICES")))),
+        "workspace": workspace,
+        "metastore_assignment": metastore_assignment,
+    }
+
+
+def workspace_resources(prefix: str, region: str = "us-east-1", metastore_id: Optional[str] = None,
+                        customer_managed_key: bool = False) -> List[Resource]:
+    """The resources of the labs' workspace setup, named after ``prefix``.
+
+    The AWS resources are of kind ``iam_role`` (outputs ``role_arn``),
+    ``s3_bucket`` (``bucket_name``), ``s3_bucket_policy``, ``vpc`` (``vpc_id``,
+    ``subnet_ids``, ``security_group_ids``) and, with
+    ``customer_managed_key``, ``kms_key`` (``key_arn``, ``key_alias``); together
+    with ``account_handlers``, the handlers listed in the module docstring run
+    them all.
+    """
+    resources = [
+        Resource(f"{prefix}-role", "iam_role", {"role_name": f"{prefix}-role"}),
+        Resource(f"{prefix}-credentials", "credentials", {
+            "credentials_name": f"{prefix}-credentials", "role_arn": Output(f"{prefix}-role", "role_arn"),
+        }),
+        Resource(f"{prefix}-bucket", "s3_bucket", {"bucket_name": f"{prefix}-bucket", "region": region}),
+        Resource(f"{prefix}-bucket-policy", "s3_bucket_policy", {
+            "bucket_name": Output(f"{prefix}-bucket", "bucket_name"),
+        }),
+        Resource(f"{prefix}-storage", "storage_configuration", {
+            "storage_configuration_name": f"{prefix}-storage",
+            "bucket_name": Output(f"{prefix}-bucket", "bucket_name"),
+        }),
+        Resource(f"{prefix}-vpc", "vpc", {"vpc_name": f"{prefix}-vpc", "region": region}),
+        Resource(f"{prefix}-network", "network", {
+            "network_name": f"{prefix}-network",
+            "vpc_id": Output(f"{prefix}-vpc", "vpc_id"),
+            "subnet_ids": Output(f"{prefix}-vpc", "subnet_ids"),
+            "security_group_ids": Output(f"{prefix}-vpc", "security_group_ids"),
+        }),
+    ]
+    workspace = {
+        "workspace_name": prefix,
+        "aws_region": region,
+        "credentials_id": Output(f"{prefix}-credentials", "credentials_id"),
+        "storage_configuration_id": Output(f"{prefix}-storage", "storage_configuration_id"),
+        "network_id": Output(f"{prefix}-network", "network_id"),
+    }
+    if customer_managed_key:
+        resources.append(Resource(f"{prefix}-kms-key", "kms_key", {"alias": f"alias/{prefix}", "region": region}))
+        resources.append(Resource(f"{prefix}-cmk", "customer_managed_key", {
+            "key_arn": Output(f"{prefix}-kms-key", "key_arn"),
+            "key_alias": Output(f"{prefix}-kms-key", "key_alias"),
+        }))
+        workspace["managed_services_customer_managed_key_id"] = Output(f"{prefix}-cmk", "customer_managed_key_id")
+        workspace["storage_customer_managed_key_id"] = Output(f"{prefix}-cmk", "customer_managed_key_id")
+    resources.append(Resource(prefix, "workspace", workspace, depends_on=(f"{prefix}-bucket-policy",)))
+    if metastore_id is not None:
+        resources.append(Resource(f"{prefix}-metastore-assignment", "metastore_assignment", {
+            "workspace_id": Output(prefix, "workspace_id"), "metastore_id": metastore_id,
+        }))
+    return resources
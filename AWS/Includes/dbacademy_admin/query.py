@@ -0,0 +1,373 @@
+"""
+Indexed queries over the cached fleet inventory.
+
+``FleetIndex`` keeps a secondary index per field in ``INDEXED_FIELDS``: a
+dictionary from value to rows, for equality and ``in`` in O(1), and the
+sorted distinct values, for ranges and ``like`` patterns in O(log n) plus
+the matches. Queries are written in a small filter language:
+
+    aws_region = "us-east-1" and storage_customer_managed_key_id is null
+    credentials_id = "7e9a..." or network_id in ("n-1", "n-2")
+    not workspace_status = RUNNING and workspace_name like "dbacademy-*"
+
+Comparisons are ``=``, ``!=``, ``<``, ``<=``, ``>``, ``>=``, ``in (...)``,
+``like`` (with ``*`` and ``?``), ``is null`` and ``is not null``, combined with
+``and``, ``or``, ``not`` and parentheses. Values are quoted strings, numbers
+or bare words. Fields without an index are matched by a scan of the rows the
+rest of the expression leaves.
+
+    python -m dbacademy_admin.query 'aws_region = us-east-1 and storage_customer_managed_key_id is null'
+
+answers from the lists in the local ``InventoryCache``, however old, with no
+Account API call.
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import bisect
+import fnmatch
+import json
+import operator
+import re
+import sys
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from .cache import DEFAULT_PATH, InventoryCache
+from .client import COLLECTIONS, JSON
+from .streaming import project
+
+INDEXED_FIELDS = (
+    "account_id",
+    "aws_region",
+    "workspace_status",
+    "credentials_id",
+    "storage_configuration_id",
+    "network_id",
+    "managed_services_customer_managed_key_id",
+    "storage_customer_managed_key_id",
+)
+
+_TOKEN = re.compile(r"""\s*(?:(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')|(?P<op><=|>=|!=|=|<|>|\(|\)|,)"""
+                    r"""|(?P<word>[^\s()<>=!,"']+))""")
+
+_KEYWORDS = {"and", "or", "not", "in", "is", "null", "like"}
+
+_OPERATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+class QueryError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class _Compare:
+    field: str
+    op: str
+    value: Any
+
+
+@dataclass(frozen=True)
+class _Bool:
+    op: str
+    operands: Tuple[Any, ...]
+
+
+Expression = Union[_Compare, _Bool]
+
+
+def _tokenize(text: str) -> List[Tuple[str, Any]]:
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise QueryError(f"Unexpected character at {position}: {text[position:position + 10]!r}")
+        position = match.end()
+        if match.group("string") is not None:
+            tokens.append(("value", ast.literal_eval(match.group("string"))))
+        elif match.group("op") is not None:
+            tokens.append(("op", match.group("op")))
+        else:
+            word = match.group("word")
+            if word.lower() in _KEYWORDS:
+                tokens.append(("keyword", word.lower()))
+            else:
+                try:
+                    tokens.append(("word", int(word)))
+                except ValueError:
+                    tokens.append(("word", word))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.tokens = _tokenize(text)
+        self.position = 0
+
+    def peek(self) -> Optional[Tuple[str, Any]]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, kind: Optional[str] = None, value: Any = None) -> Tuple[str, Any]:
+        token = self.peek()
+        if token is None or (kind is not None and token[0] != kind) or (value is not None and token[1] != value):
+            expected = value or kind or "more input"
+            raise QueryError(f"Expected {expected} but found {token[1] if token else 'end of query'}")
+        self.position += 1
+        return token
+
+    def accept(self, kind: str, value: Any) -> bool:
+        if self.peek() == (kind, value):
+            self.position += 1
+            return True
+        return False
+
+    def parse(self) -> Expression:
+        expression = self.disjunction()
+        if self.peek() is not None:
+            raise QueryError(f"Unexpected {self.peek()[1]}")
+        return expression
+
+    def disjunction(self) -> Expression:
+        operands = [self.conjunction()]
+        while self.accept("keyword", "or"):
+            operands.append(self.conjunction())
+        return operands[0] if len(operands) == 1 else _Bool("or", tuple(operands))
+
+    def conjunction(self) -> Expression:
+        operands = [self.negation()]
+        while self.accept("keyword", "and"):
+            operands.append(self.negation())
+        return operands[0] if len(operands) == 1 else _Bool("and", tuple(operands))
+
+    def negation(self) -> Expression:
+        if self.accept("keyword", "not"):
+            return _Bool("not", (self.negation(),))
+        if self.accept("op", "("):
+            expression = self.disjunction()
+            self.take("op", ")")
+            return expression
+        return self.comparison()
+
+    def value(self) -> Any:
+        kind, value = self.take()
+        if kind == "keyword" and value == "null":
+            return None
+        if kind not in ("value", "word"):
+            raise QueryError(f"Expected a value but found {value}")
+        return value
+
+    def comparison(self) -> Expression:
+        kind, field = self.take()
+        if kind != "word" or not isinstance(field, str):
+            raise QueryError(f"Expected a field name but found {field}")
+        if self.accept("keyword", "is"):
+            negated = self.accept("keyword", "not")
+            self.take("keyword", "null")
+            return _Compare(field, "!=" if negated else "=", None)
+        if self.accept("keyword", "in"):
+            self.take("op", "(")
+            values = [self.value()]
+            while self.accept("op", ","):
+                values.append(self.value())
+            self.take("op", ")")
+            return _Compare(field, "in", tuple(values))
+        if self.accept("keyword", "like"):
+            return _Compare(field, "like", str(self.value()))
+        _, op = self.take("op")
+        if op not in ("=", "!=", "<", "<=", ">", ">="):
+            raise QueryError(f"Unexpected {op} after {field}")
+        return _Compare(field, op, self.value())
+
+
+def parse(text: str) -> Expression:
+    return _Parser(text).parse()
+
+
+def _key(value: Any) -> Tuple[str, Any]:
+    """Sort key that keeps numbers and strings apart."""
+    return ("0", value) if isinstance(value, (int, float)) else ("1", str(value))
+
+
+class _Index:
+    def __init__(self):
+        self.rows: Dict[Any, List[int]] = {}
+        self.keys: List[Tuple[str, Any]] = []
+
+    def add(self, value: Any, row: int) -> None:
+        rows = self.rows.get(value)
+        if rows is None:
+            rows = self.rows[value] = []
+            if value is not None:
+                bisect.insort(self.keys, _key(value))
+        rows.append(row)
+
+    def range(self, op: str, value: Any) -> Set[int]:
+        key = _key(value)
+        if op in ("<", "<="):
+            low = bisect.bisect_left(self.keys, (key[0],))
+            high = bisect.bisect_right(self.keys, key) if op == "<=" else bisect.bisect_left(self.keys, key)
+        else:
+            low = bisect.bisect_left(self.keys, key) if op == ">=" else bisect.bisect_right(self.keys, key)
+            high = bisect.bisect_left(self.keys, (chr(ord(key[0]) + 1),))
+        return {row for _, v in self.keys[low:high] for row in self.rows[v]}
+
+    def like(self, pattern: str) -> Set[int]:
+        prefix = re.split(r"[*?\[]", pattern, 1)[0]
+        low = bisect.bisect_left(self.keys, ("1", prefix))
+        high = bisect.bisect_left(self.keys, ("1", prefix + "\U0010ffff"))
+        return {row for _, v in self.keys[low:high] if fnmatch.fnmatchcase(v, pattern) for row in self.rows[v]}
+
+
+class FleetIndex:
+    """Objects with secondary indexes on ``fields``, queried with the filter language."""
+
+    def __init__(self, objects: Iterable[JSON], fields: Sequence[str] = INDEXED_FIELDS):
+        self.rows: List[JSON] = list(objects)
+        self.indexes: Dict[str, _Index] = {field: _Index() for field in fields}
+        for row, obj in enumerate(self.rows):
+            for field, index in self.indexes.items():
+                index.add(obj.get(field), row)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _predicate(self, node: _Compare) -> Callable[[Any], bool]:
+        op, value = node.op, node.value
+        if op == "=":
+            return lambda v: v == value
+        if op == "!=":
+            return lambda v: v != value
+        if op == "in":
+            return lambda v: v in value
+        if op == "like":
+            return lambda v: isinstance(v, str) and fnmatch.fnmatchcase(v, value)
+        compare = _OPERATORS[op]
+        if isinstance(value, (int, float)):
+            return lambda v: isinstance(v, (int, float)) and compare(v, value)
+        value = str(value)
+        return lambda v: v is not None and not isinstance(v, (int, float)) and compare(str(v), value)
+
+    def _lookup(self, node: _Compare) -> Optional[Set[int]]:
+        """Rows matching an indexed comparison, or None when it needs a scan."""
+        index = self.indexes.get(node.field)
+        if index is None or node.op == "!=":
+            return None
+        if node.op == "=":
+            return set(index.rows.get(node.value, ()))
+        if node.op == "in":
+            return {row for v in node.value for row in index.rows.get(v, ())}
+        if node.op == "like":
+            return index.like(node.value)
+        return index.range(node.op, node.value)
+
+    def _estimate(self, node: Expression) -> int:
+        """Upper bound on the rows an expression matches, for ordering conjunctions."""
+        if isinstance(node, _Compare):
+            index = self.indexes.get(node.field)
+            if index is not None and node.op == "=":
+                return len(index.rows.get(node.value, ()))
+            if index is not None and node.op == "in":
+                return sum(len(index.rows.get(v, ())) for v in node.value)
+            if index is not None and node.op == "!=":
+                return len(self.rows) - len(index.rows.get(node.value, ()))
+            # Other indexed comparisons still beat a scan.
+            return len(self.rows) if index is None else len(self.rows) - 1
+        if node.op == "and":
+            return min(self._estimate(operand) for operand in node.operands)
+        if node.op == "or":
+            return min(len(self.rows), sum(self._estimate(operand) for operand in node.operands))
+        return len(self.rows)
+
+    def _compare(self, node: _Compare, candidates: Optional[Set[int]]) -> Set[int]:
+        index = self.indexes.get(node.field)
+        if candidates is not None and (index is None or len(candidates) < self._estimate(node)):
+            # Fewer rows left than the index would return: check their values instead.
+            predicate = self._predicate(node)
+            return {row for row in candidates if predicate(self.rows[row].get(node.field))}
+        if node.op == "!=" and index is not None:
+            equal = index.rows.get(node.value, ())
+            return (set(range(len(self.rows))) if candidates is None else candidates).difference(equal)
+        rows = self._lookup(node)
+        if rows is None:
+            predicate = self._predicate(node)
+            return {row for row, obj in enumerate(self.rows) if predicate(obj.get(node.field))}
+        return rows if candidates is None else rows & candidates
+
+    def _evaluate(self, node: Expression, candidates: Optional[Set[int]] = None) -> Set[int]:
+        """Rows matching ``node`` among ``candidates`` (all rows when None)."""
+        if isinstance(node, _Compare):
+            return self._compare(node, candidates)
+        if node.op == "and":
+            # The most selective operand goes first; the rest only check what it left.
+            for operand in sorted(node.operands, key=self._estimate):
+                candidates = self._evaluate(operand, candidates)
+                if not candidates:
+                    break
+            return candidates
+        if node.op == "or":
+            result: Set[int] = set()
+            for operand in node.operands:
+                result |= self._evaluate(operand, candidates)
+            return result
+        universe = set(range(len(self.rows))) if candidates is None else candidates
+        return universe - self._evaluate(node.operands[0], candidates)
+
+    def select(self, expression: Union[str, Expression]) -> List[JSON]:
+        """The objects matching ``expression``, in their original order."""
+        node = parse(expression) if isinstance(expression, str) else expression
+        return [self.rows[row] for row in sorted(self._evaluate(node))]
+
+    def count(self, expression: Union[str, Expression]) -> int:
+        node = parse(expression) if isinstance(expression, str) else expression
+        return len(self._evaluate(node))
+
+
+def load_fleet(cache: InventoryCache, collection: str = "workspaces",
+               fields: Sequence[str] = INDEXED_FIELDS) -> FleetIndex:
+    """Index the cached lists of a collection across all accounts, tagging objects with ``account_id``.
+
+    Lists are used even when a write has marked them stale, with each object
+    replaced by the copy stored on its own, which is never older than the
+    list's. Objects created since an account was last listed are missing.
+    """
+    id_field = COLLECTIONS.get(collection)
+    singles = cache.objects(collection)
+    objects = []
+    for account_id, (listed, _) in sorted(cache.lists(collection).items()):
+        stored = singles.get(account_id, {})
+        for obj in listed:
+            current = stored.get(str(obj[id_field])) if id_field in obj else None
+            objects.append(dict(obj if current is None else current, account_id=account_id))
+    return FleetIndex(objects, fields)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Query the cached fleet inventory without calling the API.")
+    parser.add_argument("expression", help='e.g. \'aws_region = us-east-1 and storage_customer_managed_key_id is null\'')
+    parser.add_argument("--cache", default=DEFAULT_PATH, help="InventoryCache file")
+    parser.add_argument("--collection", default="workspaces")
+    parser.add_argument("--fields", help="comma-separated fields to print")
+    parser.add_argument("--count", action="store_true", help="only print the number of matches")
+    args = parser.parse_args(argv)
+
+    cache = InventoryCache(args.cache)
+    try:
+        fleet = load_fleet(cache, args.collection)
+        if args.count:
+            print(fleet.count(args.expression))
+            return
+        fields = args.fields.split(",") if args.fields else None
+        for obj in fleet.select(args.expression):
+            sys.stdout.write(json.dumps(project(obj, fields)) + "\n")
+    except QueryError as e:
+        parser.error(str(e))
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
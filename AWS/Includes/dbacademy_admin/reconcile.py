@@ -0,0 +1,394 @@
+"""
+Reconciling the account with a desired-state file.
+
+The file lists the objects the account should have, section by section, in
+the shape of the labs' ``POST`` payloads:
+
+    {
+      "credentials": [{"credentials_name": "dbacademy-test-credentials",
+                       "aws_credentials": {"sts_role": {"role_arn": "arn:aws:iam::123456789012:role/..."}}}],
+      "storage_configurations": [{"storage_configuration_name": "dbacademy-test-storage",
+                                  "root_bucket_info": {"bucket_name": "dbacademy-test-bucket"}}],
+      "networks": [...],
+      "customer_managed_keys": [{"use_cases": ["STORAGE"], "aws_key_info": {"key_arn": "...", "key_alias": "..."}}],
+      "workspaces": [{"workspace_name": "dbacademy-test", "aws_region": "us-east-1",
+                      "credentials_name": "dbacademy-test-credentials",
+                      "storage_configuration_name": "dbacademy-test-storage",
+                      "metastore_id": "..."}]
+    }
+
+Objects are matched with the live ones by name (key ARN for key
+configurations). Workspaces may refer to configurations by name, through
+the fields in ``REFERENCES``, including configurations the same plan creates.
+
+``plan`` normalizes every desired object, hashes it, and compares the hash
+with that of the live object projected onto the same fields, so an unchanged
+object costs one hash and no call. What is left is the minimal list of
+``POST``, ``PATCH`` and ``DELETE`` calls, which ``apply`` issues one stage at
+a time, concurrently within a stage.
+
+    python -m dbacademy_admin.reconcile fleet.json            # print the plan
+    python -m dbacademy_admin.reconcile fleet.json --apply
+    python -m dbacademy_admin.reconcile fleet.json --apply --journal apply.jsonl   # resumable
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Tuple
+
+from .client import COLLECTIONS, JSON, AccountApiError, AccountClient
+from .metastores import AssignmentPlanner, load_planner
+from .policies import canonical, digest
+from .retry import RetryPolicy, TokenBucket, call_with_retry, for_creates
+
+if TYPE_CHECKING:
+    from .journal import Journal
+
+# Desired-state section -> Account API collection, in the order they are created.
+SECTIONS = {
+    "credentials": "credentials",
+    "storage_configurations": "storage-configurations",
+    "networks": "networks",
+    "customer_managed_keys": "customer-managed-keys",
+    "workspaces": "workspaces",
+}
+
+# Section -> field naming its objects; key configurations are named by their key ARN.
+NAME_FIELDS = {
+    "credentials": "credentials_name",
+    "storage_configurations": "storage_configuration_name",
+    "networks": "network_name",
+    "workspaces": "workspace_name",
+}
+
+# Reference field of a desired workspace -> (section it names an object of, id field it stands for).
+REFERENCES = {
+    "credentials_name": ("credentials", "credentials_id"),
+    "storage_configuration_name": ("storage_configurations", "storage_configuration_id"),
+    "network_name": ("networks", "network_id"),
+    "managed_services_customer_managed_key_arn": ("customer_managed_keys", "managed_services_customer_managed_key_id"),
+    "storage_customer_managed_key_arn": ("customer_managed_keys", "storage_customer_managed_key_id"),
+}
+
+# Workspace fields that can only be set at creation.
+IMMUTABLE_WORKSPACE_FIELDS = frozenset({"workspace_name", "deployment_name", "aws_region"})
+
+
+def identity(section: str, obj: JSON) -> str:
+    """The name an object is matched by."""
+    if section == "customer_managed_keys":
+        return obj["aws_key_info"]["key_arn"]
+    return obj[NAME_FIELDS[section]]
+
+
+def normalize(value: Any) -> Any:
+    """Drop unset fields and order lists of scalars, so equal specs serialize equally.
+
+    A ``Created`` reference becomes a stand-in string that no live id equals,
+    so a field pointing at an object the plan creates always counts as changed.
+    """
+    if isinstance(value, Created):
+        return f"<created:{value.section}/{value.name}>"
+    if isinstance(value, dict):
+        return {k: normalize(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        items = [normalize(v) for v in value]
+        if all(isinstance(v, (str, int, float)) for v in items):
+            return sorted(items, key=lambda v: (type(v).__name__, v))
+        return items
+    return value
+
+
+def project(live: Any, desired: Any) -> Any:
+    """The part of a live object covered by the fields of a desired one."""
+    if isinstance(desired, dict) and isinstance(live, dict):
+        return {k: project(live.get(k), v) for k, v in desired.items()}
+    return live
+
+
+def spec_hash(spec: Any) -> str:
+    return digest(canonical(normalize(spec)))
+
+
+@dataclass(frozen=True)
+class Created:
+    """Id of an object created earlier in the same plan."""
+
+    section: str
+    name: str
+
+
+@dataclass
+class Change:
+    """One call. ``action`` is ``create``, ``update``, ``delete`` or ``assign``."""
+
+    action: str
+    section: str
+    name: str
+    object_id: Any = None
+    payload: Optional[JSON] = None
+    # For ``assign``: the metastore currently assigned, detached first.
+    previous: Optional[str] = None
+
+    def describe(self) -> str:
+        target = f"{self.section} {self.name}"
+        if self.action == "update":
+            return f"PATCH {target}: {', '.join(sorted(self.payload or {}))}"
+        if self.action == "assign":
+            detach = f", detaching {self.previous}" if self.previous else ""
+            return f"assign metastore {self.payload['metastore_id']} to workspace {self.name}{detach}"
+        return f"{dict(create='POST', delete='DELETE')[self.action]} {target}"
+
+
+@dataclass
+class Plan:
+    changes: List[Change] = field(default_factory=list)
+    unchanged: int = 0
+    # Differences the Account API cannot apply, by object.
+    conflicts: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def writes(self) -> int:
+        return len(self.changes)
+
+
+@dataclass
+class LiveState:
+    """Live objects of each section, by identity."""
+
+    objects: Dict[str, Dict[str, JSON]]
+    planner: Optional[AssignmentPlanner] = None
+
+    @classmethod
+    def load(cls, client: AccountClient, metastores: bool = True, max_workers: int = 8) -> "LiveState":
+        """List every section once, concurrently; with a client cache, fresh lists are not fetched again."""
+        sections = list(SECTIONS)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            assignments = executor.submit(load_planner, client) if metastores else None
+            lists = list(executor.map(lambda s: client.request("GET", "/" + SECTIONS[s]), sections))
+            planner = assignments.result() if assignments is not None else None
+        objects = {s: {identity(s, o): o for o in (listed or [])} for s, listed in zip(sections, lists)}
+        return cls(objects, planner)
+
+
+def plan(desired: Mapping[str, List[JSON]], live: LiveState, prune: bool = False) -> Plan:
+    """The calls needed to bring the live state to the desired one.
+
+    With ``prune``, objects of the listed sections that are not in the desired
+    state are deleted; otherwise they are left alone.
+    """
+    unknown = set(desired) - set(SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown sections: {', '.join(sorted(unknown))}")
+    result = Plan()
+    creating: Dict[str, set] = {section: set() for section in SECTIONS}
+
+    for section, collection in SECTIONS.items():
+        id_field = COLLECTIONS[collection]
+        current = live.objects.get(section, {})
+        wanted = {}
+        for spec in desired.get(section, []):
+            name = identity(section, spec)
+            if name in wanted:
+                raise ValueError(f"{section} {name} is listed twice")
+            wanted[name] = spec
+            existing = current.get(name)
+            if section == "workspaces":
+                error = _plan_workspace(result, live, creating, name, dict(spec), existing)
+                if error is not None:
+                    result.conflicts[f"{section} {name}"] = error
+                continue
+            if existing is None:
+                result.changes.append(Change("create", section, name, payload=spec))
+                creating[section].add(name)
+            elif spec_hash(spec) == spec_hash(project(existing, spec)):
+                result.unchanged += 1
+            else:
+                result.conflicts[f"{section} {name}"] = "configurations cannot be changed; delete it or rename it"
+        if prune and section in desired:
+            for name, obj in current.items():
+                if name not in wanted:
+                    result.changes.append(Change("delete", section, name, object_id=obj[id_field]))
+    return result
+
+
+def _plan_workspace(result: Plan, live: LiveState, creating: Dict[str, set], name: str, spec: JSON,
+                    existing: Optional[JSON]) -> Optional[str]:
+    metastore_id = spec.pop("metastore_id", None)
+    for field_name, (section, id_field) in REFERENCES.items():
+        if field_name not in spec:
+            continue
+        target = spec.pop(field_name)
+        if target in creating[section]:
+            spec[id_field] = Created(section, target)
+        elif target in live.objects.get(section, {}):
+            spec[id_field] = live.objects[section][target][COLLECTIONS[SECTIONS[section]]]
+        else:
+            return f"{field_name} {target} is neither in the account nor in the desired state"
+
+    planner = live.planner
+    if metastore_id is not None and planner is not None:
+        region = planner.metastore_region.get(metastore_id)
+        if region is None:
+            return f"Metastore {metastore_id} does not exist"
+        if region != spec.get("aws_region", existing and existing.get("aws_region")):
+            return f"Metastore {metastore_id} is in {region}"
+
+    if existing is None:
+        result.changes.append(Change("create", "workspaces", name, payload=spec))
+        workspace_id: Any = Created("workspaces", name)
+        previous = None
+    else:
+        workspace_id = existing["workspace_id"]
+        previous = planner.assignment.get(int(workspace_id)) if planner is not None else None
+        if spec_hash(spec) == spec_hash(project(existing, spec)):
+            result.unchanged += 1
+        else:
+            changed = {k: v for k, v in spec.items() if spec_hash(v) != spec_hash(project(existing.get(k), v))}
+            immutable = sorted(IMMUTABLE_WORKSPACE_FIELDS & set(changed))
+            if immutable:
+                return f"{', '.join(immutable)} cannot be changed after creation"
+            result.changes.append(Change("update", "workspaces", name, object_id=workspace_id, payload=changed))
+    if metastore_id is not None and metastore_id != previous:
+        result.changes.append(Change("assign", "workspaces", name, object_id=workspace_id,
+                                     payload={"metastore_id": metastore_id}, previous=previous))
+    return None
+
+
+def _stage(change: Change) -> int:
+    if change.action == "create":
+        return list(SECTIONS).index(change.section)
+    if change.action == "update":
+        return len(SECTIONS)
+    if change.action == "assign":
+        return len(SECTIONS) + 1
+    # Workspaces are deleted before the configurations they use.
+    return len(SECTIONS) + 2 + (len(SECTIONS) - list(SECTIONS).index(change.section))
+
+
+def apply(client: AccountClient, plan: Plan, max_workers: int = 8, limiter: Optional[TokenBucket] = None,
+          retry: Optional[RetryPolicy] = None, journal: Optional[Journal] = None
+          ) -> List[Tuple[Change, Optional[Exception]]]:
+    """Issue the calls of a plan, stage by stage; a change whose dependency failed is not attempted.
+
+    With a ``journal``, every call is journaled: creates and metastore
+    assignments go through ``journal.create_once`` and the other calls
+    through ``journal.call_once``, so an interrupted apply can be resumed
+    without creating anything twice. Without one, creates are only retried
+    as ``retry.for_creates`` allows. An object that is already gone when it
+    is deleted counts as deleted.
+    """
+    from .journal import call_once, create_object, create_once
+
+    created: Dict[Created, Any] = {}
+    results: List[Tuple[Change, Optional[Exception]]] = []
+
+    def resolve(value: Any) -> Any:
+        if isinstance(value, Created):
+            if value not in created:
+                raise RuntimeError(f"{value.section} {value.name} was not created")
+            return created[value]
+        if isinstance(value, dict):
+            return {k: resolve(v) for k, v in value.items()}
+        return value
+
+    def call(key: str, method: str, endpoint: str, payload: Optional[JSON] = None) -> Any:
+        def request() -> Any:
+            try:
+                return client.request(method, endpoint, payload)
+            except AccountApiError as e:
+                if method == "DELETE" and e.status == 404:
+                    return None
+                raise
+
+        if journal is None:
+            return call_with_retry(request, retry, limiter)
+        return call_once(journal, key, request, payload, retry, limiter)
+
+    def assign(workspace_id: Any, metastore_id: str) -> None:
+        endpoint = f"/workspaces/{workspace_id}/metastores/{metastore_id}"
+        payload = {"metastore_assignment": {"metastore_id": metastore_id}}
+        if journal is None:
+            call_with_retry(lambda: client.request("POST", endpoint, payload), retry, limiter)
+            return
+
+        def find() -> Optional[JSON]:
+            return payload if int(workspace_id) in client.list_metastore_workspaces(metastore_id) else None
+
+        create_once(journal, f"metastores/{metastore_id}/workspaces/{workspace_id}",
+                    lambda: client.request("POST", endpoint, payload) or payload, find, retry, limiter, payload)
+
+    def run(change: Change) -> Tuple[Change, Optional[Exception]]:
+        collection = SECTIONS[change.section]
+        key = f"{collection}/{change.name}"
+        try:
+            object_id, payload = resolve(change.object_id), resolve(change.payload)
+            if change.action == "create":
+                if journal is None:
+                    obj = call_with_retry(lambda: client.request("POST", f"/{collection}", payload),
+                                          for_creates(retry), limiter)
+                else:
+                    obj = create_object(client, journal, collection, payload, retry, limiter)
+                created[Created(change.section, change.name)] = obj[COLLECTIONS[collection]]
+            elif change.action == "update":
+                call(f"{key}/update/{spec_hash(payload)}", "PATCH", f"/{collection}/{object_id}", payload)
+            elif change.action == "delete":
+                call(f"{key}/delete/{object_id}", "DELETE", f"/{collection}/{object_id}")
+            else:
+                if change.previous is not None:
+                    call(f"metastores/{change.previous}/workspaces/{object_id}/delete", "DELETE",
+                         f"/workspaces/{object_id}/metastores/{change.previous}")
+                assign(object_id, payload["metastore_id"])
+        except Exception as e:
+            return change, e
+        return change, None
+
+    stages: Dict[int, List[Change]] = {}
+    for change in plan.changes:
+        stages.setdefault(_stage(change), []).append(change)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for stage in sorted(stages):
+            results.extend(executor.map(run, stages[stage]))
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Reconcile the account with a desired-state file.")
+    parser.add_argument("desired", help="JSON file with the desired objects by section")
+    parser.add_argument("--apply", action="store_true", help="issue the planned calls")
+    parser.add_argument("--prune", action="store_true", help="delete objects missing from the file")
+    parser.add_argument("--journal", help="journal file; an interrupted --apply resumes from it")
+    args = parser.parse_args(argv)
+
+    with open(args.desired) as f:
+        desired = json.load(f)
+    client = AccountClient.from_environment()
+    live = LiveState.load(client, metastores=any("metastore_id" in w for w in desired.get("workspaces", [])))
+    result = plan(desired, live, prune=args.prune)
+    for change in result.changes:
+        print(change.describe())
+    for name, reason in result.conflicts.items():
+        print(f"conflict: {name}: {reason}", file=sys.stderr)
+    print(f"{result.writes} calls, {result.unchanged} unchanged, {len(result.conflicts)} conflicts")
+    if args.apply:
+        from .journal import Journal
+
+        if args.journal:
+            with Journal(args.journal) as journal:
+                outcomes = apply(client, result, journal=journal)
+        else:
+            outcomes = apply(client, result)
+        failed = [(c, e) for c, e in outcomes if e is not None]
+        for change, error in failed:
+            print(f"failed: {change.describe()}: {error}", file=sys.stderr)
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
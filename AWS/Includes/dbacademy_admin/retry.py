@@ -0,0 +1,146 @@
+"""
+Client-side rate limiting and retries for Account API calls.
+
+Bulk operations share one ``TokenBucket`` between all their workers so that,
+together, they stay under the account's request budget. Calls rejected with
+HTTP 429, failing with a 5xx status or failing to connect are retried after a
+jittered, exponentially growing delay, or after the delay asked for by the
+``Retry-After`` header of the response if that is longer.
+
+A create answered with a 5xx status may still have been carried out, so
+retrying it can create the object twice. ``for_creates`` narrows a policy to
+HTTP 429 and connection failures for creates that are not made idempotent
+with ``journal.create_once``.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional, TypeVar
+
+from .client import AccountApiError
+from .metrics import retry_attempt
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing ``rate`` calls per second in bursts of ``capacity``."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self) -> float:
+        """Take a token, possibly ahead of time, and return how long to wait for it."""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available right now."""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def acquire(self) -> None:
+        delay = self._reserve()
+        if delay > 0:
+            self._sleep(delay)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (ConnectionError, socket.gaierror)):
+        return True
+    return isinstance(error, AccountApiError) and (error.status == 429 or error.status >= 500)
+
+
+def is_retryable_create(error: Exception) -> bool:
+    """Whether a failed create certainly did not happen: it was throttled or never reached the server."""
+    if isinstance(error, (ConnectionRefusedError, socket.gaierror)):
+        return True
+    return isinstance(error, AccountApiError) and error.status == 429
+
+
+@dataclass
+class RetryPolicy:
+    """Retry with "full jitter" backoff: a random delay up to ``base * 2**attempt``, capped."""
+
+    max_attempts: int = 6
+    base: float = 0.5
+    cap: float = 30.0
+    retryable: Callable[[Exception], bool] = is_retryable
+    rng: random.Random = field(default_factory=random.Random)
+
+    def delay(self, attempt: int) -> float:
+        return self.rng.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+def for_creates(policy: Optional[RetryPolicy] = None) -> RetryPolicy:
+    """``policy`` (default: ``RetryPolicy()``) narrowed to the failures ``is_retryable_create`` accepts."""
+    policy = policy or RetryPolicy()
+    retryable = policy.retryable
+    return dataclasses.replace(policy, retryable=lambda e: is_retryable_create(e) and retryable(e))
+
+
+@dataclass
+class CallStats:
+    calls: int = 0
+    retries: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, retries: int) -> None:
+        with self._lock:
+            self.calls += 1
+            self.retries += retries
+
+
+def call_with_retry(call: Callable[[], T], policy: Optional[RetryPolicy] = None,
+                    limiter: Optional[TokenBucket] = None, stats: Optional[CallStats] = None,
+                    sleep: Callable[[float], None] = time.sleep) -> T:
+    """Run ``call``, taking a token from ``limiter`` before every attempt."""
+    policy = policy or RetryPolicy()
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        token = retry_attempt.set(attempt)
+        try:
+            result = call()
+        except Exception as e:
+            if attempt + 1 >= policy.max_attempts or not policy.retryable(e):
+                if stats is not None:
+                    stats.record(attempt)
+                raise
+            delay = policy.delay(attempt)
+            retry_after = getattr(e, "retry_after", None)
+            sleep(delay if retry_after is None else max(delay, retry_after))
+            attempt += 1
+        else:
+            if stats is not None:
+                stats.record(attempt)
+            return result
+        finally:
+            retry_attempt.reset(token)
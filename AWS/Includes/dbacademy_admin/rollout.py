@@ -0,0 +1,159 @@
+"""
+Rolling a customer-managed key out to existing workspaces.
+
+Applying a key to an existing workspace is a single ``PATCH
+/workspaces/<WORKSPACE_ID>``, but clusters must be shut down first and, for
+storage encryption, nothing may use the workspace for at least 20 minutes
+afterwards. ``KeyRolloutScheduler`` patches up to ``wave_size`` workspaces at
+a time and tracks each one's quiet window on a ``TimerWheel``; as soon as a
+window ends, its slot goes to the next workspace. Rolling a key across N
+workspaces then takes about ``ceil(N / wave_size)`` quiet periods rather than N.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .client import AccountClient
+from .retry import RetryPolicy, TokenBucket, call_with_retry
+
+QUIET_PERIOD = 20 * 60.0
+
+KEY_FIELDS = ("managed_services_customer_managed_key_id", "storage_customer_managed_key_id")
+
+
+class TimerWheel:
+    """Hashed timing wheel: O(1) scheduling, expiry processed one tick at a time."""
+
+    def __init__(self, tick: float = 1.0, slots: int = 2048, start: float = 0.0):
+        self.tick = tick
+        self._slots: List[List[Tuple[int, Any]]] = [[] for _ in range(slots)]
+        self._origin = start
+        self._current = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _time_of(self, tick: int) -> float:
+        return self._origin + tick * self.tick
+
+    def _tick_of(self, when: float) -> int:
+        """The last tick at or before ``when``.
+
+        Corrected against ``_time_of``, so that a time it returned maps back
+        to its own tick despite floating-point rounding.
+        """
+        tick = math.floor((when - self._origin) / self.tick)
+        if self._time_of(tick + 1) <= when:
+            return tick + 1
+        if self._time_of(tick) > when:
+            return tick - 1
+        return tick
+
+    def schedule(self, deadline: float, item: Any) -> None:
+        # The first tick at or after the deadline, so that no item expires early.
+        due = self._tick_of(deadline)
+        if self._time_of(due) < deadline:
+            due += 1
+        due = max(due, self._current + 1)
+        self._slots[due % len(self._slots)].append((due, item))
+        self._size += 1
+
+    def advance(self, now: float) -> List[Any]:
+        """Move the wheel to ``now`` and return the items whose deadline has passed."""
+        target = self._tick_of(now)
+        if target <= self._current:
+            return []
+        expired = []
+        # After a full turn every slot has been visited; later ticks add nothing new.
+        for t in range(self._current + 1, min(target, self._current + len(self._slots)) + 1):
+            slot = self._slots[t % len(self._slots)]
+            if slot:
+                keep = [(due, item) for due, item in slot if due > target]
+                expired.extend(item for due, item in slot if due <= target)
+                slot[:] = keep
+        self._current = target
+        self._size -= len(expired)
+        return expired
+
+    def next_deadline(self) -> Optional[float]:
+        """Time of the earliest scheduled item, or ``None`` if the wheel is empty."""
+        if not self._size:
+            return None
+        return self._time_of(min(due for slot in self._slots for due, _ in slot))
+
+
+@dataclass(frozen=True)
+class RolloutEvent:
+    """``kind`` is ``patched``, ``failed`` or ``ready`` (quiet window over)."""
+
+    workspace_id: int
+    kind: str
+    at: float
+    error: Optional[Exception] = None
+
+
+class KeyRolloutScheduler:
+    """Apply a key configuration to many existing workspaces in overlapping waves.
+
+    ``stop_clusters``, if given, is called with each workspace id before it is
+    patched; it should return once the workspace's clusters are terminated.
+    """
+
+    def __init__(self, client: AccountClient, customer_managed_key_id: str, workspace_ids: Iterable[int],
+                 wave_size: int = 25, quiet_period: float = QUIET_PERIOD, key_fields: Sequence[str] = KEY_FIELDS,
+                 stop_clusters: Optional[Callable[[int], None]] = None,
+                 limiter: Optional[TokenBucket] = None, retry: Optional[RetryPolicy] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.client = client
+        self.customer_managed_key_id = customer_managed_key_id
+        self.wave_size = wave_size
+        self.quiet_period = quiet_period
+        self.key_fields = tuple(key_fields)
+        self.stop_clusters = stop_clusters
+        self.limiter = limiter
+        self.retry = retry
+        self._clock = clock
+        self._sleep = sleep
+        self._queue: Deque[int] = deque(workspace_ids)
+        self._wheel = TimerWheel(tick=max(quiet_period / 1200.0, 0.001), start=clock())
+
+    def _patch(self, workspace_id: int) -> Optional[Exception]:
+        try:
+            if self.stop_clusters is not None:
+                self.stop_clusters(workspace_id)
+            changes = {name: self.customer_managed_key_id for name in self.key_fields}
+            call_with_retry(lambda: self.client.update_workspace(workspace_id, changes), self.retry, self.limiter)
+        except Exception as e:
+            return e
+        return None
+
+    def run(self) -> Iterator[RolloutEvent]:
+        """Patch every workspace, yielding events as workspaces are patched and become ready."""
+        with ThreadPoolExecutor(max_workers=self.wave_size) as executor:
+            while self._queue or len(self._wheel):
+                free = self.wave_size - len(self._wheel)
+                wave = [self._queue.popleft() for _ in range(min(free, len(self._queue)))]
+                for workspace_id, error in zip(wave, executor.map(self._patch, wave)):
+                    now = self._clock()
+                    if error is None:
+                        self._wheel.schedule(now + self.quiet_period, workspace_id)
+                        yield RolloutEvent(workspace_id, "patched", now)
+                    else:
+                        yield RolloutEvent(workspace_id, "failed", now, error)
+
+                deadline = self._wheel.next_deadline()
+                if deadline is None:
+                    continue
+                delay = deadline - self._clock()
+                if delay > 0:
+                    self._sleep(delay)
+                now = self._clock()
+                for workspace_id in self._wheel.advance(now):
+                    yield RolloutEvent(workspace_id, "ready", now)
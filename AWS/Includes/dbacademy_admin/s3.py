@@ -0,0 +1,322 @@
+"""
+Bulk S3 bucket and bucket-policy provisioning.
+
+The labs create the workspace root bucket and the metastore bucket by hand in
+the S3 console and paste the root bucket policy from "Generate policy".
+``provision_buckets`` does this for many workspaces and regions at once: each
+bucket is created, waited on and given its policy by one of a pool of
+workers, through one S3 client per region whose connection pool is shared by
+all workers in that region.
+
+S3 is eventually consistent about new buckets: ``PutBucketPolicy`` right
+after ``CreateBucket`` can fail with ``NoSuchBucket``. Instead of sleeping a
+fixed time, each bucket is polled with the ``bucket_exists`` waiter, which
+checks at once and then every ``waiter_delay`` seconds, and the policy call
+is retried with backoff on the errors consistency lag causes.
+
+Root buckets get the root bucket policy. Metastore buckets get none: the
+metastore reaches them through its IAM role, whose permissions policy is the
+``metastore`` template.
+
+    python -m dbacademy_admin.s3 <DATABRICKS_ACCOUNT_ID> dbacademy-a dbacademy-b@eu-west-1 --region us-east-1
+
+creates ``<prefix>-bucket`` and ``<prefix>-metastore-bucket`` for every
+prefix. Works against a local stand-in such as moto with ``--endpoint-url``.
+
+Requires ``boto3``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .client import JSON
+from .policies import TEMPLATES, canonical
+from .retry import CallStats, RetryPolicy, call_with_retry
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - optional dependency
+    boto3 = Config = ClientError = None
+
+PURPOSES = ("root", "metastore")
+
+# Lowercase letters, digits and hyphens only: the labs warn that dots in bucket names break TLS.
+_BUCKET_NAME = re.compile(r"^[a-z0-9][a-z0-9-]{1,61}[a-z0-9]$")
+
+# Prefixes and suffixes S3 reserves for its own naming schemes (access points, directory buckets...).
+RESERVED_PREFIXES = ("xn--", "sthree-", "amzn-s3-demo-")
+RESERVED_SUFFIXES = ("-s3alias", "--ol-s3", "--x-s3", "--table-s3")
+
+# Error codes that clear up on their own: throttling, server errors and new-bucket consistency lag.
+RETRYABLE_CODES = {
+    "NoSuchBucket", "OperationAborted", "SlowDown", "ServiceUnavailable", "InternalError",
+    "RequestTimeout", "Throttling", "ThrottlingException",
+}
+
+
+def _require_boto3() -> None:
+    if boto3 is None:
+        raise ImportError("Bucket provisioning needs boto3: pip install boto3")
+
+
+def error_code(error: Exception) -> Optional[str]:
+    if ClientError is not None and isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code")
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if error_code(error) in RETRYABLE_CODES:
+        return True
+    status = getattr(error, "response", {}).get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+    return status >= 500
+
+
+@dataclass(frozen=True)
+class BucketSpec:
+    bucket_name: str
+    region: str = "us-east-1"
+    purpose: str = "root"
+
+    def __post_init__(self):
+        if not _BUCKET_NAME.match(self.bucket_name):
+            raise ValueError(f"Invalid bucket name {self.bucket_name!r}: use 3-63 lowercase letters, digits and "
+                             f"hyphens, without dots")
+        if self.bucket_name.startswith(RESERVED_PREFIXES) or self.bucket_name.endswith(RESERVED_SUFFIXES):
+            raise ValueError(f"Invalid bucket name {self.bucket_name!r}: S3 reserves its prefix or suffix")
+        if self.purpose not in PURPOSES:
+            raise ValueError(f"Unknown bucket purpose {self.purpose!r}")
+
+    def policy(self, databricks_account_id: str) -> Optional[str]:
+        """The bucket policy text, or None for buckets that get none."""
+        if self.purpose != "root":
+            return None
+        return TEMPLATES["root_bucket"].render({"BUCKET": self.bucket_name,
+                                                "DATABRICKS_ACCOUNT_ID": databricks_account_id})
+
+
+def lab_buckets(prefix: str, region: str = "us-east-1") -> List[BucketSpec]:
+    """The root and metastore buckets of one workspace, named as in ``workspace_resources``."""
+    return [BucketSpec(f"{prefix}-bucket", region, "root"),
+            BucketSpec(f"{prefix}-metastore-bucket", region, "metastore")]
+
+
+class S3Clients:
+    """One S3 client per region, created on first use and shared by all threads.
+
+    boto3 clients are thread-safe but sessions are not, so clients are
+    created under a lock. Each client keeps up to ``max_pool_connections``
+    connections alive, which should be at least the number of workers.
+    """
+
+    def __init__(self, session: Any = None, max_pool_connections: int = 16, endpoint_url: Optional[str] = None):
+        _require_boto3()
+        self.session = session or boto3.session.Session()
+        self.max_pool_connections = max_pool_connections
+        self.endpoint_url = endpoint_url
+        self._clients: Dict[str, Any] = {}
+        self._regions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def client(self, region: str) -> Any:
+        with self._lock:
+            client = self._clients.get(region)
+            if client is None:
+                config = Config(max_pool_connections=self.max_pool_connections, retries={"mode": "standard"})
+                client = self._clients[region] = self.session.client("s3", region_name=region, config=config,
+                                                                     endpoint_url=self.endpoint_url)
+            return client
+
+    def remember(self, bucket_name: str, region: str) -> None:
+        with self._lock:
+            self._regions[bucket_name] = region
+
+    def region_of(self, bucket_name: str) -> str:
+        """The region of a bucket, asking S3 only for buckets this object did not create."""
+        with self._lock:
+            region = self._regions.get(bucket_name)
+        if region is None:
+            location = self.client("us-east-1").get_bucket_location(Bucket=bucket_name)["LocationConstraint"]
+            region = location or "us-east-1"
+            self.remember(bucket_name, region)
+        return region
+
+
+@dataclass
+class BucketResult:
+    spec: BucketSpec
+    created: bool = False
+    policy_applied: bool = False
+    error: Optional[Exception] = None
+    elapsed: float = 0.0
+
+
+@dataclass
+class BucketBatch:
+    results: List[BucketResult] = field(default_factory=list)
+    retries: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def failed(self) -> List[BucketResult]:
+        return [r for r in self.results if r.error is not None]
+
+    @property
+    def created(self) -> List[BucketResult]:
+        return [r for r in self.results if r.created and r.error is None]
+
+    @property
+    def per_minute(self) -> float:
+        done = len(self.results) - len(self.failed)
+        return 60.0 * done / self.elapsed if self.elapsed else 0.0
+
+
+def create_bucket(s3: Any, spec: BucketSpec, retry: Optional[RetryPolicy] = None,
+                  stats: Optional[CallStats] = None, waiter_delay: float = 1.0,
+                  waiter_attempts: int = 60) -> bool:
+    """Create a bucket and wait until S3 reports it; returns False if we owned it already.
+
+    In us-east-1, S3 accepts ``CreateBucket`` for a bucket we own, so there an
+    existing bucket is reported as created.
+    """
+    params: JSON = {"Bucket": spec.bucket_name}
+    if spec.region != "us-east-1":
+        params["CreateBucketConfiguration"] = {"LocationConstraint": spec.region}
+
+    def create() -> bool:
+        try:
+            s3.create_bucket(**params)
+        except Exception as e:
+            if error_code(e) == "BucketAlreadyOwnedByYou":
+                return False
+            raise
+        return True
+
+    created = call_with_retry(create, retry, stats=stats)
+    if created:
+        # Polls at once, then every waiter_delay seconds, instead of a fixed wait.
+        s3.get_waiter("bucket_exists").wait(Bucket=spec.bucket_name,
+                                            WaiterConfig={"Delay": waiter_delay, "MaxAttempts": waiter_attempts})
+    return created
+
+
+def current_policy(s3: Any, bucket_name: str) -> Optional[str]:
+    """The bucket's policy in canonical form, or None if it has none."""
+    try:
+        text = s3.get_bucket_policy(Bucket=bucket_name)["Policy"]
+    except Exception as e:
+        if error_code(e) == "NoSuchBucketPolicy":
+            return None
+        raise
+    return canonical(json.loads(text))
+
+
+def apply_policy(s3: Any, bucket_name: str, policy: str, retry: Optional[RetryPolicy] = None,
+                 stats: Optional[CallStats] = None, check: bool = True) -> bool:
+    """Set the bucket policy unless it is already byte-identical; returns whether it was set.
+
+    Rendered policies are canonical JSON, so the comparison is a string
+    compare. With ``check=False`` the policy is set without reading it first,
+    which is what a bucket created moments ago needs.
+    """
+    if check and current_policy(s3, bucket_name) == policy:
+        return False
+    call_with_retry(lambda: s3.put_bucket_policy(Bucket=bucket_name, Policy=policy), retry, stats=stats)
+    return True
+
+
+def provision_buckets(specs: Iterable[BucketSpec], databricks_account_id: str,
+                      clients: Optional[S3Clients] = None, max_workers: int = 16,
+                      retry: Optional[RetryPolicy] = None, waiter_delay: float = 1.0) -> BucketBatch:
+    """Create every bucket in ``specs`` and apply its policy, ``max_workers`` buckets at a time.
+
+    Buckets we already own are kept and only get their policy fixed if it
+    differs. A bucket that still fails after retrying lands in
+    ``BucketBatch.failed`` without stopping the others.
+    """
+    specs = list(specs)
+    clients = clients or S3Clients(max_pool_connections=max_workers)
+    retry = retry or RetryPolicy(retryable=is_retryable)
+    stats = CallStats()
+
+    def provision(spec: BucketSpec) -> BucketResult:
+        result = BucketResult(spec)
+        start = time.perf_counter()
+        try:
+            s3 = clients.client(spec.region)
+            result.created = create_bucket(s3, spec, retry, stats, waiter_delay)
+            clients.remember(spec.bucket_name, spec.region)
+            policy = spec.policy(databricks_account_id)
+            if policy is not None:
+                result.policy_applied = apply_policy(s3, spec.bucket_name, policy, retry, stats,
+                                                     check=not result.created)
+        except Exception as e:
+            result.error = e
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    batch = BucketBatch()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        batch.results = list(executor.map(provision, specs))
+    batch.elapsed = time.perf_counter() - start
+    batch.retries = stats.retries
+    return batch
+
+
+def bucket_handlers(clients: S3Clients, databricks_account_id: str, retry: Optional[RetryPolicy] = None,
+                    waiter_delay: float = 1.0) -> Dict[str, Callable[[JSON], JSON]]:
+    """Provisioner handlers for the ``s3_bucket`` and ``s3_bucket_policy`` kinds of ``workspace_resources``."""
+    retry = retry or RetryPolicy(retryable=is_retryable)
+
+    def bucket(p: JSON) -> JSON:
+        spec = BucketSpec(p["bucket_name"], p.get("region", "us-east-1"), p.get("purpose", "root"))
+        create_bucket(clients.client(spec.region), spec, retry, waiter_delay=waiter_delay)
+        clients.remember(spec.bucket_name, spec.region)
+        return {"bucket_name": spec.bucket_name, "region": spec.region}
+
+    def bucket_policy(p: JSON) -> JSON:
+        bucket_name = p["bucket_name"]
+        spec = BucketSpec(bucket_name, clients.region_of(bucket_name), "root")
+        apply_policy(clients.client(spec.region), bucket_name, spec.policy(databricks_account_id), retry)
+        return {"bucket_name": bucket_name}
+
+    return {"s3_bucket": bucket, "s3_bucket_policy": bucket_policy}
+
+
+def _parse_target(target: str, default_region: str) -> Tuple[str, str]:
+    prefix, _, region = target.partition("@")
+    return prefix, region or default_region
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Create root and metastore buckets with their policies in bulk.")
+    parser.add_argument("databricks_account_id", metavar="DATABRICKS_ACCOUNT_ID")
+    parser.add_argument("targets", nargs="+", metavar="PREFIX[@REGION]")
+    parser.add_argument("--region", default="us-east-1", help="region of prefixes given without one")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--endpoint-url", help="S3 endpoint, e.g. a local moto server")
+    args = parser.parse_args(argv)
+
+    specs = [spec for target in args.targets for spec in lab_buckets(*_parse_target(target, args.region))]
+    clients = S3Clients(max_pool_connections=args.workers, endpoint_url=args.endpoint_url)
+    batch = provision_buckets(specs, args.databricks_account_id, clients, args.workers)
+    for result in batch.results:
+        status = "failed: " + str(result.error) if result.error else ("created" if result.created else "exists")
+        print(f"{result.spec.bucket_name:<50} {result.spec.region:<16} {status}")
+    print(f"{len(batch.results) - len(batch.failed)}/{len(batch.results)} buckets in {batch.elapsed:.2f}s "
+          f"({batch.per_minute:.0f} buckets/min), {batch.retries} retries")
+
+
+if __name__ == "__main__":
+    main()
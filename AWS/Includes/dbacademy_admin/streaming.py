@@ -0,0 +1,116 @@
+"""
+Incremental parsing of JSON array responses such as ``GET /workspaces``.
+
+The labs pipe responses through ``json_pp``, which buffers and pretty-prints
+the whole document. ``iter_json_array`` instead decodes one element at a time
+from a stream of byte chunks, optionally keeping only some fields, so memory
+use does not grow with the number of workspaces. As a drop-in replacement for
+``json_pp``,
+
+    curl ... "${DBACADEMY_API_URL}/workspaces" | python -m dbacademy_admin.streaming \\
+        --fields workspace_id,workspace_status,credentials_id,storage_configuration_id
+
+prints one projected object per line.
+"""
+
+from __future__ import annotations
+
+import argparse
+import codecs
+import json
+import sys
+from typing import Any, Iterable, Iterator, List, Optional, Sequence
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+def project(obj: Any, fields: Optional[Sequence[str]]) -> Any:
+    """Keep only ``fields`` of a JSON object; other values pass through unchanged."""
+    if fields is None or not isinstance(obj, dict):
+        return obj
+    return {key: obj[key] for key in fields if key in obj}
+
+
+def iter_json_array(chunks: Iterable[bytes], fields: Optional[Sequence[str]] = None) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array read from UTF-8 byte chunks.
+
+    Only the element being decoded and the unread remainder of the current
+    chunk are held in memory at any time.
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        for chunk in chunks:
+            text = utf8.decode(chunk)
+            if text:
+                buf = buf[pos:] + text
+                pos = 0
+                return True
+        buf = buf[pos:] + utf8.decode(b"", final=True)
+        pos = 0
+        eof = True
+        return bool(buf)
+
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        if pos == len(buf):
+            if not fill():
+                raise ValueError("Unexpected end of JSON array")
+            continue
+
+        char = buf[pos]
+        if not started:
+            if char != "[":
+                raise ValueError(f"Expected a JSON array, found {char!r}")
+            started = True
+            pos += 1
+            continue
+        if char == "]":
+            return
+        if char == ",":
+            pos += 1
+            continue
+
+        try:
+            value, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if fill():
+                continue
+            raise
+        if not isinstance(value, (dict, list)) and (end == len(buf) or buf[end] not in _DELIMITERS) \
+                and fill():
+            # A scalar not followed by a delimiter may have been cut short, as in "12" of "12.5".
+            continue
+        pos = end
+        yield project(value, fields)
+
+
+def _read_chunks(stream, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    return iter(lambda: stream.read(chunk_size), b"")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Stream the elements of a JSON array as JSON lines.")
+    parser.add_argument("--fields", help="comma-separated list of fields to keep")
+    args = parser.parse_args(argv)
+
+    fields = args.fields.split(",") if args.fields else None
+    out = sys.stdout
+    for obj in iter_json_array(_read_chunks(sys.stdin.buffer), fields):
+        out.write(json.dumps(obj))
+        out.write("\n")
+
+
+if __name__ == "__main__":
+    main()
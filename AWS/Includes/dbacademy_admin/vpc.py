@@ -0,0 +1,376 @@
+"""
+Customer-managed VPCs in many regions at once.
+
+The customer-managed VPC lab builds one VPC with the console's "VPC and
+more": two public and two private subnets in two availability zones, an
+internet gateway, one NAT gateway, route tables for both sides and DNS
+hostnames and resolution turned on. ``vpc_resources`` describes the same
+topology for one region as ``Resource`` objects, and ``provision_vpcs`` runs
+the resources of every region in one ``Provisioner``, so all regions are
+built at the same time and, within a region, each step starts as soon as
+the ones it needs are done: the elastic IP is allocated while the VPC is
+created, the four subnets are created together, and the private route
+table waits only for the NAT gateway.
+
+Subnet CIDRs come from ``SubnetAllocator``, lowest first. The result of each
+region is a ``RegionNetwork`` holding the ids the network configuration needs,
+and a description of the VPC in the form ``netgen.plan_networks`` takes, for
+adding workspace subnets later.
+
+    python -m dbacademy_admin.vpc us-east-1 us-west-2 eu-west-1 --name-prefix dbacademy
+
+Works against a local stand-in such as moto with ``--endpoint-url``.
+
+Requires ``boto3``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .cidr import SubnetAllocator
+from .client import JSON
+from .netgen import QUAD_ZERO
+from .provisioner import Output, ProvisionResult, Provisioner, Resource
+from .retry import RetryPolicy, call_with_retry
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - optional dependency
+    boto3 = Config = ClientError = None
+
+ZONES = 2
+
+# New EC2 resources can be briefly invisible to the calls that use them.
+RETRYABLE_CODES = {
+    "InvalidVpcID.NotFound", "InvalidSubnetID.NotFound", "InvalidInternetGatewayID.NotFound",
+    "InvalidAllocationID.NotFound", "InvalidRouteTableID.NotFound", "InvalidNatGatewayID.NotFound",
+    "RequestLimitExceeded", "Throttling", "InternalError", "Unavailable",
+}
+
+
+def _require_boto3() -> None:
+    if boto3 is None:
+        raise ImportError("VPC provisioning needs boto3: pip install boto3")
+
+
+def is_retryable(error: Exception) -> bool:
+    return ClientError is not None and isinstance(error, ClientError) \
+        and error.response.get("Error", {}).get("Code") in RETRYABLE_CODES
+
+
+class EC2Clients:
+    """One EC2 client per region, created on first use and shared by all threads."""
+
+    def __init__(self, session: Any = None, max_pool_connections: int = 16, endpoint_url: Optional[str] = None):
+        _require_boto3()
+        self.session = session or boto3.session.Session()
+        self.max_pool_connections = max_pool_connections
+        self.endpoint_url = endpoint_url
+        self._clients: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def client(self, region: str) -> Any:
+        with self._lock:
+            client = self._clients.get(region)
+            if client is None:
+                config = Config(max_pool_connections=self.max_pool_connections, retries={"mode": "standard"})
+                client = self._clients[region] = self.session.client("ec2", region_name=region, config=config,
+                                                                     endpoint_url=self.endpoint_url)
+            return client
+
+
+def _tags(resource_type: str, name: str) -> List[JSON]:
+    return [{"ResourceType": resource_type, "Tags": [{"Key": "Name", "Value": name}]}]
+
+
+def vpc_resources(region: str, name_prefix: str = "dbacademy", cidr_block: str = "10.0.0.0/16",
+                  prefixlen: int = 20) -> List[Resource]:
+    """The resources of one region's VPC, named ``<name_prefix>-<region>-...``."""
+    prefix = f"{name_prefix}-{region}"
+    allocator = SubnetAllocator(cidr_block)
+    cidrs = {side: [str(allocator.allocate(prefixlen)) for _ in range(ZONES)] for side in ("public", "private")}
+    vpc_id = Output(f"{prefix}-vpc", "vpc_id")
+    resources = [
+        Resource(f"{prefix}-zones", "ec2_zones", {"region": region}),
+        Resource(f"{prefix}-vpc", "ec2_vpc", {"region": region, "name": f"{prefix}-vpc", "cidr_block": cidr_block}),
+        Resource(f"{prefix}-igw", "ec2_internet_gateway", {"region": region, "name": f"{prefix}-igw",
+                                                           "vpc_id": vpc_id}),
+        Resource(f"{prefix}-eip", "ec2_elastic_ip", {"region": region, "name": f"{prefix}-eip"}),
+    ]
+    for side in ("public", "private"):
+        for zone in range(ZONES):
+            resources.append(Resource(f"{prefix}-subnet-{side}{zone + 1}", "ec2_subnet", {
+                "region": region, "name": f"{prefix}-subnet-{side}{zone + 1}", "vpc_id": vpc_id,
+                "cidr_block": cidrs[side][zone],
+                "availability_zone": Output(f"{prefix}-zones", f"zone_{zone}"),
+            }))
+    resources += [
+        Resource(f"{prefix}-nat", "ec2_nat_gateway", {
+            "region": region, "name": f"{prefix}-nat",
+            "subnet_id": Output(f"{prefix}-subnet-public1", "subnet_id"),
+            "allocation_id": Output(f"{prefix}-eip", "allocation_id"),
+        }, depends_on=(f"{prefix}-igw",)),
+        Resource(f"{prefix}-rtb-public", "ec2_route_table", {
+            "region": region, "name": f"{prefix}-rtb-public", "vpc_id": vpc_id,
+            "route": {"GatewayId": Output(f"{prefix}-igw", "internet_gateway_id")},
+            "subnet_ids": [Output(f"{prefix}-subnet-public{zone + 1}", "subnet_id") for zone in range(ZONES)],
+        }),
+        Resource(f"{prefix}-rtb-private", "ec2_route_table", {
+            "region": region, "name": f"{prefix}-rtb-private", "vpc_id": vpc_id,
+            "route": {"NatGatewayId": Output(f"{prefix}-nat", "nat_gateway_id")},
+            "subnet_ids": [Output(f"{prefix}-subnet-private{zone + 1}", "subnet_id") for zone in range(ZONES)],
+        }),
+    ]
+    return resources
+
+
+def ec2_handlers(clients: EC2Clients, retry: Optional[RetryPolicy] = None,
+                 waiter_delay: float = 5.0) -> Dict[str, Callable[[JSON], JSON]]:
+    """Provisioner handlers for the ``ec2_*`` kinds of ``vpc_resources``.
+
+    Each handler first looks for the resource by its ``Name`` tag, so running
+    the same topology again completes a partial build instead of duplicating it.
+    """
+    retry = retry or RetryPolicy(retryable=is_retryable)
+
+    def call(region: str, method: str, **params) -> JSON:
+        ec2 = clients.client(region)
+        return call_with_retry(lambda: getattr(ec2, method)(**params), retry)
+
+    def waiter(region: str, name: str, **params) -> None:
+        clients.client(region).get_waiter(name).wait(WaiterConfig={"Delay": waiter_delay, "MaxAttempts": 120},
+                                                     **params)
+
+    def zones(p: JSON) -> JSON:
+        found = call(p["region"], "describe_availability_zones",
+                     Filters=[{"Name": "state", "Values": ["available"]},
+                              {"Name": "zone-type", "Values": ["availability-zone"]}])["AvailabilityZones"]
+        names = sorted(z["ZoneName"] for z in found)
+        if len(names) < ZONES:
+            raise ValueError(f"{p['region']} has fewer than {ZONES} availability zones")
+        return {f"zone_{i}": name for i, name in enumerate(names[:ZONES])}
+
+    def named(region: str, method: str, key: str, name: str, *filters: JSON,
+              filter_param: str = "Filters") -> Optional[JSON]:
+        """The resource tagged ``Name: name`` by an earlier run, if any, so a re-run adopts it."""
+        found = call(region, method, **{filter_param: [{"Name": "tag:Name", "Values": [name]}, *filters]})[key]
+        return found[0] if found else None
+
+    def vpc(p: JSON) -> JSON:
+        region = p["region"]
+        existing = named(region, "describe_vpcs", "Vpcs", p["name"],
+                         {"Name": "cidr-block", "Values": [p["cidr_block"]]})
+        if existing is not None:
+            vpc_id = existing["VpcId"]
+        else:
+            vpc_id = call(region, "create_vpc", CidrBlock=p["cidr_block"],
+                          TagSpecifications=_tags("vpc", p["name"]))["Vpc"]["VpcId"]
+        waiter(region, "vpc_available", VpcIds=[vpc_id])
+        # One attribute per call; hostnames can only be enabled once resolution is.
+        call(region, "modify_vpc_attribute", VpcId=vpc_id, EnableDnsSupport={"Value": True})
+        call(region, "modify_vpc_attribute", VpcId=vpc_id, EnableDnsHostnames={"Value": True})
+        groups = call(region, "describe_security_groups",
+                      Filters=[{"Name": "vpc-id", "Values": [vpc_id]},
+                               {"Name": "group-name", "Values": ["default"]}])["SecurityGroups"]
+        return {"vpc_id": vpc_id, "security_group_ids": [g["GroupId"] for g in groups]}
+
+    def internet_gateway(p: JSON) -> JSON:
+        region = p["region"]
+        existing = named(region, "describe_internet_gateways", "InternetGateways", p["name"])
+        if existing is not None:
+            igw_id = existing["InternetGatewayId"]
+            attached = {a["VpcId"] for a in existing.get("Attachments", [])}
+        else:
+            igw_id = call(region, "create_internet_gateway", TagSpecifications=_tags(
+                "internet-gateway", p["name"]))["InternetGateway"]["InternetGatewayId"]
+            attached = set()
+        if p["vpc_id"] not in attached:
+            call(region, "attach_internet_gateway", InternetGatewayId=igw_id, VpcId=p["vpc_id"])
+        return {"internet_gateway_id": igw_id}
+
+    def elastic_ip(p: JSON) -> JSON:
+        address = named(p["region"], "describe_addresses", "Addresses", p["name"],
+                         {"Name": "domain", "Values": ["vpc"]})
+        if address is None:
+            address = call(p["region"], "allocate_address", Domain="vpc",
+                           TagSpecifications=_tags("elastic-ip", p["name"]))
+        return {"allocation_id": address["AllocationId"], "public_ip": address.get("PublicIp")}
+
+    def subnet(p: JSON) -> JSON:
+        existing = named(p["region"], "describe_subnets", "Subnets", p["name"],
+                         {"Name": "vpc-id", "Values": [p["vpc_id"]]})
+        if existing is not None:
+            subnet_id = existing["SubnetId"]
+        else:
+            subnet_id = call(p["region"], "create_subnet", VpcId=p["vpc_id"], CidrBlock=p["cidr_block"],
+                             AvailabilityZone=p["availability_zone"],
+                             TagSpecifications=_tags("subnet", p["name"]))["Subnet"]["SubnetId"]
+        return {"subnet_id": subnet_id, "cidr_block": p["cidr_block"], "availability_zone": p["availability_zone"]}
+
+    def nat_gateway(p: JSON) -> JSON:
+        region = p["region"]
+        # A deleted or failed gateway keeps its tags for a while; only a live one is adopted.
+        existing = named(region, "describe_nat_gateways", "NatGateways", p["name"],
+                         {"Name": "subnet-id", "Values": [p["subnet_id"]]},
+                         {"Name": "state", "Values": ["pending", "available"]}, filter_param="Filter")
+        if existing is not None:
+            nat_id = existing["NatGatewayId"]
+        else:
+            nat_id = call(region, "create_nat_gateway", SubnetId=p["subnet_id"], AllocationId=p["allocation_id"],
+                          TagSpecifications=_tags("natgateway", p["name"]))["NatGateway"]["NatGatewayId"]
+        # The slowest step of the topology, typically a minute or two.
+        waiter(region, "nat_gateway_available", NatGatewayIds=[nat_id])
+        return {"nat_gateway_id": nat_id}
+
+    def route_table(p: JSON) -> JSON:
+        region = p["region"]
+        existing = named(region, "describe_route_tables", "RouteTables", p["name"],
+                         {"Name": "vpc-id", "Values": [p["vpc_id"]]})
+        if existing is not None:
+            table_id = existing["RouteTableId"]
+            routed = any(r.get("DestinationCidrBlock") == QUAD_ZERO for r in existing.get("Routes", []))
+            associated = {a.get("SubnetId") for a in existing.get("Associations", [])}
+        else:
+            table_id = call(region, "create_route_table", VpcId=p["vpc_id"],
+                            TagSpecifications=_tags("route-table", p["name"]))["RouteTable"]["RouteTableId"]
+            routed, associated = False, set()
+        if not routed:
+            call(region, "create_route", RouteTableId=table_id, DestinationCidrBlock=QUAD_ZERO, **p["route"])
+        for subnet_id in p["subnet_ids"]:
+            if subnet_id not in associated:
+                call(region, "associate_route_table", RouteTableId=table_id, SubnetId=subnet_id)
+        return {"route_table_id": table_id}
+
+    return {
+        "ec2_zones": zones,
+        "ec2_vpc": vpc,
+        "ec2_internet_gateway": internet_gateway,
+        "ec2_elastic_ip": elastic_ip,
+        "ec2_subnet": subnet,
+        "ec2_nat_gateway": nat_gateway,
+        "ec2_route_table": route_table,
+    }
+
+
+@dataclass
+class RegionNetwork:
+    region: str
+    vpc_id: Optional[str] = None
+    cidr_block: Optional[str] = None
+    subnets: Dict[str, List[JSON]] = field(default_factory=lambda: {"public": [], "private": []})
+    security_group_ids: List[str] = field(default_factory=list)
+    nat_gateway_id: Optional[str] = None
+    route_table_ids: Dict[str, str] = field(default_factory=dict)
+    errors: Dict[str, Exception] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.vpc_id is not None and not self.errors
+
+    @property
+    def subnet_ids(self) -> List[str]:
+        """The private subnets, which are the ones a workspace uses."""
+        return [s["subnet_id"] for s in self.subnets["private"]]
+
+    def network_payload(self, network_name: str) -> JSON:
+        """Body of ``POST /networks`` for this VPC."""
+        return {"network_name": network_name, "vpc_id": self.vpc_id, "subnet_ids": self.subnet_ids,
+                "security_group_ids": list(self.security_group_ids)}
+
+    def description(self) -> JSON:
+        """The VPC as ``netgen.plan_networks`` describes it."""
+        return {
+            "region": self.region,
+            "vpc_id": self.vpc_id,
+            "cidr_block": self.cidr_block,
+            "security_group_ids": list(self.security_group_ids),
+            "subnets": [{"subnet_id": s["subnet_id"], "cidr_block": s["cidr_block"],
+                         "availability_zone": s["availability_zone"]}
+                        for side in ("public", "private") for s in self.subnets[side]],
+            "nat_gateways": [{"nat_gateway_id": self.nat_gateway_id,
+                              "availability_zone": self.subnets["public"][0]["availability_zone"]}],
+            "route_tables": [{"route_table_id": self.route_table_ids["private"],
+                              "nat_gateway_id": self.nat_gateway_id}],
+        }
+
+
+def _networks(regions: Sequence[str], name_prefix: str, cidr_block: str,
+              result: ProvisionResult) -> Dict[str, RegionNetwork]:
+    networks = {}
+    for region in regions:
+        prefix = f"{name_prefix}-{region}"
+        network = networks[region] = RegionNetwork(region, cidr_block=cidr_block)
+        outputs = {name[len(prefix) + 1:]: value for name, value in result.outputs.items()
+                   if name.startswith(prefix + "-")}
+        network.errors = {name[len(prefix) + 1:]: error for name, error in result.failed.items()
+                          if name.startswith(prefix + "-")}
+        if "vpc" in outputs:
+            network.vpc_id = outputs["vpc"]["vpc_id"]
+            network.security_group_ids = outputs["vpc"]["security_group_ids"]
+        for side in ("public", "private"):
+            network.subnets[side] = [outputs[f"subnet-{side}{zone + 1}"] for zone in range(ZONES)
+                                     if f"subnet-{side}{zone + 1}" in outputs]
+            if f"rtb-{side}" in outputs:
+                network.route_table_ids[side] = outputs[f"rtb-{side}"]["route_table_id"]
+        network.nat_gateway_id = outputs.get("nat", {}).get("nat_gateway_id")
+    return networks
+
+
+def provision_vpcs(regions: Sequence[str], name_prefix: str = "dbacademy", clients: Optional[EC2Clients] = None,
+                   cidr_block: str = "10.0.0.0/16", prefixlen: int = 20, max_workers: int = 32,
+                   retry: Optional[RetryPolicy] = None, waiter_delay: float = 5.0) -> Dict[str, RegionNetwork]:
+    """Build the lab's VPC topology in every region concurrently.
+
+    A failed step only stops the steps of its region that depend on it; the
+    region's ``RegionNetwork.errors`` says which.
+    """
+    clients = clients or EC2Clients(max_pool_connections=max_workers)
+    resources = [r for region in regions for r in vpc_resources(region, name_prefix, cidr_block, prefixlen)]
+    provisioner = Provisioner(resources, ec2_handlers(clients, retry, waiter_delay))
+    return _networks(regions, name_prefix, cidr_block, provisioner.run(max_workers))
+
+
+def vpc_handlers(clients: EC2Clients, **options) -> Dict[str, Callable[[JSON], JSON]]:
+    """Provisioner handler for the ``vpc`` kind of ``workspace_resources``."""
+
+    def build(p: JSON) -> JSON:
+        region = p.get("region", "us-east-1")
+        network = provision_vpcs([region], p["vpc_name"], clients, **options)[region]
+        if not network.ok:
+            name, error = next(iter(network.errors.items()), ("vpc", None))
+            raise RuntimeError(f"Building {p['vpc_name']} in {region} failed at {name}: {error}")
+        return {"vpc_id": network.vpc_id, "subnet_ids": network.subnet_ids,
+                "security_group_ids": network.security_group_ids}
+
+    return {"vpc": build}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build the lab's customer-managed VPC in several regions at once.")
+    parser.add_argument("regions", nargs="+", metavar="REGION")
+    parser.add_argument("--name-prefix", default="dbacademy")
+    parser.add_argument("--cidr-block", default="10.0.0.0/16")
+    parser.add_argument("--prefixlen", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--endpoint-url", help="EC2 endpoint, e.g. a local moto server")
+    args = parser.parse_args(argv)
+
+    clients = EC2Clients(max_pool_connections=args.workers, endpoint_url=args.endpoint_url)
+    networks = provision_vpcs(args.regions, args.name_prefix, clients, args.cidr_block, args.prefixlen,
+                              args.workers)
+    json.dump({region: dict(network.description() if network.ok else {},
+                            errors={name: str(e) for name, e in network.errors.items()})
+               for region, network in networks.items()}, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Batched, adaptive monitoring of workspace provisioning.
+
+Rather than re-running ``GET /workspaces/<WORKSPACE_ID>`` for every pending
+workspace, ``WorkspaceWatcher`` issues one ``GET /workspaces`` per tick for all
+of them. The tick interval adapts to how far the oldest pending workspace is
+from its expected completion: short around the expected time, longer when
+completion is still far off or long overdue.
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .client import AccountClient
+
+# The only fields a tick reads from each listed workspace.
+POLL_FIELDS = ("workspace_id", "workspace_status", "workspace_status_message")
+
+# Statuses after which a workspace no longer changes on its own.
+TERMINAL_STATUSES = frozenset({"RUNNING", "FAILED", "BANNED", "NOT_FOUND"})
+
+# Typical time for a new workspace to reach RUNNING, in seconds. After a PATCH
+# applying a storage key, the labs advise waiting at least 20 minutes.
+EXPECTED_PROVISIONING = 5 * 60.0
+
+
+@dataclass(frozen=True)
+class WorkspaceEvent:
+    workspace_id: int
+    status: str
+    previous_status: Optional[str]
+    message: str
+    elapsed: float
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+
+@dataclass
+class AdaptiveSchedule:
+    """Polling interval as a function of the time since a workspace was submitted.
+
+    The interval is ``min_interval`` at ``expected`` seconds and grows by
+    ``slope`` seconds per second away from it, up to ``max_interval``.
+    """
+
+    expected: float = EXPECTED_PROVISIONING
+    min_interval: float = 5.0
+    max_interval: float = 60.0
+    slope: float = 0.25
+
+    def interval(self, elapsed: float) -> float:
+        return min(self.max_interval, self.min_interval + self.slope * abs(self.expected - elapsed))
+
+
+@dataclass
+class _Pending:
+    started_at: float
+    status: Optional[str] = None
+
+
+class WorkspaceWatcher:
+    """Track many provisioning workspaces with a single list call per tick."""
+
+    def __init__(self, client: AccountClient, schedule: Optional[AdaptiveSchedule] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.client = client
+        self.schedule = schedule or AdaptiveSchedule()
+        self.calls = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._pending: Dict[int, _Pending] = {}
+
+    @property
+    def pending(self) -> List[int]:
+        return list(self._pending)
+
+    def add(self, workspace_id: int, started_at: Optional[float] = None) -> None:
+        """Start tracking a workspace submitted at ``started_at`` (default: now)."""
+        self._pending[int(workspace_id)] = _Pending(self._clock() if started_at is None else started_at)
+
+    def poll(self) -> List[WorkspaceEvent]:
+        """List workspaces once and return the status changes of pending ones.
+
+        The list is streamed straight from the API: a response cached by the
+        client's ``InventoryCache`` would hide transitions for up to its TTL.
+        """
+        if not self._pending:
+            return []
+        self.calls += 1
+        listed = {int(w["workspace_id"]): w for w in self.client.iter_workspaces(POLL_FIELDS)}
+        now = self._clock()
+        events = []
+        for workspace_id, pending in list(self._pending.items()):
+            workspace = listed.get(workspace_id)
+            if workspace is None:
+                status, message = "NOT_FOUND", "Workspace is no longer listed."
+            else:
+                status = workspace.get("workspace_status", "")
+                message = workspace.get("workspace_status_message", "")
+            if status != pending.status:
+                events.append(WorkspaceEvent(workspace_id, status, pending.status, message,
+                                             now - pending.started_at))
+                pending.status = status
+            if status in TERMINAL_STATUSES:
+                del self._pending[workspace_id]
+        return events
+
+    def next_interval(self) -> float:
+        """Time until the next tick, driven by the workspace that needs it soonest."""
+        now = self._clock()
+        return min(self.schedule.interval(now - p.started_at) for p in self._pending.values())
+
+    def watch(self, timeout: Optional[float] = None) -> Iterator[WorkspaceEvent]:
+        """Yield status changes until no workspace is pending or ``timeout`` elapses."""
+        deadline = None if timeout is None else self._clock() + timeout
+        while self._pending:
+            yield from self.poll()
+            if not self._pending:
+                return
+            delay = self.next_interval()
+            if deadline is not None:
+                if self._clock() >= deadline:
+                    return
+                delay = min(delay, deadline - self._clock())
+            self._sleep(delay)
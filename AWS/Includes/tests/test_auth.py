@@ -0,0 +1,150 @@
+import threading
+import time
+
+import pytest
+
+from dbacademy_admin.auth import ServicePrincipalAuth, StaticAuth, basic_authorization
+from dbacademy_admin.client import AccountApiError, AccountClient
+from dbacademy_admin.mock_server import MockAccountServer
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def provider(server, clock=None, **kwargs):
+    server.add_service_principal("sp", "secret")
+    return ServicePrincipalAuth.for_url(server.url_for("test"), "sp", "secret", clock=clock or time.monotonic,
+                                        **kwargs)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_static_auth():
+    assert StaticAuth.basic("user", "pass").authorization() == basic_authorization("user", "pass") == \
+        "Basic dXNlcjpwYXNz"
+
+
+def test_token_is_cached_until_refresh_window(server):
+    clock = Clock()
+    auth = provider(server, clock)  # lifetime 3600s: refresh at 3300s, stale at 3570s
+    header = auth.authorization()
+    assert header.startswith("Bearer ")
+    clock.now += 3000
+    assert auth.authorization() == header
+    assert auth.exchanges == server.tokens_issued == 1
+
+
+def test_refresh_ahead_does_not_block_callers(server):
+    clock = Clock()
+    auth = provider(server, clock)
+    header = auth.authorization()
+    clock.now += 3400  # past refresh_at, before stale_at
+
+    assert auth.authorization() == header  # still the current token, returned at once
+    wait_for(lambda: auth.exchanges == 2)
+    wait_for(lambda: auth.authorization() != header)
+    assert server.tokens_issued == 2
+
+
+def test_background_refresh_happens_once_for_many_callers():
+    with MockAccountServer(latency=0.1) as server:
+        clock = Clock()
+        auth = provider(server, clock)
+        auth.authorization()
+        clock.now += 3400
+        for _ in range(20):
+            auth.authorization()
+        wait_for(lambda: auth.exchanges == 2)
+        time.sleep(0.2)
+        assert auth.exchanges == 2
+
+
+def test_stale_token_is_replaced_before_returning(server):
+    clock = Clock()
+    auth = provider(server, clock)
+    header = auth.authorization()
+    clock.now += 3580  # past stale_at
+    assert auth.authorization() != header
+    assert auth.exchanges == 2
+
+
+def test_failed_background_refresh_keeps_the_current_token(server):
+    clock = Clock()
+    auth = provider(server, clock)
+    header = auth.authorization()
+    server.add_service_principal("sp", "rotated")
+    clock.now += 3400
+    assert auth.authorization() == header
+    wait_for(lambda: auth.last_error is not None)
+    assert isinstance(auth.last_error, AccountApiError) and auth.last_error.status == 401
+    assert auth.authorization() == header
+
+
+def test_client_invalidates_and_retries_after_401():
+    with MockAccountServer(token_lifetime=0.2) as server:
+        # The provider's clock stands still, so it keeps a token the server already considers expired.
+        auth = provider(server, Clock())
+        client = AccountClient(server.url_for("test"), auth)
+        assert client.list_workspaces() == []
+        time.sleep(0.3)
+        assert client.list_workspaces() == []
+        assert server.rejected_tokens == 1
+        assert auth.exchanges == 2
+
+
+def test_streamed_lists_invalidate_and_retry_after_401():
+    with MockAccountServer(token_lifetime=0.2) as server:
+        auth = provider(server, Clock())
+        client = AccountClient(server.url_for("test"), auth)
+        client.create_credentials("dbacademy-credentials", "arn:aws:iam::123456789012:role/dbacademy")
+        time.sleep(0.3)
+        assert [c["credentials_name"] for c in client.stream_list("/credentials", ["credentials_name"])] == \
+            ["dbacademy-credentials"]
+        assert server.rejected_tokens == 1
+        assert auth.exchanges == 2
+
+
+def test_streamed_lists_raise_when_the_new_token_is_rejected_too():
+    with MockAccountServer(token_lifetime=0.0) as server:
+        auth = provider(server, Clock())
+        client = AccountClient(server.url_for("test"), auth)
+        with pytest.raises(AccountApiError) as error:
+            list(client.iter_workspaces())
+        assert error.value.status == 401
+        assert auth.exchanges == 2
+
+
+def test_concurrent_callers_share_one_exchange():
+    with MockAccountServer(latency=0.1) as server:
+        auth = provider(server, Clock())
+        barrier = threading.Barrier(16)
+        headers = []
+
+        def call():
+            barrier.wait()
+            headers.append(auth.authorization())
+
+        threads = [threading.Thread(target=call) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(set(headers)) == 1 and len(headers) == 16
+        assert auth.exchanges == server.tokens_issued == 1
+
+
+def test_bad_credentials_raise(server):
+    auth = ServicePrincipalAuth.for_url(server.url_for("test"), "nobody", "wrong")
+    with pytest.raises(AccountApiError) as error:
+        auth.authorization()
+    assert error.value.status == 401
@@ -0,0 +1,63 @@
+import pytest
+
+from dbacademy_admin.bulk import WorkspaceSpec, create_workspaces
+from dbacademy_admin.client import AccountApiError, AccountClient
+from dbacademy_admin.mock_server import MockAccountServer
+from dbacademy_admin.retry import RetryPolicy, TokenBucket, call_with_retry
+
+
+def specs(count):
+    return [WorkspaceSpec(f"ws-{i}", "creds", "storage") for i in range(count)]
+
+
+@pytest.fixture
+def limited():
+    # 20 calls/s with bursts of 5, and no Retry-After so that backoff stays short.
+    with MockAccountServer(rate_limit=20, burst=5) as server:
+        yield server
+
+
+def test_spec_payload_and_unknown_fields():
+    spec = WorkspaceSpec.from_dict({"workspace_name": "a", "credentials_id": "c", "storage_configuration_id": "s",
+                                    "network_id": "n"})
+    assert spec.to_payload() == {"workspace_name": "a", "credentials_id": "c", "storage_configuration_id": "s",
+                                 "aws_region": "us-east-1", "network_id": "n"}
+    with pytest.raises(ValueError, match="bogus"):
+        WorkspaceSpec.from_dict({"workspace_name": "a", "credentials_id": "c", "storage_configuration_id": "s",
+                                 "bogus": 1})
+
+
+def test_throttled_calls_are_retried_until_all_are_created(limited):
+    client = AccountClient(limited.url_for("test"), "Basic eDp5")
+    # The client limiter allows more than the server does, so some calls get 429s.
+    result = create_workspaces(client, specs(30), max_workers=8, limiter=TokenBucket(rate=200, capacity=30),
+                               retry=RetryPolicy(max_attempts=20, base=0.05, cap=0.5))
+    assert not result.failed
+    assert len(result.created) == 30
+    assert limited.throttled > 0
+    assert result.retries == limited.throttled
+    listed = call_with_retry(client.list_workspaces, RetryPolicy(max_attempts=20, base=0.05, cap=0.5))
+    assert sorted(w["workspace_name"] for w in listed) == sorted(f"ws-{i}" for i in range(30))
+
+
+def test_client_limiter_keeps_under_the_server_limit(limited):
+    client = AccountClient(limited.url_for("test"), "Basic eDp5")
+    result = create_workspaces(client, specs(15), max_workers=8, limiter=TokenBucket(rate=15, capacity=5))
+    assert len(result.created) == 15
+    assert limited.throttled == 0
+    assert result.retries == 0
+
+
+def test_failures_are_reported_without_stopping_the_others(server, client):
+    server.fail_next(400, count=2, method="POST")
+    result = create_workspaces(client, specs(6), max_workers=1, retry=RetryPolicy(base=0.01))
+    assert len(result.created) == 4
+    assert [spec.workspace_name for spec, _ in result.failed] == ["ws-0", "ws-1"]
+    assert all(isinstance(e, AccountApiError) and e.status == 400 for _, e in result.failed)
+
+
+def test_create_answered_with_502_after_commit_is_not_retried(server, client):
+    server.fail_next(502, method="POST", after_commit=True)
+    result = create_workspaces(client, specs(1), retry=RetryPolicy(base=0.01))
+    assert [e.status for _, e in result.failed] == [502]
+    assert len(client.list_workspaces()) == 1  # created once, not duplicated by a retry
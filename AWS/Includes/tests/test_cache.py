@@ -0,0 +1,146 @@
+import pytest
+
+from dbacademy_admin.cache import LIST_KEY, STALE, InventoryCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def cache(clock):
+    cache = InventoryCache(":memory:", clock=clock)
+    yield cache
+    cache.close()
+
+
+def test_entries_expire_after_their_collection_ttl(cache, clock):
+    cache.put("acct", "workspaces", "1", {"workspace_id": 1})
+    cache.put("acct", "credentials", "c", {"credentials_id": "c"})
+    clock.now += 59
+    assert cache.get("acct", "workspaces", "1") == {"workspace_id": 1}
+    clock.now += 1
+    assert cache.get("acct", "workspaces", "1") is None
+    assert cache.get("acct", "credentials", "c") == {"credentials_id": "c"}
+    clock.now += 3600
+    assert cache.get("acct", "credentials", "c") is None
+
+
+def test_ttls_can_be_overridden_and_unknown_collections_are_not_cached(clock):
+    cache = InventoryCache(":memory:", ttls={"workspaces": 5.0}, clock=clock)
+    cache.put("acct", "workspaces", "1", {})
+    cache.put("acct", "metastores", "m", {})
+    assert cache.get("acct", "workspaces", "1") == {} and cache.get("acct", "metastores", "m") is None
+    clock.now += 5
+    assert cache.get("acct", "workspaces", "1") is None
+    assert cache.ttls["networks"] == 3600.0
+
+
+def test_lists_store_their_objects_too(cache):
+    objects = [{"network_id": "n1", "network_name": "a"}, {"network_id": "n2", "network_name": "b"}, {"x": 1}]
+    cache.put_list("acct", "networks", "network_id", objects)
+    assert cache.get("acct", "networks") == objects
+    assert cache.get("acct", "networks", "n2") == {"network_id": "n2", "network_name": "b"}
+    assert cache.get("other", "networks") is None
+
+
+def test_invalidate_drops_the_list_and_the_object(cache):
+    cache.put_list("acct", "workspaces", "workspace_id", [{"workspace_id": 1}, {"workspace_id": 2}])
+    cache.invalidate("acct", "workspaces", "1")
+    assert cache.get("acct", "workspaces", LIST_KEY) is None
+    assert cache.get("acct", "workspaces", "1") is None
+    assert cache.get("acct", "workspaces", "2") == {"workspace_id": 2}
+
+    cache.invalidate("acct", "workspaces")
+    assert cache.get("acct", "workspaces", "2") == {"workspace_id": 2}
+
+
+def test_invalidate_collection_is_scoped_to_the_account(cache):
+    for account in ("a", "b"):
+        cache.put_list(account, "credentials", "credentials_id", [{"credentials_id": "c"}])
+        cache.put(account, "networks", "n", {"network_id": "n"})
+    cache.invalidate_collection("a", "credentials")
+    assert cache.get("a", "credentials") is None and cache.get("a", "credentials", "c") is None
+    assert cache.get("a", "networks", "n") == {"network_id": "n"}
+    assert cache.get("b", "credentials", "c") == {"credentials_id": "c"}
+
+    cache.clear()
+    assert cache.get("b", "credentials", "c") is None
+
+
+def test_oldest_entries_are_evicted(clock):
+    cache = InventoryCache(":memory:", max_entries=3, clock=clock)
+    for i in range(5):
+        clock.now += 1
+        cache.put("acct", "credentials", str(i), i)
+    assert [cache.get("acct", "credentials", str(i)) for i in range(5)] == [None, None, 2, 3, 4]
+    # Replacing an entry does not count towards the bound.
+    for _ in range(3):
+        cache.put("acct", "credentials", "4", "again")
+    assert [cache.get("acct", "credentials", str(i)) for i in range(2, 5)] == [2, 3, "again"]
+
+
+def test_entries_survive_a_restart(tmp_path, clock):
+    path = str(tmp_path / "nested" / "inventory.sqlite")
+    cache = InventoryCache(path, clock=clock)
+    cache.put_list("acct", "workspaces", "workspace_id", [{"workspace_id": 1}])
+    cache.close()
+
+    reopened = InventoryCache(path, clock=clock)
+    assert reopened.get("acct", "workspaces", "1") == {"workspace_id": 1}
+    clock.now += 120
+    assert reopened.get("acct", "workspaces") is None
+    # lists() returns stale lists too, with their storage time.
+    assert reopened.lists("workspaces") == {"acct": ([{"workspace_id": 1}], 1000.0)}
+    reopened.close()
+
+
+def test_client_serves_gets_from_the_cache_and_invalidates_on_writes(make_client, cache):
+    records = []
+    client = make_client(cache=cache, hooks=[records.append])
+
+    def calls():
+        sent = [(r.method, r.endpoint) for r in records]
+        records.clear()
+        return sent
+
+    created = client.create_credentials("dbacademy-credentials", "arn:aws:iam::123456789012:role/r")
+    credentials_id = created["credentials_id"]
+    assert client.list_credentials() == [created]
+    assert client.list_credentials() == [created]
+    assert client.get_credentials(credentials_id) == created
+    assert calls() == [("POST", "/credentials"), ("GET", "/credentials")]
+
+    client.delete_credentials(credentials_id)
+    assert client.list_credentials() == []
+    assert calls() == [("DELETE", "/credentials/{id}"), ("GET", "/credentials")]
+
+    workspace = client.create_workspace({"workspace_name": "w", "deployment_name": "w", "aws_region": "us-east-1"})
+    workspace_id = workspace["workspace_id"]
+    client.get_workspace(workspace_id)
+    client.update_workspace(workspace_id, {"aws_region": "us-west-2"})
+    assert client.get_workspace(workspace_id)["aws_region"] == "us-west-2"
+    assert calls() == [("POST", "/workspaces"), ("GET", "/workspaces/{id}"), ("PATCH", "/workspaces/{id}"),
+                       ("GET", "/workspaces/{id}")]
+
+
+def test_writes_leave_a_stale_list_behind(cache):
+    cache.put_list("acct", "workspaces", "workspace_id", [{"workspace_id": 1}, {"workspace_id": 2}])
+    cache.invalidate("acct", "workspaces", "1")
+    assert cache.lists("workspaces") == {"acct": ([{"workspace_id": 1}, {"workspace_id": 2}], STALE)}
+    assert cache.objects("workspaces") == {"acct": {"2": {"workspace_id": 2}}}
+
+    cache.put("acct", "workspaces", "1", {"workspace_id": 1, "workspace_status": "RUNNING"})
+    cache.remove("acct", "workspaces", "2", "workspace_id")
+    assert cache.lists("workspaces") == {"acct": ([{"workspace_id": 1}], STALE)}
+    assert cache.objects("workspaces") == {"acct": {"1": {"workspace_id": 1, "workspace_status": "RUNNING"}}}
+    assert cache.get("acct", "workspaces") is None
@@ -0,0 +1,159 @@
+import datetime
+import json
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from dbacademy_admin.capacity import (  # noqa: E402
+    DAY, fleet_arrays, main, nodes_per_subnet, plan_capacity, plan_resizes, prefixlen_for,
+)
+from dbacademy_admin.cidr import MAX_PREFIXLEN, MIN_PREFIXLEN  # noqa: E402
+
+NOW = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+
+
+def test_nodes_per_subnet_and_its_inverse():
+    prefixlens = np.arange(16, 29)
+    capacity = nodes_per_subnet(prefixlens)
+    assert capacity[prefixlens == 26][0] == 29 and capacity[prefixlens == 20][0] == 2045
+    assert (prefixlen_for(capacity) == prefixlens).all()
+    assert (prefixlen_for(capacity + 1) == prefixlens - 1).all()
+    assert prefixlen_for(np.array([0]))[0] == 29
+
+
+def test_growth_matches_polyfit():
+    rng = np.random.default_rng(42)
+    n = 50
+    slopes = rng.uniform(-5, 20, n)
+    index = np.repeat(np.arange(n), 30)
+    days = np.tile(np.arange(-29.0, 1.0), n) + rng.uniform(-0.3, 0.3, n * 30)
+    nodes = 100 + slopes[index] * days + rng.normal(0, 3, n * 30)
+    order = rng.permutation(len(index))  # observations arrive in any order
+
+    report = plan_capacity(np.arange(n) + 1000, np.full((n, 2), 20), index[order], NOW + days[order] * DAY,
+                           nodes[order], now=NOW)
+    expected = np.array([np.polyfit(days[index == i], nodes[index == i], 1)[0] for i in range(n)])
+    np.testing.assert_allclose(report.growth, expected, rtol=1e-6, atol=1e-6)
+    latest = [nodes[index == i][np.argmax(days[index == i])] for i in range(n)]
+    np.testing.assert_allclose(report.peak, latest)
+
+
+def test_ties_at_the_latest_time_take_the_highest_peak():
+    index = [0, 0, 0, 1, 1]
+    days = [-1, 0, 0, 0, 0]
+    nodes = [90, 30, 70, 20, 10]
+    for order in ([0, 1, 2, 3, 4], [4, 3, 2, 1, 0], [2, 0, 4, 1, 3]):
+        report = plan_capacity([1, 2], [(26, 26)] * 2, np.take(index, order),
+                               [NOW + days[i] * DAY for i in order], np.take(nodes, order), now=NOW)
+        assert report.peak.tolist() == [70, 20]
+
+
+def test_headroom_and_exhaustion():
+    # Workspace 0 grows 10 nodes/day from 100; 1 is flat; 2 shrinks; 3 is already over; 4 has no data.
+    index = [0, 0, 0, 1, 1, 2, 2, 3]
+    days = [-2, -1, 0, -1, 0, -1, 0, 0]
+    nodes = [80, 90, 100, 50, 50, 60, 40, 70]
+    prefixlens = [(26, 26), (26, 26), (26, 26), (27, 27), (24, 25)]
+    report = plan_capacity([10, 11, 12, 13, 14], prefixlens, index, [NOW + d * DAY for d in days], nodes, now=NOW)
+
+    assert report.capacity.tolist() == [58, 58, 58, 26, 125 + 61]
+    assert report.peak.tolist() == [100, 50, 40, 70, 0]
+    np.testing.assert_allclose(report.growth, [10, 0, -20, 0, 0], atol=1e-9)
+    assert report.headroom.tolist() == [-42, 8, 18, -44, 186]
+    assert report.days_left[0] == 0 and report.days_left[3] == 0
+    assert math.isinf(report.days_left[1]) and math.isinf(report.days_left[2]) and math.isinf(report.days_left[4])
+    assert report.at_risk(0).tolist() == [0, 3]
+    assert report.exhaustion_date(0) == datetime.date(2026, 1, 1) and report.exhaustion_date(1) is None
+    np.testing.assert_allclose(report.utilization, [100 / 58, 50 / 58, 40 / 58, 70 / 26, 0])
+
+
+def test_days_left_and_at_risk_order():
+    index = [0, 0, 1, 1, 2, 2]
+    days = [-1, 0, -1, 0, -1, 0]
+    nodes = [1000, 1045, 1990, 2000, 100, 300]
+    report = plan_capacity([1, 2, 3], [(21, 21)] * 3, index, [NOW + d * DAY for d in days], nodes, now=NOW)
+    # 2 x 1021 nodes of capacity.
+    np.testing.assert_allclose(report.days_left, [(2042 - 1045) / 45, 42 / 10, (2042 - 300) / 200])
+    assert report.at_risk(10).tolist() == [1, 2]
+    assert report.at_risk(30).tolist() == [1, 2, 0]
+    row = report.row(1)
+    assert row["workspace_id"] == 2 and row["exhaustion_date"] == "2026-01-05" and row["growth_per_day"] == 10.0
+
+
+def test_needed_prefixlen():
+    index = [0, 0, 1, 1, 2, 3]
+    days = [-1, 0, -1, 0, 0, 0]
+    nodes = [20, 20, 20, 30, 1, 500000]
+    report = plan_capacity([1, 2, 3, 4], [(26, 26), (26, 26), (20, 21), (17, 17)], index,
+                           [NOW + d * DAY for d in days], nodes, now=NOW, horizon_days=10, margin=1.0)
+    # Flat at 20 nodes: 10 per subnet fit in the current /26s.
+    # Growing to 30 + 10 * 10 = 130 nodes: 65 per subnet outgrow a /25 (61 nodes) and need a /24.
+    # One node never shrinks a /21; 500,000 nodes cannot go past /17.
+    assert report.needed_prefixlen.tolist() == [26, 24, 21, MIN_PREFIXLEN]
+    assert report.needs_resize.tolist() == [False, True, False, False]
+
+    tiny = plan_capacity([1], [(28, 28)], [0], [NOW], [0], now=NOW)
+    assert tiny.needed_prefixlen.tolist() == [MAX_PREFIXLEN]
+
+
+VPC = {
+    "vpc_id": "vpc-1",
+    "cidr_block": "10.0.0.0/22",
+    "subnets": [
+        {"subnet_id": "s-1", "cidr_block": "10.0.0.0/26", "availability_zone": "us-east-1a"},
+        {"subnet_id": "s-2", "cidr_block": "10.0.0.64/26", "availability_zone": "us-east-1b"},
+        {"subnet_id": "s-3", "cidr_block": "10.0.0.128/26", "availability_zone": "us-east-1a"},
+        {"subnet_id": "s-4", "cidr_block": "10.0.0.192/26", "availability_zone": "us-east-1b"},
+    ],
+}
+NETWORKS = [
+    {"network_id": "n-1", "vpc_id": "vpc-1", "subnet_ids": ["s-1", "s-2"]},
+    {"network_id": "n-2", "vpc_id": "vpc-1", "subnet_ids": ["s-3", "s-4"]},
+    {"network_id": "n-3", "vpc_id": "vpc-gone", "subnet_ids": ["s-9", "s-8"]},
+]
+WORKSPACES = [
+    {"workspace_id": 1, "network_id": "n-1"},
+    {"workspace_id": 2, "network_id": "n-2"},
+    {"workspace_id": 3},
+    {"workspace_id": 4, "network_id": "n-3"},
+]
+
+
+def test_fleet_arrays_skips_workspaces_without_known_subnets():
+    cidrs = {s["subnet_id"]: s["cidr_block"] for s in VPC["subnets"]}
+    ids, prefixlens, networks = fleet_arrays(WORKSPACES, NETWORKS, cidrs)
+    assert ids == [1, 2] and prefixlens == [(26, 26), (26, 26)] and networks == NETWORKS[:2]
+
+
+def test_resizes_serve_the_most_urgent_first():
+    # Both workspaces need /24 pairs and the /22 only has room for one more pair. Workspace 2 has
+    # 3 nodes of headroom growing 5/day and runs out before workspace 1 (8 nodes growing 10/day).
+    index = [0, 0, 1, 1]
+    days = [-1, 0, -1, 0]
+    nodes = [40, 50, 50, 55]
+    report = plan_capacity([1, 2], [(26, 26), (26, 26)], index, [NOW + d * DAY for d in days], nodes, now=NOW,
+                           horizon_days=10)
+    assert report.needed_prefixlen.tolist() == [24, 24]
+    np.testing.assert_allclose(report.days_left, [0.8, 0.6])
+    first, second = plan_resizes(report, NETWORKS[:2], [VPC])
+    assert (first.workspace_id, first.pair.cidrs, first.error) == (2, ("10.0.1.0/24", "10.0.2.0/24"), None)
+    assert first.pair.availability_zones == ("us-east-1a", "us-east-1b")
+    assert (second.workspace_id, second.network_id, second.pair) == (1, "n-1", None) and second.error
+
+    assert [r.workspace_id for r in plan_resizes(report, NETWORKS[:2], [VPC], within_days=0.7)] == [2]
+    [missing] = plan_resizes(report, [NETWORKS[2], NETWORKS[2]], [VPC], within_days=0.7)
+    assert missing.error == "VPC not described"
+
+
+def test_command_line(tmp_path, capsys):
+    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    peaks = [{"workspace_id": 1, "time": now - DAY, "nodes": 40}, {"workspace_id": 1, "time": now, "nodes": 50},
+             {"workspace_id": 2, "time": now, "nodes": 5}, {"workspace_id": 3, "time": now, "nodes": 500}]
+    path = tmp_path / "fleet.json"
+    path.write_text(json.dumps({"workspaces": WORKSPACES, "networks": NETWORKS, "vpcs": [VPC], "peaks": peaks}))
+    main([str(path), "--within-days", "30", "--horizon-days", "10", "--margin", "1"])
+    [row] = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert row["workspace_id"] == 1 and row["capacity"] == 58 and row["peak"] == 50.0
+    assert row["new_subnets"] == ["10.0.1.0/24", "10.0.2.0/24"] and row["resize_error"] is None
@@ -0,0 +1,131 @@
+import ipaddress
+import random
+
+import pytest
+
+from dbacademy_admin.cidr import AddressSpaceExhausted, SubnetAllocator
+
+ZONES = ["us-east-1a", "us-east-1b"]
+
+
+def net(cidr):
+    return ipaddress.IPv4Network(cidr)
+
+
+def test_allocates_lowest_block_first_and_splits():
+    allocator = SubnetAllocator("10.0.0.0/16")
+    assert allocator.allocate(20) == net("10.0.0.0/20")
+    assert allocator.allocate(24) == net("10.0.16.0/24")
+    assert allocator.allocate(20) == net("10.0.32.0/20")
+    assert allocator.allocate(24) == net("10.0.17.0/24")
+    assert allocator.free_addresses() == 2 ** 16 - 2 * 4096 - 2 * 256
+
+
+def test_existing_subnets_are_skipped():
+    allocator = SubnetAllocator("10.0.0.0/16", ["10.0.0.0/20", "10.0.16.0/20", "10.0.128.0/20", "10.0.40.0/24"])
+    assert allocator.allocate(20) == net("10.0.48.0/20")
+    assert allocator.allocate(21) == net("10.0.32.0/21")
+    assert allocator.allocate(24) == net("10.0.41.0/24")
+
+
+@pytest.mark.parametrize("cidr", ["10.0.0.0/24", "10.0.0.0/8", "10.0.1.0/24"])
+def test_reserve_rejects_overlaps_and_outside_blocks(cidr):
+    allocator = SubnetAllocator("10.0.0.0/16", ["10.0.0.0/23"])
+    with pytest.raises(ValueError):
+        allocator.reserve(cidr)
+    with pytest.raises(ValueError):
+        SubnetAllocator("10.0.0.0/16").reserve("10.1.0.0/24")
+
+
+def test_release_merges_buddies_back():
+    allocator = SubnetAllocator("10.0.0.0/16")
+    blocks = [allocator.allocate(prefixlen) for prefixlen in (18, 20, 24, 26, 20, 17)]
+    with pytest.raises(AddressSpaceExhausted):
+        allocator.allocate(16)
+    random.Random(7).shuffle(blocks)
+    for block in blocks:
+        allocator.release(block)
+    assert allocator.free_addresses() == 2 ** 16
+    assert allocator.allocate(16) == net("10.0.0.0/16")
+
+
+def test_release_stops_at_a_used_buddy():
+    allocator = SubnetAllocator("10.0.0.0/24")
+    low, high = allocator.allocate(25), allocator.allocate(25)
+    allocator.release(low)
+    with pytest.raises(AddressSpaceExhausted):
+        allocator.allocate(24)
+    assert allocator.allocate(25) == low
+    allocator.release(low)
+    allocator.release(high)
+    assert allocator.allocate(24) == net("10.0.0.0/24")
+
+
+def test_exhaustion():
+    allocator = SubnetAllocator("10.0.0.0/24")
+    allocator.allocate(25)
+    allocator.allocate(26)
+    with pytest.raises(AddressSpaceExhausted):
+        allocator.allocate(25)
+    assert allocator.allocate(26) == net("10.0.0.192/26")
+    with pytest.raises(ValueError):
+        allocator.allocate(23)
+
+
+def test_random_allocations_never_overlap():
+    rng = random.Random(1234)
+    allocator = SubnetAllocator("10.0.0.0/16", ["10.0.0.0/20"])
+    used = [net("10.0.0.0/20")]
+    for _ in range(2000):
+        if used[1:] and rng.random() < 0.4:
+            allocator.release(used.pop(rng.randrange(1, len(used))))
+            continue
+        try:
+            block = allocator.allocate(rng.randint(18, 28))
+        except AddressSpaceExhausted:
+            continue
+        assert not any(block.overlaps(other) for other in used)
+        used.append(block)
+        assert allocator.free_addresses() == 2 ** 16 - sum(b.num_addresses for b in used)
+
+
+def test_pairs_are_in_different_zones():
+    allocator = SubnetAllocator("10.0.0.0/16", ["10.0.0.0/20"])
+    pair = allocator.allocate_pair(20, ZONES)
+    assert pair.cidrs == ("10.0.16.0/20", "10.0.32.0/20")
+    assert pair.availability_zones == tuple(ZONES)
+    for zones in (["us-east-1a"], ["us-east-1a", "us-east-1a"]):
+        with pytest.raises(ValueError):
+            allocator.allocate_pair(20, zones)
+    for prefixlen in (16, 27):
+        with pytest.raises(ValueError):
+            allocator.allocate_pair(prefixlen, ZONES)
+
+
+def test_pair_is_released_when_the_second_subnet_does_not_fit():
+    allocator = SubnetAllocator("10.0.0.0/23", ["10.0.0.0/24"])
+    before = allocator.free_addresses()
+    with pytest.raises(AddressSpaceExhausted):
+        allocator.allocate_pair(24, ZONES)
+    assert allocator.free_addresses() == before
+    assert allocator.allocate(24) == net("10.0.1.0/24")
+
+
+def test_plan_rotates_through_zones():
+    zones = ["a", "b", "c", "a"]
+    pairs = SubnetAllocator("10.0.0.0/16").plan(3, 20, zones)
+    assert [p.availability_zones for p in pairs] == [("a", "b"), ("c", "a"), ("b", "c")]
+    cidrs = [c for p in pairs for c in p.cidrs]
+    assert cidrs == [f"10.0.{16 * i}.0/20" for i in range(6)]
+    with pytest.raises(ValueError):
+        SubnetAllocator("10.0.0.0/16").plan(1, 20, ["a", "a"])
+
+
+def test_plan_is_all_or_nothing():
+    allocator = SubnetAllocator("10.0.0.0/22", ["10.0.0.0/24"])
+    before = allocator.free_addresses()
+    with pytest.raises(AddressSpaceExhausted):
+        allocator.plan(2, 24, ZONES)
+    assert allocator.free_addresses() == before
+    # The released blocks merged back: a /23 is still available.
+    assert allocator.allocate(23) == net("10.0.2.0/23")
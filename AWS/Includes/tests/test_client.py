@@ -0,0 +1,86 @@
+import http.client
+import http.server
+import threading
+
+import pytest
+
+from dbacademy_admin.client import ConnectionPool
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Records each request; ``server.drop`` lists methods whose connection is closed instead of answered.
+
+    With ``server.idle_close``, connections are closed after each answer, as
+    an idle timeout would, though the answer says they are kept alive.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def _answer(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.server.requests.append(self.command)
+        self.close_connection = self.server.idle_close
+        if self.command in self.server.drop:
+            self.close_connection = True
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _answer
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests, server.drop, server.idle_close = [], set(), False
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pool(server):
+    pool = ConnectionPool("http", f"127.0.0.1:{server.server_address[1]}")
+    yield pool
+    pool.close()
+
+
+@pytest.mark.parametrize("method", ["GET", "POST", "PATCH", "PUT", "DELETE"])
+def test_requests_are_retried_when_an_idle_connection_was_closed(server, pool, method):
+    server.idle_close = True
+    assert pool.request("GET", "/") == (200, b"{}")
+    timings = {}
+    assert pool.request(method, "/", None if method == "GET" else b"{}", timings=timings) == (200, b"{}")
+    assert timings["reused"] is False
+    assert server.requests == ["GET", method]
+
+
+@pytest.mark.parametrize("method", ["POST", "PATCH"])
+def test_written_requests_are_not_sent_twice(server, pool, method):
+    assert pool.request("GET", "/") == (200, b"{}")
+    server.drop.add(method)
+    with pytest.raises((http.client.HTTPException, OSError)):
+        pool.request(method, "/", b"{}")
+    assert server.requests == ["GET", method]
+
+
+@pytest.mark.parametrize("method", ["GET", "PUT", "DELETE"])
+def test_written_idempotent_requests_are_retried(server, pool, method):
+    assert pool.request("GET", "/") == (200, b"{}")
+    server.drop.add(method)
+    # The retry is made on a fresh connection, which fails in turn.
+    with pytest.raises((http.client.HTTPException, OSError)):
+        pool.request(method, "/", b"{}")
+    assert server.requests == ["GET", method, method]
+
+
+def test_a_refused_connection_is_not_retried():
+    pool = ConnectionPool("http", "127.0.0.1:1")
+    with pytest.raises(OSError):
+        pool.request("GET", "/")
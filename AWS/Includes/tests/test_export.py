@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from dbacademy_admin.export import load_snapshots, schema, snapshot_dates, to_table, write_snapshot  # noqa: E402
+from dbacademy_admin.inventory import AccountInventory, Inventory  # noqa: E402
+
+DAY = datetime.date(2026, 5, 1)
+
+
+def inventory(workspace_count=3):
+    a = AccountInventory("a", workspaces=[
+        {"workspace_id": 1000 + i, "workspace_name": f"w{i}", "aws_region": "us-east-1", "workspace_status": "RUNNING",
+         "credentials_id": "c-1", "creation_time": 1714521600000 + i} for i in range(workspace_count)
+    ], networks=[
+        {"network_id": "n-1", "vpc_id": "vpc-1", "subnet_ids": ["s-1", "s-2"], "security_group_ids": ["sg-1"]},
+        {"network_id": "n-2", "vpc_id": "vpc-2", "subnet_ids": ["s-3", "s-4"]},
+    ], credentials=[
+        {"credentials_id": "c-1", "credentials_name": "creds",
+         "aws_credentials": {"sts_role": {"role_arn": "arn:aws:iam::1:role/r", "external_id": "a"}}},
+    ])
+    b = AccountInventory("b", workspaces=[{"workspace_id": 9, "workspace_name": "b", "aws_region": "eu-west-1"}])
+    b.errors["networks"] = "HTTP 500 from GET /networks"
+    return Inventory({"a": a, "b": b})
+
+
+@pytest.mark.parametrize("fmt", ["arrow", "parquet"])
+def test_round_trip(tmp_path, fmt):
+    root = str(tmp_path)
+    written = write_snapshot(inventory(), root, DAY, [fmt])
+    assert len(written) == 5 and all(path.endswith("." + fmt) for path in written)
+    assert snapshot_dates(root, "workspaces", fmt) == [DAY]
+
+    workspaces = load_snapshots(root, "workspaces", fmt=fmt)
+    assert workspaces.schema.equals(schema("workspaces"))
+    assert workspaces.column("workspace_id").to_pylist() == [1000, 1001, 1002, 9]
+    assert workspaces.column("account_id").to_pylist() == ["a", "a", "a", "b"]
+    assert workspaces.column("aws_region").type == pa.dictionary(pa.int32(), pa.string())
+    assert workspaces.column("network_id").to_pylist() == [None] * 4
+    assert workspaces.column("creation_time")[0].as_py() == \
+        datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc)
+    assert workspaces.column("listing_error").null_count == 4
+
+    credentials = load_snapshots(root, "credentials", fmt=fmt, columns=["credentials_id", "role_arn", "external_id"])
+    assert credentials.to_pylist() == [{"credentials_id": "c-1", "role_arn": "arn:aws:iam::1:role/r",
+                                        "external_id": "a"}]
+
+    networks = load_snapshots(root, "networks", fmt=fmt).to_pylist()
+    assert [n["subnet_ids"] for n in networks] == [["s-1", "s-2"], ["s-3", "s-4"], None]
+    # A missing list is null, not empty.
+    assert [n["security_group_ids"] for n in networks] == [["sg-1"], None, None]
+
+
+@pytest.mark.parametrize("fmt", ["arrow", "parquet"])
+def test_failed_listings_are_marked_not_emptied(tmp_path, fmt):
+    write_snapshot(inventory(), str(tmp_path), DAY, [fmt])
+    networks = load_snapshots(str(tmp_path), "networks", fmt=fmt,
+                              columns=["account_id", "listing_error", "network_id"]).to_pylist()
+    assert networks[-1] == {"account_id": "b", "listing_error": "HTTP 500 from GET /networks", "network_id": None}
+    assert [n["listing_error"] for n in networks[:-1]] == [None, None]
+    # The account's other listings are unaffected.
+    assert load_snapshots(str(tmp_path), "workspaces", fmt=fmt).column("listing_error").null_count == 4
+
+
+def test_date_ranges_and_rewrites(tmp_path):
+    root = str(tmp_path)
+    for offset in range(3):
+        write_snapshot(inventory(workspace_count=offset + 1), root, DAY + datetime.timedelta(days=offset))
+    write_snapshot(inventory(workspace_count=5), root, DAY + datetime.timedelta(days=1))
+    assert len(snapshot_dates(root, "workspaces")) == 3 and len(snapshot_dates(root, "workspaces", "parquet")) == 3
+    assert not list(tmp_path.rglob("*.partial"))
+
+    table = load_snapshots(root, "workspaces", start=DAY + datetime.timedelta(days=1), columns=["snapshot_date"])
+    days = table.column("snapshot_date").to_pylist()
+    assert days.count(DAY + datetime.timedelta(days=1)) == 6 and days.count(DAY + datetime.timedelta(days=2)) == 4
+
+    empty = load_snapshots(root, "workspaces", start=DAY + datetime.timedelta(days=10))
+    assert empty.num_rows == 0 and empty.schema.equals(schema("workspaces"))
+    assert load_snapshots(str(tmp_path / "missing"), "networks", columns=["vpc_id"]).column_names == ["vpc_id"]
+
+
+def test_to_table_of_nothing():
+    table = to_table([], "customer_managed_keys", DAY)
+    assert table.num_rows == 0 and table.schema.equals(schema("customer_managed_keys"))
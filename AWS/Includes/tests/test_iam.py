@@ -0,0 +1,125 @@
+import json
+import threading
+
+import pytest
+
+from dbacademy_admin.iam import (
+    POLICY_NAME, NotReady, RoleFactory, RoleSpec, _document, iam_probe, lab_roles, role_handlers,
+)
+from dbacademy_admin.retry import RetryPolicy
+
+DATABRICKS_ACCOUNT_ID = "414351767826"
+
+
+@pytest.fixture
+def iam(aws):
+    return aws.client("iam")
+
+
+def fast_readiness(max_attempts=12):
+    return RetryPolicy(max_attempts=max_attempts, base=0.02, cap=0.05, retryable=lambda e: isinstance(e, NotReady))
+
+
+class Recorder:
+    """Records role creations and readiness, holding each role back for ``probes`` probes."""
+
+    def __init__(self, iam, probes=4):
+        self.events = []
+        self.probes = probes
+        self.counts = {}
+        self.lock = threading.Lock()
+        iam.meta.events.register("provide-client-params.iam.CreateRole", self.created)
+
+    def created(self, params, **kwargs):
+        with self.lock:
+            self.events.append(("create", params["RoleName"]))
+
+    def probe(self, client, spec, policy):
+        with self.lock:
+            count = self.counts[spec.role_name] = self.counts.get(spec.role_name, 0) + 1
+        ready = count >= self.probes and iam_probe(client, spec, policy)
+        if ready:
+            with self.lock:
+                self.events.append(("ready", spec.role_name))
+        return ready
+
+    def index(self, kind, name):
+        return self.events.index((kind, name))
+
+
+def test_roles_are_created_with_their_policies(iam):
+    factory = RoleFactory(DATABRICKS_ACCOUNT_ID, iam, max_workers=4, readiness=fast_readiness())
+    specs = lab_roles(["dbacademy-a", "dbacademy-b"]) + lab_roles(["dbacademy-a"], "metastore")
+    batch = factory.create_all(specs, batch_size=2)
+    assert not batch.failed
+    assert [r.spec.role_name for r in batch.results] == [s.role_name for s in specs]
+
+    for result in batch.results:
+        role = iam.get_role(RoleName=result.spec.role_name)["Role"]
+        assert result.role_arn == role["Arn"] and result.created
+        assert _document(role["AssumeRolePolicyDocument"]) == result.spec.trust_policy(DATABRICKS_ACCOUNT_ID)
+        document = iam.get_role_policy(RoleName=result.spec.role_name, PolicyName=POLICY_NAME)["PolicyDocument"]
+        assert _document(document) == result.spec.permissions_policy(role["Arn"].split(":")[4])
+
+    trust = json.loads(specs[0].trust_policy(DATABRICKS_ACCOUNT_ID))
+    assert trust["Statement"][0]["Principal"] == {"AWS": f"arn:aws:iam::{DATABRICKS_ACCOUNT_ID}:root"}
+    metastore = json.loads(specs[2].permissions_policy("123456789012"))
+    assert "arn:aws:s3:::dbacademy-a-metastore-bucket" in json.dumps(metastore)
+
+
+def test_existing_role_is_brought_up_to_date(iam):
+    spec = RoleSpec("dbacademy-existing-role")
+    iam.create_role(RoleName=spec.role_name, AssumeRolePolicyDocument=json.dumps({
+        "Version": "2012-10-17", "Statement": []}))
+    factory = RoleFactory(DATABRICKS_ACCOUNT_ID, iam, readiness=fast_readiness())
+    result = factory.wait_ready(factory.create(spec))
+    assert not result.created
+    role = iam.get_role(RoleName=spec.role_name)["Role"]
+    assert _document(role["AssumeRolePolicyDocument"]) == spec.trust_policy(DATABRICKS_ACCOUNT_ID)
+    assert iam_probe(iam, spec, spec.permissions_policy(role["Arn"].split(":")[4]))
+
+
+def test_pipelined_batches_are_created_while_earlier_ones_propagate(iam):
+    recorder = Recorder(iam)
+    factory = RoleFactory(DATABRICKS_ACCOUNT_ID, iam, max_workers=4, readiness=fast_readiness(),
+                          probe=recorder.probe)
+    specs = lab_roles([f"pipelined-{i}" for i in range(6)])
+    batch = factory.create_all(specs, batch_size=3, pipeline=True)
+    assert not batch.failed
+    first, second = specs[:3], specs[3:]
+    last_ready_of_first = max(recorder.index("ready", s.role_name) for s in first)
+    assert min(recorder.index("create", s.role_name) for s in second) < last_ready_of_first
+    assert all(r.probes >= recorder.probes for r in batch.results)
+
+
+def test_batched_mode_waits_for_readiness_before_the_next_batch(iam):
+    recorder = Recorder(iam)
+    factory = RoleFactory(DATABRICKS_ACCOUNT_ID, iam, max_workers=4, readiness=fast_readiness(),
+                          probe=recorder.probe)
+    specs = lab_roles([f"batched-{i}" for i in range(6)])
+    batch = factory.create_all(specs, batch_size=3, pipeline=False)
+    assert not batch.failed
+    first, second = specs[:3], specs[3:]
+    last_ready_of_first = max(recorder.index("ready", s.role_name) for s in first)
+    assert min(recorder.index("create", s.role_name) for s in second) > last_ready_of_first
+
+
+def test_roles_that_never_become_ready_fail(iam):
+    factory = RoleFactory(DATABRICKS_ACCOUNT_ID, iam, readiness=fast_readiness(max_attempts=3),
+                          probe=lambda client, spec, policy: False)
+    batch = factory.create_all(lab_roles(["never"]))
+    assert [type(r.error) for r in batch.failed] == [NotReady]
+    assert batch.results[0].probes == 3
+
+
+def test_role_handler_returns_a_ready_role(iam):
+    handler = role_handlers(RoleFactory(DATABRICKS_ACCOUNT_ID, iam, readiness=fast_readiness()))["iam_role"]
+    outputs = handler({"role_name": "handled-role", "role_kind": "metastore", "bucket_name": "handled-bucket"})
+    assert outputs == {"role_arn": iam.get_role(RoleName="handled-role")["Role"]["Arn"]}
+
+
+def test_metastore_roles_need_a_bucket():
+    with pytest.raises(ValueError):
+        RoleSpec("role", "metastore")
+    with pytest.raises(ValueError):
+        RoleSpec("role", "unknown")
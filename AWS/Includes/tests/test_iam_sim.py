@@ -0,0 +1,160 @@
+import json
+
+import pytest
+
+from dbacademy_admin.iam import RoleSpec
+from dbacademy_admin.iam_sim import PolicySimulator
+
+DATABRICKS_ACCOUNT_ID = "414351767826"
+
+
+def allow(action, resource="*", condition=None, sid=None, **extra):
+    statement = dict(Effect="Allow", Action=action, Resource=resource, **extra)
+    if condition is not None:
+        statement["Condition"] = condition
+    if sid is not None:
+        statement["Sid"] = sid
+    return {"Version": "2012-10-17", "Statement": [statement]}
+
+
+@pytest.mark.parametrize("context", [None, {}, {"aws:TagKeys": []}])
+def test_for_all_values_on_a_missing_or_empty_key_holds(context):
+    simulator = PolicySimulator([allow("ec2:CreateTags", condition={
+        "ForAllValues:StringEquals": {"aws:TagKeys": ["Name", "Owner"]}})])
+    assert simulator.is_allowed("ec2:CreateTags", context=context)
+    assert simulator.is_allowed("ec2:CreateTags", context={"aws:TagKeys": ["Name"]})
+    assert not simulator.is_allowed("ec2:CreateTags", context={"aws:TagKeys": ["Name", "Cost"]})
+
+
+@pytest.mark.parametrize("context", [None, {"aws:TagKeys": []}])
+def test_for_any_value_on_a_missing_or_empty_key_fails(context):
+    simulator = PolicySimulator([allow("ec2:CreateTags", condition={
+        "ForAnyValue:StringEquals": {"aws:TagKeys": ["Name"]}})])
+    assert not simulator.is_allowed("ec2:CreateTags", context=context)
+    assert simulator.is_allowed("ec2:CreateTags", context={"aws:TagKeys": ["Cost", "Name"]})
+
+
+@pytest.mark.parametrize("context", [None, {"aws:TagKeys": []}])
+def test_for_any_value_with_a_negated_operator_on_a_missing_or_empty_key_fails(context):
+    simulator = PolicySimulator([allow("ec2:CreateTags", condition={
+        "ForAnyValue:StringNotEquals": {"aws:TagKeys": ["Name"]}})])
+    assert not simulator.is_allowed("ec2:CreateTags", context=context)
+    assert simulator.is_allowed("ec2:CreateTags", context={"aws:TagKeys": ["Name", "Cost"]})
+    assert not simulator.is_allowed("ec2:CreateTags", context={"aws:TagKeys": ["Name"]})
+
+
+def test_for_any_value_if_exists_only_covers_a_missing_key():
+    simulator = PolicySimulator([allow("ec2:CreateTags", condition={
+        "ForAnyValue:StringEqualsIfExists": {"aws:TagKeys": ["Name"]}})])
+    assert simulator.is_allowed("ec2:CreateTags")
+    assert not simulator.is_allowed("ec2:CreateTags", context={"aws:TagKeys": []})
+
+
+def test_exact_and_wildcard_actions():
+    simulator = PolicySimulator([allow(["s3:GetObject", "kms:ReEncrypt*", "ec2:Describe?pcs"]), allow("sts:*")])
+    assert simulator.is_allowed("s3:GetObject")
+    assert simulator.is_allowed("S3:getobject"), "action names are case-insensitive"
+    assert not simulator.is_allowed("s3:GetObjectAcl")
+    assert simulator.is_allowed("kms:ReEncryptFrom") and simulator.is_allowed("kms:ReEncrypt")
+    assert not simulator.is_allowed("kms:Encrypt")
+    assert simulator.is_allowed("ec2:DescribeVpcs") and not simulator.is_allowed("ec2:DescribeVpcss")
+    assert simulator.is_allowed("sts:AssumeRole")
+    assert simulator.evaluate("iam:PassRole").reason == "implicit deny"
+
+
+def test_service_wildcards_and_not_action():
+    simulator = PolicySimulator([
+        allow("*:Get*", sid="Reads"),
+        {"Statement": [{"Sid": "AllButIam", "Effect": "Allow", "NotAction": "iam:*", "Resource": "*"}]},
+    ])
+    assert simulator.evaluate("s3:GetObject").statements == ("Reads", "AllButIam")
+    assert simulator.evaluate("iam:GetRole").statements == ("Reads",)
+    assert not simulator.is_allowed("iam:CreateRole")
+    assert simulator.is_allowed("ec2:CreateVpc")
+
+
+def test_resources_and_not_resource():
+    simulator = PolicySimulator([
+        allow("s3:*", ["arn:aws:s3:::dbacademy-*", "arn:aws:s3:::dbacademy-*/*"]),
+        {"Statement": [{"Effect": "Allow", "Action": "kms:Decrypt", "NotResource": "arn:aws:kms:*:*:key/secret"}]},
+    ])
+    assert simulator.is_allowed("s3:PutObject", "arn:aws:s3:::dbacademy-lab/data/part-0")
+    assert not simulator.is_allowed("s3:PutObject", "arn:aws:s3:::other-bucket/data")
+    assert simulator.is_allowed("kms:Decrypt", "arn:aws:kms:us-east-1:123:key/lab")
+    assert not simulator.is_allowed("kms:Decrypt", "arn:aws:kms:us-east-1:123:key/secret")
+
+
+def test_explicit_deny_wins():
+    simulator = PolicySimulator([
+        allow("s3:*", sid="Everything"),
+        {"Statement": [{"Sid": "NoDeletes", "Effect": "Deny", "Action": "s3:Delete*", "Resource": "*"}]},
+    ])
+    decision = simulator.evaluate("s3:DeleteObject", "arn:aws:s3:::b/k")
+    assert (decision.allowed, decision.reason, decision.statements) == (False, "explicit deny", ("NoDeletes",))
+    assert simulator.evaluate("s3:PutObject").statements == ("Everything",)
+
+
+@pytest.mark.parametrize("operator, expected, value, allowed", [
+    ("StringEquals", "lab", "lab", True),
+    ("StringEquals", "lab", "LAB", False),
+    ("StringEqualsIgnoreCase", "lab", "LAB", True),
+    ("StringNotEquals", "prod", "lab", True),
+    ("StringNotEquals", "lab", "lab", False),
+    ("StringLike", "lab-*", "lab-1", True),
+    ("StringLike", "lab-?", "lab-10", False),
+    ("StringNotLike", "prod-*", "lab-1", True),
+    ("ArnLike", "arn:aws:iam::*:role/dbacademy-*", "arn:aws:iam::123:role/dbacademy-a", True),
+    ("Bool", "true", "True", True),
+    ("Bool", "true", "false", False),
+])
+def test_condition_operators(operator, expected, value, allowed):
+    simulator = PolicySimulator([allow("s3:GetObject", condition={operator: {"aws:ResourceTag/env": expected}})])
+    assert simulator.is_allowed("s3:GetObject", context={"aws:ResourceTag/env": value}) is allowed
+
+
+def test_missing_keys_and_if_exists():
+    simulator = PolicySimulator([
+        allow("s3:GetObject", condition={"StringEquals": {"aws:SourceVpc": "vpc-1"}}),
+        allow("s3:PutObject", condition={"StringEqualsIfExists": {"aws:SourceVpc": "vpc-1"}}),
+        allow("s3:DeleteObject", condition={"StringNotEquals": {"aws:SourceVpc": "vpc-2"}}),
+        allow("s3:ListBucket", condition={"Null": {"aws:SourceVpc": "false"}}),
+    ])
+    assert not simulator.is_allowed("s3:GetObject")
+    assert simulator.is_allowed("s3:PutObject")
+    assert not simulator.is_allowed("s3:PutObject", context={"aws:SourceVpc": "vpc-2"})
+    assert simulator.is_allowed("s3:DeleteObject")
+    assert not simulator.is_allowed("s3:ListBucket")
+    assert simulator.is_allowed("s3:ListBucket", context={"AWS:SourceVpc": "vpc-9"}), "keys are case-insensitive"
+
+
+def test_unsupported_operator_is_an_error():
+    simulator = PolicySimulator([allow("s3:GetObject", condition={"NumericLessThan": {"s3:max-keys": "10"}})])
+    with pytest.raises(ValueError, match="NumericLessThan"):
+        simulator.is_allowed("s3:GetObject", context={"s3:max-keys": "5"})
+
+
+def test_lab_trust_policy():
+    trust = json.loads(RoleSpec("dbacademy-role").trust_policy(DATABRICKS_ACCOUNT_ID))
+    simulator = PolicySimulator([trust])
+    databricks = f"arn:aws:iam::{DATABRICKS_ACCOUNT_ID}:role/anything"
+    context = {"sts:ExternalId": DATABRICKS_ACCOUNT_ID}
+    assert simulator.is_allowed("sts:AssumeRole", context=context, principal=databricks)
+    assert not simulator.is_allowed("sts:AssumeRole", context={"sts:ExternalId": "other"}, principal=databricks)
+    assert not simulator.is_allowed("sts:AssumeRole", context=context, principal="arn:aws:iam::111122223333:root")
+
+
+def test_lab_metastore_permissions():
+    spec = RoleSpec("dbacademy-metastore", "metastore", "dbacademy-bucket")
+    simulator = PolicySimulator([json.loads(spec.permissions_policy("123456789012"))])
+    assert simulator.is_allowed("s3:PutObject", "arn:aws:s3:::dbacademy-bucket/tables/t/part-0")
+    assert simulator.is_allowed("s3:ListBucket", "arn:aws:s3:::dbacademy-bucket")
+    assert not simulator.is_allowed("s3:PutObject", "arn:aws:s3:::another-bucket/x")
+    assert not simulator.is_allowed("s3:DeleteBucket", "arn:aws:s3:::dbacademy-bucket")
+    assert simulator.is_allowed("sts:AssumeRole", "arn:aws:iam::123456789012:role/dbacademy-metastore")
+
+
+def test_policies_added_later_are_seen():
+    simulator = PolicySimulator([allow("s3:GetObject")])
+    assert not simulator.is_allowed("s3:PutObject")
+    simulator.add_policy(allow("s3:Put*"))
+    assert simulator.is_allowed("s3:PutObject")
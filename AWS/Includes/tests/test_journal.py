@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+from dbacademy_admin import journal as journal_module
+from dbacademy_admin.cache import InventoryCache
+from dbacademy_admin.client import AccountApiError
+from dbacademy_admin.journal import (
+    Journal, call_once, create_object, create_once, find_by_name, journaled_handlers,
+)
+
+
+def test_replay_restores_results_and_pending(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    with Journal(path) as journal:
+        journal.intent("a")
+        journal.result("a", {"id": 1})
+        journal.intent("b")
+    with open(path, "a") as f:
+        f.write('{"type":"result","key":"b"')  # torn write
+
+    with Journal(path) as journal:
+        assert journal.results == {"a": {"id": 1}}
+        assert journal.pending == {"b"}
+        journal.result("b", {"id": 2})
+    with Journal(path) as journal:
+        assert journal.results == {"a": {"id": 1}, "b": {"id": 2}}
+        assert not journal.pending
+
+
+def test_create_once_skips_completed_and_adopts_uncertain(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    calls = []
+    with Journal(path) as journal:
+        assert create_once(journal, "k", lambda: calls.append("create") or {"id": 1}, lambda: None) == {"id": 1}
+        assert create_once(journal, "k", lambda: calls.append("create") or {"id": 2}, lambda: None) == {"id": 1}
+        journal.intent("crashed")
+    assert calls == ["create"]
+
+    with Journal(path) as journal:
+        found = create_once(journal, "crashed", lambda: calls.append("create") or {"id": 3}, lambda: {"id": 4})
+    assert found == {"id": 4}
+    assert calls == ["create"]
+
+
+def test_append_raises_when_the_writer_fails(tmp_path, monkeypatch):
+    def fail(fd):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(journal_module.os, "fsync", fail)
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    errors = []
+
+    def append():
+        try:
+            journal.intent("a")
+        except OSError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=append, daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive(), "append() blocked after the writer failed"
+    assert errors and errors[0].errno == 28
+    with pytest.raises(OSError):
+        journal.result("a", {})
+    journal.close()
+
+
+def test_find_by_name_bypasses_the_inventory_cache(client, make_client, tmp_path):
+    cached = make_client(cache=InventoryCache(":memory:"))
+    assert cached.list_credentials() == []  # now cached as empty
+
+    # An interrupted run created the object through another client.
+    client.create_credentials("creds", "arn:aws:iam::1:role/r")
+    assert cached.list_credentials() == []
+    assert find_by_name(cached, "credentials", "creds")["credentials_name"] == "creds"
+
+    with Journal(str(tmp_path / "journal.jsonl")) as journal:
+        journal.intent("credentials/creds")
+    with Journal(str(tmp_path / "journal.jsonl")) as journal:
+        create_object(cached, journal, "credentials", {
+            "credentials_name": "creds", "aws_credentials": {"sts_role": {"role_arn": "arn:aws:iam::1:role/r"}}})
+    assert len(client.list_credentials()) == 1
+
+
+@pytest.mark.parametrize("run", [
+    lambda journal, call: create_once(journal, "k", call, lambda: None),
+    lambda journal, call: call_once(journal, "k", call),
+    lambda journal, call: journaled_handlers(journal, {"step": lambda params: call()})["step"]({"name": "k"}),
+], ids=["create_once", "call_once", "journaled_handlers"])
+def test_a_failing_journal_does_not_hide_the_api_error(tmp_path, run):
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+
+    def call():
+        # The journal fails while the call is in flight: the intent was durable, the error record cannot be.
+        with journal._cond:
+            journal._failure = OSError(28, "No space left on device")
+        raise AccountApiError(400, "POST", "/workspaces", b'{"message": "boom"}')
+
+    with pytest.raises(AccountApiError, match="boom"):
+        run(journal, call)
+    with pytest.raises(OSError):
+        journal.intent("next")
+    journal.close()
@@ -0,0 +1,147 @@
+import os
+import re
+
+import pytest
+
+from dbacademy_admin import magic
+from dbacademy_admin.magic import AccountApiSession, ApiList, ApiObject, UnresolvedPlaceholder, _parse_line
+
+AWS_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+NOTEBOOKS = [
+    os.path.join(AWS_DIR, "1. Setup fundamental", "3 Using the Account API.py"),
+    os.path.join(AWS_DIR, "2. Networking and Security fundamental",
+                 "2 Securing your workspaces with customer-managed keys.py"),
+]
+
+
+@pytest.fixture
+def records():
+    return []
+
+
+@pytest.fixture
+def session(make_client, records):
+    return AccountApiSession(make_client(hooks=[records.append]))
+
+
+def test_substitute():
+    session = AccountApiSession(client=object())
+    session.ids.update(workspace_id=1001, customer_managed_key_id="k-1")
+    assert session.substitute("/workspaces/<WORKSPACE_ID>") == "/workspaces/1001"
+    # A value that is only a placeholder keeps the type of the id.
+    assert session.substitute({"ids": ["<WORKSPACE_ID>"], "key": "<CSK_ID>", "n": 3}) == \
+        {"ids": [1001], "key": "k-1", "n": 3}
+    assert session.substitute("<workspace_id> <WORKSPACE_ID>") == "<workspace_id> 1001"
+
+
+def test_unresolved_placeholders_fail_before_anything_is_sent(session, records):
+    with pytest.raises(UnresolvedPlaceholder, match=re.escape("<NETWORK_ID> has no value")):
+        session.call("GET", "/networks/<NETWORK_ID>")
+    with pytest.raises(UnresolvedPlaceholder, match=re.escape("get_session().ids['key_arn']")):
+        session.call("POST", "/customer-managed-keys", '{"aws_key_info": {"key_arn": "<KEY_ARN>"}}')
+    assert records == []
+
+
+def test_only_single_objects_are_remembered(session):
+    workspace = session.call("POST", "/workspaces", {"workspace_name": "a", "aws_region": "us-east-1"})
+    assert session.ids == {"workspace_id": workspace["workspace_id"]}
+    # A listing of one workspace is not taken as a pick.
+    session.ids.clear()
+    listed = session.call("GET", "/workspaces")
+    assert len(listed) == 1 and session.ids == {}
+    session.remember(listed[0])
+    assert session.call("GET", "/workspaces/<WORKSPACE_ID>", fields=["workspace_name"]) == {"workspace_name": "a"}
+    assert session.last == {"workspace_name": "a"}
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("GET /workspaces", ("GET", "/workspaces", None)),
+    ("get /workspaces --fields workspace_id,,workspace_name",
+     ("get", "/workspaces", ["workspace_id", "workspace_name"])),
+    ("--fields a PATCH '/workspaces/<WORKSPACE_ID>'", ("PATCH", "/workspaces/<WORKSPACE_ID>", ["a"])),
+])
+def test_parse_line(line, expected):
+    assert _parse_line(line) == expected
+
+
+@pytest.mark.parametrize("line, message", [
+    ("GET", "usage"),
+    ("GET /workspaces extra", "usage"),
+    ("GET /workspaces --fields", "comma-separated"),
+])
+def test_parse_line_errors(line, message):
+    with pytest.raises(ValueError, match=message):
+        _parse_line(line)
+
+
+def test_tables():
+    rows = ApiList([{"id": 1, "name": "a"}, {"id": 22, "tags": ["x"], "name": None}])
+    assert rows.table() == "\n".join([
+        "id  name  tags",
+        "--  ----  -----",
+        "1   a",
+        '22        ["x"]',
+        "2 rows in 0 ms",
+    ])
+    one = ApiObject(id=1, description="x" * 50)
+    one.elapsed = 0.0123
+    assert one.table().splitlines() == ["field        value", "-----------  " + "-" * 40, "id           1",
+                                        "description  " + "x" * 39 + "…", "1 row in 12 ms"]
+    assert ApiList([]).table() == "0 rows in 0 ms"
+    assert ApiList(["a"]).table().splitlines()[:3] == ["field  value", "-----  -----", "value  a"]
+    assert "<th>name</th>" in rows._repr_html_() and "&lt;b&gt;" in ApiObject(x="<b>")._repr_html_()
+
+
+def test_magic_uses_the_shared_session(monkeypatch, session):
+    monkeypatch.setattr(magic, "_session", session)
+    created = magic.account_api_magic("POST /workspaces --fields workspace_id",
+                                      '{"workspace_name": "m", "aws_region": "us-east-1"}')
+    assert list(created) == ["workspace_id"]
+    assert magic.account_api_magic("GET /workspaces/<WORKSPACE_ID> --fields workspace_name") == {"workspace_name": "m"}
+
+
+class Widgets:
+    """The ``dbutils.widgets`` of a notebook whose fields have been filled in with ``values``."""
+
+    def __init__(self, values):
+        self.values = dict(values)
+
+    def text(self, name, defaultValue=""):
+        self.values.setdefault(name, defaultValue)
+
+    def get(self, name):
+        return self.values[name]
+
+
+def python_cells(path):
+    """The Python cells of a source-format notebook, except the one that sets up the client."""
+    with open(path) as f:
+        cells = f.read().split("# COMMAND ----------")
+    return [cell for cell in cells[1:] if "# MAGIC" not in cell and "import" not in cell]
+
+
+@pytest.mark.parametrize("path", NOTEBOOKS, ids=os.path.basename)
+def test_notebook_cells(client, session, path):
+    credentials_id = client.create_credentials("creds", "arn:aws:iam::1:role/r")["credentials_id"]
+    storage_configuration_id = client.create_storage_configuration("storage", "bucket")["storage_configuration_id"]
+    client.create_workspace({"workspace_name": "source", "aws_region": "us-east-1", "credentials_id": credentials_id,
+                             "storage_configuration_id": storage_configuration_id})
+    widgets = Widgets({"key_arn": "arn:aws:kms:us-east-1:1:key/k", "key_alias": "alias/k"})
+    namespace = {"account_api": session.call, "get_session": lambda: session, "api": client,
+                 "dbutils": type("dbutils", (), {"widgets": widgets})}
+    cells = python_cells(path)
+    assert sum("account_api(" in cell for cell in cells) >= 3
+
+    # Running the lab twice creates nothing the second time.
+    for _ in range(2):
+        for cell in cells:
+            exec(compile(cell, path, "exec"), namespace)
+        assert isinstance(session.last, (ApiObject, ApiList))
+        session.last.table()
+    assert len(client.list_workspaces()) == 2 and len(client.list_customer_managed_keys()) == ("customer" in path)
+
+    workspace = client.get_workspace(session.ids["workspace_id"])
+    assert workspace["workspace_name"] != "source" and workspace["credentials_id"] == credentials_id
+    assert workspace["storage_configuration_id"] == storage_configuration_id
+    if "customer" in path:
+        assert workspace["storage_customer_managed_key_id"] == session.ids["customer_managed_key_id"]
@@ -0,0 +1,94 @@
+import pytest
+
+from dbacademy_admin.client import AccountApiError
+from dbacademy_admin.metastores import AssignmentChange, AssignmentPlanner, apply_changes, load_planner
+from dbacademy_admin.retry import RetryPolicy
+
+METASTORES = [{"metastore_id": "m-east", "region": "us-east-1"}, {"metastore_id": "m-west", "region": "us-west-2"}]
+WORKSPACES = [{"workspace_id": 1, "aws_region": "us-east-1"}, {"workspace_id": 2, "aws_region": "us-east-1"},
+              {"workspace_id": 3, "aws_region": "us-west-2"}]
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+def test_indexes_and_violations():
+    planner = AssignmentPlanner(METASTORES + [{"metastore_id": "m-east-2", "region": "us-east-1"}], WORKSPACES,
+                                {"1": "m-east", 3: "m-east"})
+    assert planner.region_metastore == {"us-east-1": "m-east", "us-west-2": "m-west"}
+    assert planner.region_workspaces == {"us-east-1": [1, 2], "us-west-2": [3]}
+    assert planner.assignment == {1: "m-east", 3: "m-east"}
+    assert planner.violations == ["Region us-east-1 has more than one metastore",
+                                  "Workspace 3 is assigned to metastore m-east in another region"]
+
+
+def test_check():
+    planner = AssignmentPlanner(METASTORES, WORKSPACES, {})
+    assert planner.check(1, "m-east") is None and planner.check(1, None) is None
+    assert planner.check(9, "m-east") == "Workspace 9 does not exist"
+    assert planner.check(1, "m-gone") == "Metastore m-gone does not exist"
+    assert planner.check(1, "m-west") == "Metastore m-west is in us-west-2, workspace 1 is in us-east-1"
+
+
+def test_plan_is_minimal():
+    planner = AssignmentPlanner(METASTORES, WORKSPACES, {1: "m-east", 3: "m-west"})
+    plan = planner.plan({1: "m-east", "2": "m-east", 3: None, 9: "m-east"})
+    assert plan.changes == [AssignmentChange(2, None, "m-east"), AssignmentChange(3, "m-west", None)]
+    assert plan.errors == {9: "Workspace 9 does not exist"}
+    assert plan.calls == 2
+    assert planner.plan_region("us-east-1").changes == [AssignmentChange(2, None, "m-east")]
+    with pytest.raises(ValueError, match="no metastore"):
+        planner.plan_region("eu-west-1")
+
+
+@pytest.fixture
+def account(client):
+    ids = {region: [client.create_workspace({"workspace_name": f"{region}-{i}", "aws_region": region})["workspace_id"]
+                    for i in range(2)] for region in ("us-east-1", "us-west-2")}
+    metastores = {region: client.create_metastore(f"m-{region}", region, f"s3://b/{region}")["metastore_id"]
+                  for region in ids}
+    return ids, metastores
+
+
+def test_load_plan_and_apply(client, account):
+    ids, metastores = account
+    client.assign_metastore(ids["us-east-1"][0], metastores["us-east-1"])
+    planner = load_planner(client)
+    assert planner.assignment == {ids["us-east-1"][0]: metastores["us-east-1"]}
+
+    plan = planner.plan_region("us-east-1")
+    plan.changes += planner.plan_region("us-west-2").changes
+    results = apply_changes(client, plan, planner, retry=NO_RETRY)
+    assert [error for _, error in results] == [None, None, None]
+    for region, workspace_ids in ids.items():
+        assert sorted(client.list_metastore_workspaces(metastores[region])) == sorted(workspace_ids)
+    assert planner.plan_region("us-east-1").changes == [] and planner.plan_region("us-west-2").changes == []
+    assert load_planner(client).assignment == planner.assignment
+
+
+def test_a_failed_assign_after_a_detach_is_recorded_as_a_detach(server, client, account):
+    ids, metastores = account
+    workspace_id = ids["us-east-1"][0]
+    client.assign_metastore(workspace_id, metastores["us-east-1"])
+    # Move the workspace to a second metastore of its region; the assign call fails after the detach worked.
+    planner = load_planner(client)
+    planner.metastore_region["m-other"] = "us-east-1"
+    server.fail_next(503, method="POST")
+    results = apply_changes(client, planner.plan({workspace_id: "m-other"}), planner, retry=NO_RETRY)
+
+    (detached, ok), (assigned, error) = results
+    assert (detached, ok) == (AssignmentChange(workspace_id, unassign=metastores["us-east-1"]), None)
+    assert assigned == AssignmentChange(workspace_id, assign="m-other") and isinstance(error, AccountApiError)
+    assert workspace_id not in planner.assignment
+    assert planner.plan({workspace_id: "m-other"}).changes == [AssignmentChange(workspace_id, None, "m-other")]
+    assert client.list_metastore_workspaces(metastores["us-east-1"]) == []
+
+
+def test_a_failed_detach_is_not_recorded(server, client, account):
+    ids, metastores = account
+    workspace_id = ids["us-east-1"][0]
+    client.assign_metastore(workspace_id, metastores["us-east-1"])
+    planner = load_planner(client)
+    server.fail_next(503, method="DELETE")
+    [(change, error)] = apply_changes(client, planner.plan({workspace_id: None}), planner, retry=NO_RETRY)
+    assert change == AssignmentChange(workspace_id, metastores["us-east-1"], None) and error is not None
+    assert planner.assignment == {workspace_id: metastores["us-east-1"]}
@@ -0,0 +1,160 @@
+import http.server
+import json
+import socket
+import threading
+
+import pytest
+
+from dbacademy_admin.client import AccountApiError, AccountClient
+from dbacademy_admin.metrics import NO_RESPONSE, Histogram, MetricsRecorder, RequestRecord, endpoint_template
+
+AUTHORIZATION = "Basic eDp5"
+
+TRUNCATED = b'[{"workspace_id": 1}, {"workspace_id"'
+
+
+def test_endpoint_template():
+    assert endpoint_template("/workspaces") == "/workspaces"
+    assert endpoint_template("/workspaces/123/metastores/abc") == "/workspaces/{id}/metastores/{id}"
+
+
+def test_small_values_are_exact():
+    histogram = Histogram()
+    assert [histogram._index(units) for units in range(256)] == list(range(256))
+    assert all(histogram._bounds(index) == (index, index) for index in range(256))
+
+
+@pytest.mark.parametrize("sub_bits", [4, 8])
+def test_buckets_are_contiguous_and_log_linear(sub_bits):
+    histogram = Histogram(sub_bits=sub_bits)
+    previous_high = (1 << sub_bits) - 1
+    for index in range(1 << sub_bits, 40 << sub_bits):
+        low, high = histogram._bounds(index)
+        assert low == previous_high + 1
+        assert histogram._index(low) == histogram._index(high) == index
+        # Each bucket is at most 2 ** (1 - sub_bits) of the values it holds.
+        assert high - low + 1 <= low * 2 ** (1 - sub_bits)
+        previous_high = high
+    # One power of two is split into 2 ** (sub_bits - 1) buckets.
+    assert histogram._index(1 << 20) - histogram._index(1 << 19) == 1 << (sub_bits - 1)
+
+
+def test_percentiles():
+    histogram = Histogram()
+    assert histogram.percentile(50) == 0.0 and histogram.summary()["min"] == 0.0
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000)
+    assert histogram.count == 1000 and histogram.sum == pytest.approx(500.5)
+    for q in (1, 50, 90, 99, 99.9):
+        assert histogram.percentile(q) == pytest.approx(q / 100, rel=0.01)
+        assert histogram.percentile(q) >= q / 100
+    assert histogram.percentile(100) == histogram.max == 1.0
+    assert histogram.summary()["p999"] == histogram.percentile(99.9)
+
+    single = Histogram()
+    single.record(0.123456)
+    assert single.percentile(0) == single.percentile(100) == 0.123456
+
+
+def test_cumulative_and_merge():
+    first, second = Histogram(), Histogram()
+    for value in (0.0009, 0.002, 0.0024):
+        first.record(value)
+    second.record(0.07)
+    first.merge(second)
+    assert first.cumulative((0.001, 0.0025, 0.05, 0.1)) == [(0.001, 1), (0.0025, 3), (0.05, 3), (0.1, 4)]
+    assert (first.min, first.max, first.count) == (0.0009, 0.07, 4)
+    # A bucket counts towards a bound when all of it is below the bound.
+    assert Histogram().cumulative((0.001,)) == [(0.001, 0)]
+    on_bound = Histogram()
+    on_bound.record(0.0025)
+    assert [count for _, count in on_bound.cumulative((0.0025, 0.0026))] == [0, 1]
+    with pytest.raises(ValueError, match="same unit"):
+        first.merge(Histogram(sub_bits=4))
+
+
+def record(status, attempt=0, wait=0.009):
+    return RequestRecord(endpoint="/workspaces", method="GET", status=status, attempt=attempt, bytes_sent=0,
+                         bytes_received=10, connect=0.0, wait=wait, read=0.0, parse=0.0, reused=True)
+
+
+def test_recorder_output():
+    metrics = MetricsRecorder()
+    for r in (record(200), record(503), record(200, attempt=1), record(NO_RESPONSE, attempt=2)):
+        metrics(r)
+    text = metrics.to_prometheus()
+    assert 'dbacademy_account_api_requests_total{method="GET",endpoint="/workspaces",status="0"} 1' in text
+    assert 'dbacademy_account_api_requests_total{method="GET",endpoint="/workspaces",status="200"} 2' in text
+    assert 'dbacademy_account_api_retries_total{method="GET",endpoint="/workspaces"} 2' in text
+    assert ('dbacademy_account_api_duration_seconds_bucket{method="GET",endpoint="/workspaces",phase="wait",'
+            'le="0.01"} 4') in text
+    total = json.loads(metrics.to_jsonl().splitlines()[0])
+    assert total["phase"] == "total" and total["requests"] == 4 and total["errors"] == 2
+    assert metrics.histogram("GET", "/workspaces", "wait").count == 4
+
+
+def test_failed_calls_are_recorded(server, make_client):
+    records = []
+    client = make_client(hooks=[records.append])
+    server.fail_next(503, method="GET")
+    with pytest.raises(AccountApiError):
+        list(client.stream_list("/workspaces"))
+    server.fail_next(500, method="POST")
+    with pytest.raises(AccountApiError):
+        client.request("POST", "/workspaces", {"workspace_name": "a"})
+    assert [(r.method, r.endpoint, r.status) for r in records] == [("GET", "/workspaces", 503),
+                                                                   ("POST", "/workspaces", 500)]
+    assert records[0].bytes_received > 0
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_connection_failures_are_recorded():
+    records = []
+    client = AccountClient(f"http://127.0.0.1:{closed_port()}/api/2.0/accounts/x", AUTHORIZATION,
+                           hooks=[records.append])
+    with pytest.raises(OSError):
+        client.request("GET", "/workspaces/1")
+    with pytest.raises(OSError):
+        list(client.stream_list("/workspaces"))
+    assert [(r.method, r.endpoint, r.status) for r in records] == [("GET", "/workspaces/{id}", NO_RESPONSE),
+                                                                   ("GET", "/workspaces", NO_RESPONSE)]
+
+
+@pytest.fixture
+def truncated_url():
+    """A server answering every call with the first half of a JSON array."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(TRUNCATED)))
+            self.end_headers()
+            self.wfile.write(TRUNCATED)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api/2.0/accounts/x"
+    server.shutdown()
+    server.server_close()
+
+
+def test_unparseable_responses_are_recorded(truncated_url):
+    records = []
+    client = AccountClient(truncated_url, AUTHORIZATION, hooks=[records.append])
+    with pytest.raises(ValueError):
+        client.request("GET", "/workspaces")
+    streamed = []
+    with pytest.raises(ValueError):
+        streamed.extend(client.stream_list("/workspaces"))
+    assert streamed == [{"workspace_id": 1}]
+    assert [r.status for r in records] == [NO_RESPONSE, NO_RESPONSE]
+    assert records[0].bytes_received == records[1].bytes_received == len(TRUNCATED)
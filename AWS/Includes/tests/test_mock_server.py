@@ -0,0 +1,156 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from dbacademy_admin.client import AccountApiError, AccountClient
+from dbacademy_admin.mock_server import MockAccountServer
+
+AUTHORIZATION = "Basic eDp5"
+
+
+def raw(server, method, path, body=None, authorization=AUTHORIZATION):
+    connection = http.client.HTTPConnection("127.0.0.1", server.port)
+    headers = {"Authorization": authorization} if authorization else {}
+    connection.request(method, path, body, headers)
+    response = connection.getresponse()
+    status, headers, data = response.status, dict(response.getheaders()), response.read()
+    connection.close()
+    return status, headers, json.loads(data)
+
+
+def status_of(call):
+    with pytest.raises(AccountApiError) as e:
+        call()
+    return e.value.status
+
+
+def test_collections(client):
+    credentials = client.create_credentials("c", "arn:aws:iam::123456789012:role/r")
+    assert credentials["account_id"] == "test" and credentials["credentials_name"] == "c"
+    assert client.get_credentials(credentials["credentials_id"]) == credentials
+    assert client.list_credentials() == [credentials]
+    # Only workspaces can be patched.
+    assert status_of(lambda: client.request("PATCH", f"/credentials/{credentials['credentials_id']}", {})) == 405
+    client.delete_credentials(credentials["credentials_id"])
+    assert client.list_credentials() == []
+    assert status_of(lambda: client.get_credentials(credentials["credentials_id"])) == 404
+    assert status_of(lambda: client.request("GET", "/clusters")) == 404
+    assert status_of(lambda: client.request("PUT", "/workspaces")) == 405
+
+    workspace = client.create_workspace({"workspace_name": "w", "aws_region": "us-east-1"})
+    assert workspace["workspace_status"] == "RUNNING"
+    client.update_workspace(workspace["workspace_id"], {"workspace_name": "renamed"})
+    assert client.get_workspace(workspace["workspace_id"])["workspace_name"] == "renamed"
+
+
+def test_accounts_are_separate(server, make_client):
+    make_client().create_workspace({"workspace_name": "w"})
+    other = AccountClient(server.url_for("other"), AUTHORIZATION)
+    assert other.list_workspaces() == []
+
+
+def test_metastore_assignment(client):
+    workspace_id = client.create_workspace({"workspace_name": "w", "aws_region": "us-east-1"})["workspace_id"]
+    metastore_id = client.create_metastore("m", "us-east-1", "s3://bucket/m")["metastore_id"]
+    assert status_of(lambda: client.create_metastore("m2", "us-east-1", "s3://bucket/m2")) == 400
+    client.assign_metastore(workspace_id, metastore_id)
+    assert client.list_metastore_workspaces(metastore_id) == [workspace_id]
+    assert status_of(lambda: client.assign_metastore(workspace_id, metastore_id)) == 400
+    client.unassign_metastore(workspace_id, metastore_id)
+    assert client.list_metastore_workspaces(metastore_id) == []
+    assert status_of(lambda: client.unassign_metastore(workspace_id, metastore_id)) == 404
+
+    other = client.create_workspace({"workspace_name": "x", "aws_region": "eu-west-1"})["workspace_id"]
+    assert status_of(lambda: client.assign_metastore(other, metastore_id)) == 400
+
+
+def test_authentication_and_malformed_requests(server):
+    path = server.url_for("test").split(str(server.port), 1)[1]
+    assert raw(server, "GET", path + "/workspaces", authorization=None)[0] == 401
+    assert raw(server, "GET", path + "/workspaces", authorization="Bearer unknown")[0] == 401
+    assert raw(server, "GET", "/api/2.0/other")[0] == 404
+    assert raw(server, "POST", path + "/workspaces", b"{not json")[0] == 400
+
+
+def test_provisioning_delay():
+    with MockAccountServer(provisioning_delay=0.2) as server:
+        client = AccountClient(server.url_for("test"), AUTHORIZATION)
+        workspace_id = client.create_workspace({"workspace_name": "w"})["workspace_id"]
+        assert client.get_workspace(workspace_id)["workspace_status"] == "PROVISIONING"
+        time.sleep(0.25)
+        assert client.get_workspace(workspace_id)["workspace_status"] == "RUNNING"
+        client.update_workspace(workspace_id, {"workspace_name": "renamed"})
+        assert client.get_workspace(workspace_id)["workspace_status"] == "PROVISIONING"
+
+
+def test_latency_and_jitter():
+    with MockAccountServer(latency=0.05, jitter=0.05) as server:
+        client = AccountClient(server.url_for("test"), AUTHORIZATION)
+        client.list_workspaces()
+        for _ in range(5):
+            started = time.perf_counter()
+            client.list_workspaces()
+            assert 0.05 <= time.perf_counter() - started < 0.3
+
+
+def test_rate_limit_and_retry_after():
+    with MockAccountServer(rate_limit=1, burst=2, retry_after=3) as server:
+        path = server.url_for("test").split(str(server.port), 1)[1] + "/workspaces"
+        assert [raw(server, "GET", path)[0] for _ in range(2)] == [200, 200]
+        status, headers, body = raw(server, "GET", path)
+        assert (status, headers["Retry-After"], body["error_code"]) == (429, "3", "REQUEST_LIMIT_EXCEEDED")
+        assert server.throttled == 1
+
+
+def test_injected_failures(server, client):
+    server.fail_next(503, method="POST")
+    assert client.list_workspaces() == []
+    assert status_of(lambda: client.create_workspace({"workspace_name": "lost"})) == 503
+    assert client.list_workspaces() == []
+
+    server.fail_next(500, after_commit=True)
+    assert status_of(lambda: client.create_workspace({"workspace_name": "kept"})) == 500
+    assert [w["workspace_name"] for w in client.list_workspaces()] == ["kept"]
+
+
+def test_responses_are_snapshots_taken_before_the_delay(server, client):
+    workspace_id = client.create_workspace({"workspace_name": "before"})["workspace_id"]
+    server.latency = 0.3
+    seen = {}
+    reader = threading.Thread(target=lambda: seen.update(client.get_workspace(workspace_id)))
+    reader.start()
+    time.sleep(0.1)
+    # The PATCH lands while the GET's response is still being delayed.
+    AccountClient(server.url_for("test"), AUTHORIZATION).update_workspace(workspace_id, {"workspace_name": "after"})
+    reader.join()
+    assert seen["workspace_name"] == "before"
+
+
+def test_concurrent_patches_and_lists(server, client):
+    ids = [client.create_workspace({"workspace_name": f"w{i}"})["workspace_id"] for i in range(20)]
+    errors = []
+
+    def patch(worker):
+        try:
+            for i in range(30):
+                client.update_workspace(ids[(worker + i) % len(ids)], {f"field_{worker}_{i}": i})
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            for _ in range(30):
+                assert len(client.list_workspaces()) == len(ids)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=patch, args=(w,)) for w in range(4)] + \
+        [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
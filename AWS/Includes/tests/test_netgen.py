@@ -0,0 +1,110 @@
+import ipaddress
+
+import pytest
+
+from dbacademy_admin.netgen import QUAD_ZERO, apply_plan, describe_vpc, plan_networks
+
+
+def build_vpc(ec2, private_route_table=True):
+    """The lab's VPC: public subnets in two zones, one NAT gateway and, optionally, a private route table."""
+    vpc_id = ec2.create_vpc(CidrBlock="10.0.0.0/16")["Vpc"]["VpcId"]
+    public = [ec2.create_subnet(VpcId=vpc_id, CidrBlock=cidr, AvailabilityZone=zone)["Subnet"]["SubnetId"]
+              for cidr, zone in [("10.0.0.0/24", "us-east-1a"), ("10.0.1.0/24", "us-east-1b")]]
+    igw = ec2.create_internet_gateway()["InternetGateway"]["InternetGatewayId"]
+    ec2.attach_internet_gateway(InternetGatewayId=igw, VpcId=vpc_id)
+    allocation = ec2.allocate_address(Domain="vpc")["AllocationId"]
+    nat = ec2.create_nat_gateway(SubnetId=public[0], AllocationId=allocation)["NatGateway"]["NatGatewayId"]
+    route_table = None
+    if private_route_table:
+        route_table = ec2.create_route_table(VpcId=vpc_id)["RouteTable"]["RouteTableId"]
+        ec2.create_route(RouteTableId=route_table, DestinationCidrBlock=QUAD_ZERO, NatGatewayId=nat)
+    return vpc_id, nat, route_table
+
+
+def associations(ec2, vpc_id):
+    """Subnet id -> route table id."""
+    tables = ec2.describe_route_tables(Filters=[{"Name": "vpc-id", "Values": [vpc_id]}])["RouteTables"]
+    return {a["SubnetId"]: t["RouteTableId"] for t in tables for a in t.get("Associations", []) if a.get("SubnetId")}
+
+
+@pytest.fixture
+def ec2(aws):
+    return aws.client("ec2", region_name="us-east-1")
+
+
+def test_describe_vpc(ec2):
+    vpc_id, nat, route_table = build_vpc(ec2)
+    description = describe_vpc(ec2, vpc_id)
+    default_group = ec2.describe_security_groups(
+        Filters=[{"Name": "vpc-id", "Values": [vpc_id]}, {"Name": "group-name", "Values": ["default"]}]
+    )["SecurityGroups"][0]["GroupId"]
+    assert description["region"] == "us-east-1"
+    assert description["cidr_block"] == "10.0.0.0/16"
+    assert description["security_group_ids"] == [default_group]
+    assert description["nat_gateways"] == [{"nat_gateway_id": nat, "availability_zone": "us-east-1a"}]
+    assert description["route_tables"] == [{"route_table_id": route_table, "nat_gateway_id": nat}]
+    assert sorted(s["cidr_block"] for s in description["subnets"]) == ["10.0.0.0/24", "10.0.1.0/24"]
+
+
+def test_applied_plan_reuses_the_nat_route_table(ec2, client):
+    vpc_id, nat, route_table = build_vpc(ec2)
+    before = describe_vpc(ec2, vpc_id)
+    operations = plan_networks(before, 3, prefixlen=20, name_prefix="test")
+    assert not [o for o in operations if o.action == "CreateRouteTable"]
+
+    bound = apply_plan(operations, ec2, client)
+    after = describe_vpc(ec2, vpc_id)
+    new = [s for s in after["subnets"] if s["subnet_id"] not in {s["subnet_id"] for s in before["subnets"]}]
+    assert len(new) == 6
+
+    networks = sorted(client.list_networks(), key=lambda n: n["network_name"])
+    assert [n["network_name"] for n in networks] == [f"test-network-configuration-ws{i}" for i in (1, 2, 3)]
+    by_id = {s["subnet_id"]: s for s in new}
+    for index, network in enumerate(networks, start=1):
+        assert network["network_id"] == bound[f"network-{index}"]
+        assert network["vpc_id"] == vpc_id
+        assert network["security_group_ids"] == before["security_group_ids"]
+        pair = [by_id[s] for s in network["subnet_ids"]]
+        assert len({s["availability_zone"] for s in pair}) == 2
+        assert all(ipaddress.ip_network(s["cidr_block"]).prefixlen == 20 for s in pair)
+
+    cidrs = [ipaddress.ip_network(s["cidr_block"]) for s in after["subnets"]]
+    assert all(a.subnet_of(ipaddress.ip_network("10.0.0.0/16")) for a in cidrs)
+    assert not any(a.overlaps(b) for i, a in enumerate(cidrs) for b in cidrs[i + 1:])
+
+    routed = associations(ec2, vpc_id)
+    assert {routed[s["subnet_id"]] for s in new} == {route_table}
+    assert after["route_tables"] == [{"route_table_id": route_table, "nat_gateway_id": nat}]
+
+
+def test_applied_plan_creates_one_route_table_per_nat(ec2, client):
+    vpc_id, nat, _ = build_vpc(ec2, private_route_table=False)
+    operations = plan_networks(describe_vpc(ec2, vpc_id), 4, prefixlen=22, name_prefix="test")
+    assert [o.action for o in operations].count("CreateRouteTable") == 1
+
+    bound = apply_plan(operations, ec2, client)
+    after = describe_vpc(ec2, vpc_id)
+    table = bound[f"route-table-{nat}"]
+    assert after["route_tables"] == [{"route_table_id": table, "nat_gateway_id": nat}]
+    new = [s["subnet_id"] for s in after["subnets"] if ipaddress.ip_network(s["cidr_block"]).prefixlen == 22]
+    assert len(new) == 8
+    routed = associations(ec2, vpc_id)
+    assert {routed[s] for s in new} == {table}
+    assert len(client.list_networks()) == 4
+
+
+def test_more_workspaces_are_added_next_to_the_first(ec2, client):
+    vpc_id, _, _ = build_vpc(ec2)
+    apply_plan(plan_networks(describe_vpc(ec2, vpc_id), 2, name_prefix="test"), ec2, client)
+    described = describe_vpc(ec2, vpc_id)
+    apply_plan(plan_networks(described, 2, name_prefix="test", first_index=3), ec2, client)
+    cidrs = [ipaddress.ip_network(s["cidr_block"]) for s in describe_vpc(ec2, vpc_id)["subnets"]]
+    assert len(cidrs) == 10
+    assert not any(a.overlaps(b) for i, a in enumerate(cidrs) for b in cidrs[i + 1:])
+    assert len(client.list_networks()) == 4
+
+
+def test_plan_needs_a_nat_gateway(ec2):
+    vpc_id = ec2.create_vpc(CidrBlock="10.1.0.0/16")["Vpc"]["VpcId"]
+    with pytest.raises(ValueError, match="NAT"):
+        plan_networks(describe_vpc(ec2, vpc_id), 1)
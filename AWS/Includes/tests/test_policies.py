@@ -0,0 +1,84 @@
+import json
+import os
+import re
+
+import pytest
+
+from dbacademy_admin.policies import (
+    DATABRICKS_AWS_ACCOUNT_ID, TEMPLATES, PolicyTemplate, canonical, digest, render_batch,
+)
+
+AWS_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SETUP = os.path.join(AWS_DIR, "1. Setup fundamental", "1 Supporting Databricks workspaces and metastores.py")
+VPC = os.path.join(AWS_DIR, "2. Networking and Security fundamental",
+                   "1 Deploying a workspace in a customer-managed VPC.py")
+CMK = os.path.join(AWS_DIR, "2. Networking and Security fundamental",
+                   "2 Securing your workspaces with customer-managed keys.py")
+
+
+def json_blocks(path):
+    """The JSON code blocks in the markdown cells of a source-format notebook."""
+    with open(path) as f:
+        text = "".join(line[len("# MAGIC"):] for line in f if line.startswith("# MAGIC"))
+    blocks = (m.group(1).strip() for m in re.finditer(r"```(.*?)```", text, re.S))
+    # The key policy statements are shown as elements to insert into the Statement array.
+    return [json.loads(block if '"Version"' in block else f"[{block}]")
+            for block in blocks if block.startswith(("{", "["))]
+
+
+def unrendered(name):
+    """The template rendered with each placeholder standing for itself, as in the labs."""
+    template = TEMPLATES[name]
+    return json.loads(template.render({p: f"<{p}>" for p in template.placeholders}))
+
+
+def test_templates_match_the_lab_notebooks():
+    cross_account, metastore, metastore_trust = json_blocks(SETUP)
+    assert unrendered("cross_account") == cross_account
+    assert unrendered("metastore") == metastore
+    assert unrendered("metastore_trust") == metastore_trust
+    [novpc] = json_blocks(VPC)
+    assert unrendered("cross_account_novpc") == novpc
+    [statements] = json_blocks(CMK)
+    kms_key = unrendered("kms_key")
+    # The lab adds its statements to the key's default policy, which lets the account administer the key.
+    assert kms_key["Statement"][0]["Action"] == "kms:*"
+    assert kms_key["Statement"][1:] == statements
+
+
+def test_templates_without_a_json_listing_in_the_labs():
+    # "Another AWS account" with the Databricks AWS account and "Require external ID".
+    [trust] = unrendered("cross_account_trust")["Statement"]
+    assert trust["Principal"] == {"AWS": f"arn:aws:iam::{DATABRICKS_AWS_ACCOUNT_ID}:root"}
+    assert trust["Condition"] == {"StringEquals": {"sts:ExternalId": "<DATABRICKS_ACCOUNT_ID>"}}
+    assert set(TEMPLATES["root_bucket"].placeholders) == {"BUCKET", "DATABRICKS_ACCOUNT_ID"}
+
+
+@pytest.mark.parametrize("name", sorted(TEMPLATES))
+def test_rendering_is_canonical(name):
+    template = TEMPLATES[name]
+    params = {p: f'value "{p.lower()}" é' for p in template.placeholders}
+    text = template.render(params)
+    assert canonical(json.loads(text)) == text
+    assert "<" not in text and all(json.dumps(v, ensure_ascii=False)[1:-1] in text for v in params.values())
+    assert list(template.render_many([params, params])) == [text, text]
+
+
+@pytest.mark.parametrize("name", [name for name in sorted(TEMPLATES) if TEMPLATES[name].placeholders])
+def test_a_missing_placeholder_raises(name):
+    template = TEMPLATES[name]
+    params = {p: "x" for p in template.placeholders[1:]}
+    with pytest.raises(ValueError, match=f"Missing value for placeholder <{template.placeholders[0]}>"):
+        template.render(params)
+
+
+def test_placeholders_and_batches():
+    template = PolicyTemplate({"Resource": ["arn:aws:s3:::<BUCKET>/*", "arn:aws:s3:::<BUCKET>"], "Id": "<ID>"})
+    assert template.placeholders == ("ID", "BUCKET")
+    assert template.render({"BUCKET": "b", "ID": 1, "UNUSED": "x"}) == \
+        '{"Id":"1","Resource":["arn:aws:s3:::b/*","arn:aws:s3:::b"]}'
+    [first, second] = render_batch([("metastore", "r1", {"BUCKET": "b1", "AWS_ACCOUNT_ID": "1",
+                                                         "AWS_IAM_ROLE_NAME": "r1"}),
+                                    ("cross_account_trust", "r2", {"DATABRICKS_ACCOUNT_ID": "a"})])
+    assert (first.template, first.key, second.key) == ("metastore", "r1", "r2")
+    assert first.sha256 == digest(first.text) and '"arn:aws:s3:::b1"' in first.text
@@ -0,0 +1,162 @@
+import threading
+import time
+
+import pytest
+
+from dbacademy_admin.iam import NotReady, RoleFactory, role_handlers
+from dbacademy_admin.provisioner import (
+    Output, ProvisionResult, Provisioner, Resource, StepRecord, account_handlers, workspace_resources,
+)
+from dbacademy_admin.retry import RetryPolicy
+from dbacademy_admin.watch import AdaptiveSchedule
+
+DATABRICKS_ACCOUNT_ID = "414351767826"
+
+
+def recorder(outputs=None, fail=(), delay=0.0):
+    """A handler that records the order of calls and returns ``outputs[name]`` for each."""
+    calls = []
+    lock = threading.Lock()
+
+    def handle(params):
+        if delay:
+            time.sleep(delay)
+        with lock:
+            calls.append(params["name"])
+        if params["name"] in fail:
+            raise RuntimeError(f"{params['name']} failed")
+        return dict((outputs or {}).get(params["name"], {}), name=params["name"])
+
+    return handle, calls
+
+
+def resource(name, *depends_on, **params):
+    return Resource(name, "step", dict(params, name=name), tuple(depends_on))
+
+
+def test_dependencies_come_from_outputs_and_depends_on():
+    r = Resource("c", "step", {"x": Output("a", "id"), "nested": [{"y": Output("b", "id")}]}, ("d",))
+    assert r.dependencies() == {"a", "b", "d"}
+
+
+def test_runs_in_dependency_order_and_resolves_outputs():
+    handle, calls = recorder({"vpc": {"vpc_id": "vpc-1"}, "bucket": {"bucket_name": "b"}})
+    resources = [
+        resource("network", vpc_id=Output("vpc", "vpc_id"), bucket=[Output("bucket", "bucket_name")]),
+        resource("vpc"),
+        resource("bucket"),
+        resource("workspace", "network"),
+    ]
+    provisioner = Provisioner(resources, {"step": handle})
+    assert [sorted(level) for level in provisioner.levels()] == [["bucket", "vpc"], ["network"], ["workspace"]]
+    result = provisioner.run(max_workers=4)
+    assert result.ok and sorted(calls[:2]) == ["bucket", "vpc"] and calls[2:] == ["network", "workspace"]
+    assert result.outputs["network"] == {"name": "network"}
+    assert set(result.steps) == {"vpc", "bucket", "network", "workspace"}
+    assert result.elapsed >= max(step.finished for step in result.steps.values())
+
+
+def test_outputs_are_passed_resolved():
+    seen = {}
+
+    def capture(params):
+        seen[params["name"]] = params
+        return {"id": params["name"] + "-id"}
+
+    Provisioner([resource("a"), resource("b", ref=[Output("a", "id")], more={"x": Output("a", "id")})],
+                {"step": capture}).run()
+    assert seen["b"] == {"name": "b", "ref": ["a-id"], "more": {"x": "a-id"}}
+
+
+def test_independent_resources_run_concurrently():
+    handle, _ = recorder(delay=0.2)
+    started = time.monotonic()
+    assert Provisioner([resource(f"r{i}") for i in range(4)], {"step": handle}).run(max_workers=4).ok
+    assert time.monotonic() - started < 0.6
+
+
+@pytest.mark.parametrize("resources, message", [
+    ([resource("a", "c"), resource("b", "a"), resource("c", "b"), resource("d")], "cycle between: a, b, c"),
+    ([resource("a", "a")], "cycle between: a"),
+    ([resource("a"), resource("a")], "Duplicate resource name: a"),
+    ([resource("a", "missing")], "unknown resources: missing"),
+    ([Resource("a", "other")], "No handler for a of kind other"),
+])
+def test_invalid_graphs(resources, message):
+    with pytest.raises(ValueError, match=message):
+        Provisioner(resources, {"step": recorder()[0]})
+
+
+def test_a_failure_skips_only_its_dependents():
+    handle, calls = recorder(fail={"role"})
+    resources = [
+        resource("role"),
+        resource("credentials", "role"),
+        resource("workspace", "credentials", "storage"),
+        resource("assignment", "workspace"),
+        resource("bucket"),
+        resource("storage", "bucket"),
+    ]
+    result = Provisioner(resources, {"step": handle}).run(max_workers=2)
+    assert not result.ok
+    assert list(result.failed) == ["role"] and str(result.failed["role"]) == "role failed"
+    assert sorted(result.skipped) == ["assignment", "credentials", "workspace"]
+    assert sorted(calls) == ["bucket", "role", "storage"]
+    assert set(result.outputs) == {"bucket", "storage"}
+
+
+def test_critical_path():
+    resources = [resource("a"), resource("b", "a"), resource("c"), resource("d", "b", "c"), resource("e", "c")]
+    provisioner = Provisioner(resources, {"step": recorder()[0]})
+    durations = {"a": 1.0, "b": 2.0, "c": 4.0, "d": 0.5, "e": 0.2}
+    result = ProvisionResult(steps={name: StepRecord(0.0, d) for name, d in durations.items()})
+    assert provisioner.critical_path(result) == (["c", "d"], 4.5)
+    result.steps["a"] = StepRecord(0.0, 3.0)
+    assert provisioner.critical_path(result) == (["a", "b", "d"], 5.5)
+    # Steps that never ran are left out.
+    del result.steps["d"]
+    assert provisioner.critical_path(result) == (["a", "b"], 5.0)
+    assert provisioner.critical_path(ProvisionResult()) == ([], 0.0)
+
+
+def test_workspace_resources_graph():
+    resources = workspace_resources("dbacademy-test", "eu-west-1", metastore_id="m-1", customer_managed_key=True)
+    kinds = {r.name: r.kind for r in resources}
+    assert kinds["dbacademy-test-kms-key"] == "kms_key" and kinds["dbacademy-test"] == "workspace"
+    handlers = {kind: recorder()[0] for kind in set(kinds.values())}
+    provisioner = Provisioner(resources, handlers)
+    assert provisioner.order[-1] == "dbacademy-test-metastore-assignment"
+    assert set(provisioner.levels()[0]) == {"dbacademy-test-role", "dbacademy-test-bucket", "dbacademy-test-vpc",
+                                            "dbacademy-test-kms-key"}
+
+
+def test_workspace_resources_run_end_to_end_with_the_shipped_handlers(aws, client):
+    from dbacademy_admin.kms import KMSClients, kms_handlers
+    from dbacademy_admin.s3 import S3Clients, bucket_handlers
+    from dbacademy_admin.vpc import EC2Clients, vpc_handlers
+
+    metastore_id = client.create_metastore("m", "us-east-1", "s3://dbacademy-test-metastore-bucket/m")["metastore_id"]
+    factory = RoleFactory(DATABRICKS_ACCOUNT_ID, aws.client("iam"), readiness=RetryPolicy(
+        max_attempts=12, base=0.02, cap=0.05, retryable=lambda e: isinstance(e, NotReady)))
+    handlers = dict(
+        account_handlers(client, schedule=AdaptiveSchedule(expected=0.0, min_interval=0.01, max_interval=0.05)),
+        **role_handlers(factory),
+        **bucket_handlers(S3Clients(session=aws), DATABRICKS_ACCOUNT_ID, waiter_delay=0.01),
+        **vpc_handlers(EC2Clients(session=aws), waiter_delay=0.01),
+        **kms_handlers(KMSClients(session=aws), DATABRICKS_ACCOUNT_ID),
+    )
+    resources = workspace_resources("dbacademy-test", metastore_id=metastore_id, customer_managed_key=True)
+    result = Provisioner(resources, handlers).run()
+    assert result.ok, result.failed
+
+    key_arn = result.outputs["dbacademy-test-kms-key"]["key_arn"]
+    assert aws.client("kms").describe_key(KeyId="alias/dbacademy-test")["KeyMetadata"]["Arn"] == key_arn
+    workspace = client.get_workspace(result.outputs["dbacademy-test"]["workspace_id"])
+    cmk = client.get_customer_managed_key(workspace["storage_customer_managed_key_id"])
+    assert cmk["aws_key_info"]["key_arn"] == key_arn
+    assert client.list_metastore_workspaces(metastore_id) == [workspace["workspace_id"]]
+
+    # A second run reuses the key rather than creating another one.
+    again = Provisioner([r for r in resources if r.kind == "kms_key"], handlers).run()
+    assert again.outputs["dbacademy-test-kms-key"]["key_arn"] == key_arn
+    assert len(aws.client("kms").list_keys()["Keys"]) == 1
@@ -0,0 +1,153 @@
+import fnmatch
+import json
+import random
+
+import pytest
+
+from dbacademy_admin.cache import InventoryCache
+from dbacademy_admin.query import INDEXED_FIELDS, FleetIndex, QueryError, _Bool, _Compare, load_fleet, main, parse
+
+REGIONS = ["us-east-1", "us-west-2", "eu-west-1", "ap-southeast-2"]
+STATUSES = ["RUNNING", "PROVISIONING", "FAILED", "BANNED"]
+
+
+def fleet(count=400, seed=3):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        row = {
+            "workspace_id": 1000 + i,
+            "workspace_name": f"dbacademy-{rng.choice(['lab', 'test', 'prod'])}-{i}",
+            "aws_region": rng.choice(REGIONS),
+            "workspace_status": rng.choice(STATUSES),
+            "credentials_id": f"c-{rng.randrange(5)}",
+            "creation_time": rng.randrange(10 ** 6),
+        }
+        if rng.random() < 0.3:
+            row["storage_customer_managed_key_id"] = f"k-{rng.randrange(3)}"
+        if rng.random() < 0.1:
+            del row["aws_region"]
+        rows.append(row)
+    return rows
+
+
+def oracle(node, obj):
+    if isinstance(node, _Bool):
+        results = [oracle(operand, obj) for operand in node.operands]
+        return {"and": all, "or": any}[node.op](results) if node.op != "not" else not results[0]
+    value, expected = obj.get(node.field), node.value
+    if node.op == "=":
+        return value == expected
+    if node.op == "!=":
+        return value != expected
+    if node.op == "in":
+        return value in expected
+    if node.op == "like":
+        return isinstance(value, str) and fnmatch.fnmatchcase(value, expected)
+    if isinstance(expected, int):
+        if not isinstance(value, int):
+            return False
+    elif value is None or isinstance(value, int):
+        return False
+    else:
+        value, expected = str(value), str(expected)
+    return {"<": value < expected, "<=": value <= expected, ">": value > expected, ">=": value >= expected}[node.op]
+
+
+QUERIES = [
+    'aws_region = "us-east-1"',
+    "aws_region = us-east-1 and storage_customer_managed_key_id is null",
+    "aws_region != us-east-1",
+    "aws_region is null or workspace_status = FAILED",
+    "aws_region is not null and not workspace_status = RUNNING",
+    'credentials_id = "c-1" or credentials_id in ("c-2", "c-3")',
+    "credentials_id in (c-0, c-4) and aws_region in ('eu-west-1', 'us-west-2') and workspace_status != BANNED",
+    'workspace_name like "dbacademy-lab-*"',
+    "workspace_name like 'dbacademy-*-1?' and not (aws_region = eu-west-1 or aws_region = us-west-2)",
+    "aws_region like 'us-*' and credentials_id like c-[13]",
+    "aws_region < eu-west-2",
+    "aws_region >= us-east-1",
+    "aws_region > us-west-2 or aws_region <= ap-southeast-2",
+    "workspace_id >= 1100 and workspace_id < 1110",
+    "workspace_id > 1390 or workspace_id <= 1001",
+    "creation_time < 500000 and workspace_status = RUNNING",
+    "creation_time > 'abc'",
+    "workspace_id = 1005",
+    "workspace_id in (1001, 1002, 99)",
+    "storage_customer_managed_key_id = k-2 and (workspace_status = RUNNING or workspace_status = PROVISIONING)",
+    "not not workspace_status = RUNNING",
+    "not (aws_region = us-east-1 and credentials_id = c-0) and creation_time >= 0",
+    "missing_field is null",
+    "missing_field = x or missing_field is not null",
+    "aws_region = nowhere and workspace_status = RUNNING",
+]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("fields", [INDEXED_FIELDS, (), INDEXED_FIELDS + ("workspace_id", "workspace_name")])
+def test_results_match_a_full_scan(query, fields):
+    rows = fleet()
+    index = FleetIndex(rows, fields)
+    node = parse(query)
+    expected = [row for row in rows if oracle(node, row)]
+    assert index.select(query) == expected
+    assert index.count(node) == len(expected)
+
+
+def test_parse_structure_and_precedence():
+    assert parse("a = 1 or b = x and not c is null") == _Bool("or", (
+        _Compare("a", "=", 1),
+        _Bool("and", (_Compare("b", "=", "x"), _Bool("not", (_Compare("c", "=", None),)))),
+    ))
+    assert parse("(a = 1 or b = 2) AND c IS NOT NULL") == _Bool("and", (
+        _Bool("or", (_Compare("a", "=", 1), _Compare("b", "=", 2))), _Compare("c", "!=", None)))
+    assert parse("""name = "with \\"quotes\\" and spaces" """) == _Compare("name", "=", 'with "quotes" and spaces')
+    assert parse("id in ('1', 2, null)") == _Compare("id", "in", ("1", 2, None))
+    assert parse("name like 12") == _Compare("name", "like", "12")
+
+
+@pytest.mark.parametrize("query", [
+    "", "aws_region", "aws_region =", "aws_region = = x", "= x", "(aws_region = x", "aws_region = x)",
+    "aws_region in x", "aws_region in (x,)", "aws_region is x", "aws_region = x and", "aws_region ! x",
+    "and = x", "12 = x", 'aws_region = "unterminated',
+])
+def test_invalid_queries(query):
+    with pytest.raises(QueryError):
+        parse(query)
+
+
+def test_load_fleet_tags_accounts_and_reads_stale_lists(tmp_path, capsys):
+    path = str(tmp_path / "inventory.sqlite")
+    cache = InventoryCache(path, clock=lambda: 0.0)
+    cache.put_list("a", "workspaces", "workspace_id", [{"workspace_id": 1, "aws_region": "us-east-1"}])
+    cache.put_list("b", "workspaces", "workspace_id", [{"workspace_id": 2, "aws_region": "us-east-1"},
+                                                       {"workspace_id": 3, "aws_region": "eu-west-1"}])
+    index = load_fleet(cache)
+    assert len(index) == 3
+    assert [w["workspace_id"] for w in index.select("account_id = b and aws_region = us-east-1")] == [2]
+    cache.close()
+
+    main(["aws_region = us-east-1", "--cache", path, "--fields", "account_id,workspace_id"])
+    assert [json.loads(line) for line in capsys.readouterr().out.splitlines()] == [
+        {"account_id": "a", "workspace_id": 1}, {"account_id": "b", "workspace_id": 2}]
+    main(["account_id = b", "--cache", path, "--count"])
+    assert capsys.readouterr().out.strip() == "2"
+    with pytest.raises(SystemExit):
+        main(["aws_region =", "--cache", path])
+
+
+def test_writes_do_not_drop_an_account_from_the_fleet(make_client):
+    cache = InventoryCache(":memory:")
+    client = make_client(cache=cache)
+    ids = [client.create_workspace({"workspace_name": f"w{i}", "deployment_name": f"w{i}",
+                                    "aws_region": "us-east-1"})["workspace_id"] for i in range(3)]
+    client.list_workspaces()
+
+    client.update_workspace(ids[0], {"aws_region": "eu-west-1"})
+    assert load_fleet(cache).count("aws_region = us-east-1") == 3
+    client.get_workspace(ids[0])
+    client.delete_workspace(ids[1])
+    fleet = load_fleet(cache)
+    assert [w["workspace_id"] for w in fleet.select("aws_region = us-east-1")] == [ids[2]]
+    assert [w["workspace_id"] for w in fleet.select("aws_region = eu-west-1")] == [ids[0]]
+    cache.close()
@@ -0,0 +1,216 @@
+import json
+
+import pytest
+
+from dbacademy_admin.journal import Journal
+from dbacademy_admin.metastores import AssignmentPlanner
+from dbacademy_admin.reconcile import Created, LiveState, _stage, apply, plan, spec_hash
+
+CREDENTIALS = {"credentials_name": "creds", "aws_credentials": {"sts_role": {"role_arn": "arn:aws:iam::1:role/r"}}}
+STORAGE = {"storage_configuration_name": "storage", "root_bucket_info": {"bucket_name": "bucket"}}
+KEY = {"use_cases": ["STORAGE"], "aws_key_info": {"key_arn": "arn:aws:kms:us-east-1:1:key/k", "key_alias": "a"}}
+
+
+def live_workspace(**extra):
+    workspace = {"workspace_id": 1, "workspace_name": "ws", "aws_region": "us-east-1",
+                 "credentials_id": "c-1", "storage_configuration_id": "s-1", "workspace_status": "RUNNING"}
+    workspace.update(extra)
+    return workspace
+
+
+def live_state(**sections):
+    objects = {
+        "credentials": {"creds": dict(CREDENTIALS, credentials_id="c-1")},
+        "storage_configurations": {"storage": dict(STORAGE, storage_configuration_id="s-1")},
+        "workspaces": {"ws": live_workspace()},
+    }
+    objects.update(sections)
+    return LiveState(objects)
+
+
+def test_spec_hash_accepts_created_references():
+    assert spec_hash({"id": Created("customer_managed_keys", "k")}) != spec_hash({"id": "k"})
+
+
+def test_existing_workspace_referring_to_created_key_is_updated():
+    desired = {
+        "customer_managed_keys": [KEY],
+        "workspaces": [{"workspace_name": "ws", "aws_region": "us-east-1", "credentials_name": "creds",
+                        "storage_configuration_name": "storage",
+                        "storage_customer_managed_key_arn": KEY["aws_key_info"]["key_arn"]}],
+    }
+    result = plan(desired, live_state())
+    assert not result.conflicts
+    assert [(c.action, c.section) for c in result.changes] == [("create", "customer_managed_keys"),
+                                                               ("update", "workspaces")]
+    update = result.changes[1]
+    assert update.payload == {"storage_customer_managed_key_id": Created("customer_managed_keys",
+                                                                         KEY["aws_key_info"]["key_arn"])}
+
+
+def test_created_reference_is_resolved_on_apply(server, client):
+    credentials = client.create_credentials("creds", "arn:aws:iam::1:role/r")
+    storage = client.create_storage_configuration("storage", "bucket")
+    workspace = client.create_workspace({"workspace_name": "ws", "aws_region": "us-east-1",
+                                         "credentials_id": credentials["credentials_id"],
+                                         "storage_configuration_id": storage["storage_configuration_id"]})
+    desired = {
+        "customer_managed_keys": [KEY],
+        "workspaces": [{"workspace_name": "ws", "storage_customer_managed_key_arn": KEY["aws_key_info"]["key_arn"]}],
+    }
+    result = plan(desired, LiveState.load(client, metastores=False))
+    assert [e for _, e in apply(client, result)] == [None, None]
+
+    key_id = client.list_customer_managed_keys()[0]["customer_managed_key_id"]
+    assert client.get_workspace(workspace["workspace_id"])["storage_customer_managed_key_id"] == key_id
+
+
+def test_journaled_apply_adopts_objects_of_an_interrupted_run(client, tmp_path):
+    desired = {"credentials": [CREDENTIALS], "storage_configurations": [STORAGE],
+               "workspaces": [{"workspace_name": "ws", "aws_region": "us-east-1", "credentials_name": "creds",
+                               "storage_configuration_name": "storage"}]}
+    result = plan(desired, LiveState.load(client, metastores=False))
+    path = str(tmp_path / "journal.jsonl")
+
+    # The interrupted run recorded its intent and created the credentials, then died.
+    with Journal(path) as journal:
+        journal.intent("credentials/creds", CREDENTIALS)
+    client.request("POST", "/credentials", CREDENTIALS)
+
+    with Journal(path) as journal:
+        assert [e for _, e in apply(client, result, journal=journal)] == [None, None, None]
+        assert set(journal.results) == {"credentials/creds", "storage-configurations/storage", "workspaces/ws"}
+    assert len(client.list_credentials()) == 1
+    assert client.list_workspaces()[0]["credentials_id"] == client.list_credentials()[0]["credentials_id"]
+
+    with open(path) as f:
+        intents = [json.loads(line) for line in f if '"intent"' in line]
+    assert {i["key"]: i["data"] for i in intents}["workspaces/ws"]["workspace_name"] == "ws"
+
+
+def test_journaled_updates_and_deletes_are_skipped_once_completed(client, tmp_path):
+    credentials = client.create_credentials("creds", "arn:aws:iam::1:role/r")
+    storage = client.create_storage_configuration("storage", "bucket")
+    client.create_workspace({"workspace_name": "ws", "aws_region": "us-east-1",
+                             "credentials_id": credentials["credentials_id"],
+                             "storage_configuration_id": storage["storage_configuration_id"]})
+    client.create_storage_configuration("unused", "other-bucket")
+    desired = {"storage_configurations": [STORAGE, dict(STORAGE, storage_configuration_name="new")],
+               "workspaces": [{"workspace_name": "ws", "storage_configuration_name": "new"}]}
+    result = plan(desired, LiveState.load(client, metastores=False), prune=True)
+    assert sorted(c.action for c in result.changes) == ["create", "delete", "update"]
+
+    path = str(tmp_path / "journal.jsonl")
+    with Journal(path) as journal:
+        assert [e for _, e in apply(client, result, journal=journal)] == [None, None, None]
+    with Journal(path) as journal:
+        # Replaying the same plan is answered from the journal; the deleted object would otherwise 404.
+        assert [e for _, e in apply(client, result, journal=journal)] == [None, None, None]
+    names = sorted(s["storage_configuration_name"] for s in client.list_storage_configurations())
+    assert names == ["new", "storage"]
+
+
+def desired_workspace(**extra):
+    workspace = {"workspace_name": "ws", "aws_region": "us-east-1", "credentials_name": "creds",
+                 "storage_configuration_name": "storage"}
+    workspace.update(extra)
+    return workspace
+
+
+def actions(result):
+    return [(c.action, c.section, c.name) for c in result.changes]
+
+
+def test_matching_state_needs_no_calls():
+    desired = {"credentials": [CREDENTIALS], "storage_configurations": [dict(STORAGE, extra_field=None)],
+               "workspaces": [desired_workspace()]}
+    result = plan(desired, live_state())
+    assert (result.changes, result.conflicts, result.unchanged) == ([], {}, 3)
+
+
+def test_scalar_lists_compare_regardless_of_order():
+    live = live_state(customer_managed_keys={KEY["aws_key_info"]["key_arn"]: dict(
+        KEY, use_cases=["MANAGED_SERVICES", "STORAGE"], customer_managed_key_id="k-1")})
+    result = plan({"customer_managed_keys": [dict(KEY, use_cases=["STORAGE", "MANAGED_SERVICES"])]}, live)
+    assert result.unchanged == 1 and not result.changes and not result.conflicts
+
+
+def test_new_objects_are_created_in_dependency_order():
+    desired = {"workspaces": [desired_workspace(workspace_name="new", credentials_name="new-creds")],
+               "credentials": [dict(CREDENTIALS, credentials_name="new-creds")]}
+    result = plan(desired, live_state())
+    assert actions(result) == [("create", "credentials", "new-creds"), ("create", "workspaces", "new")]
+    workspace = result.changes[1].payload
+    assert workspace["credentials_id"] == Created("credentials", "new-creds")
+    assert workspace["storage_configuration_id"] == "s-1"
+    assert "credentials_name" not in workspace and "storage_configuration_name" not in workspace
+
+
+def test_changed_configurations_are_conflicts():
+    changed = dict(CREDENTIALS, aws_credentials={"sts_role": {"role_arn": "arn:aws:iam::1:role/other"}})
+    result = plan({"credentials": [changed]}, live_state())
+    assert not result.changes
+    assert list(result.conflicts) == ["credentials creds"]
+
+
+def test_workspace_updates_carry_only_the_changed_fields():
+    live = live_state(networks={"net": {"network_name": "net", "network_id": "n-1"}})
+    result = plan({"workspaces": [desired_workspace(network_name="net", deployment_name=None)]}, live)
+    assert actions(result) == [("update", "workspaces", "ws")]
+    assert result.changes[0].payload == {"network_id": "n-1"}
+    assert result.changes[0].object_id == 1
+    assert result.changes[0].describe() == "PATCH workspaces ws: network_id"
+
+
+@pytest.mark.parametrize("extra, message", [
+    ({"aws_region": "eu-west-1"}, "aws_region cannot be changed"),
+    ({"credentials_name": "missing"}, "credentials_name missing is neither"),
+])
+def test_workspace_conflicts(extra, message):
+    result = plan({"workspaces": [desired_workspace(**extra)]}, live_state())
+    assert not result.changes
+    assert result.conflicts["workspaces ws"].startswith(message)
+
+
+def test_invalid_desired_state():
+    with pytest.raises(ValueError, match="Unknown sections: clusters"):
+        plan({"clusters": []}, live_state())
+    with pytest.raises(ValueError, match="listed twice"):
+        plan({"credentials": [CREDENTIALS, CREDENTIALS]}, live_state())
+
+
+def test_prune_deletes_only_in_listed_sections_workspaces_first():
+    live = live_state(networks={"net": {"network_name": "net", "network_id": "n-1"}})
+    assert plan({"credentials": [CREDENTIALS]}, live, prune=False).changes == []
+
+    result = plan({"credentials": [], "workspaces": []}, live, prune=True)
+    assert sorted(actions(result)) == [("delete", "credentials", "creds"), ("delete", "workspaces", "ws")]
+    assert [c.describe() for c in sorted(result.changes, key=_stage)] == ["DELETE workspaces ws",
+                                                                          "DELETE credentials creds"]
+
+
+def test_metastore_assignment():
+    planner = AssignmentPlanner([{"metastore_id": "m-east", "region": "us-east-1"},
+                                 {"metastore_id": "m-east-2", "region": "us-east-1"},
+                                 {"metastore_id": "m-west", "region": "us-west-2"}],
+                                [live_workspace()], {1: "m-east"})
+    live = live_state()
+    live.planner = planner
+
+    assert plan({"workspaces": [desired_workspace(metastore_id="m-east")]}, live).changes == []
+
+    result = plan({"workspaces": [desired_workspace(metastore_id="m-east-2")]}, live)
+    [change] = result.changes
+    assert (change.action, change.object_id, change.previous) == ("assign", 1, "m-east")
+    assert change.describe() == "assign metastore m-east-2 to workspace ws, detaching m-east"
+
+    new = desired_workspace(workspace_name="new", metastore_id="m-east")
+    result = plan({"workspaces": [new]}, live)
+    assert actions(result) == [("create", "workspaces", "new"), ("assign", "workspaces", "new")]
+    assert result.changes[1].object_id == Created("workspaces", "new") and result.changes[1].previous is None
+    assert "metastore_id" not in result.changes[0].payload
+
+    for metastore_id, message in [("m-west", "Metastore m-west is in us-west-2"),
+                                  ("m-gone", "Metastore m-gone does not exist")]:
+        result = plan({"workspaces": [desired_workspace(metastore_id=metastore_id)]}, live)
+        assert result.conflicts == {"workspaces ws": message} and not result.changes
@@ -0,0 +1,95 @@
+import random
+import socket
+
+import pytest
+
+from dbacademy_admin.client import AccountApiError, AccountClient, parse_retry_after
+from dbacademy_admin.mock_server import MockAccountServer
+from dbacademy_admin.retry import RetryPolicy, TokenBucket, call_with_retry, for_creates, is_retryable
+
+
+def failing(*errors):
+    errors = list(errors)
+    calls = []
+
+    def call():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return "done"
+
+    return call, calls
+
+
+def api_error(status, retry_after=None):
+    return AccountApiError(status, "POST", "/workspaces", b'{"message": "x"}', retry_after)
+
+
+def test_retries_throttled_and_server_errors():
+    call, calls = failing(api_error(429), api_error(503), ConnectionResetError())
+    assert call_with_retry(call, RetryPolicy(base=0), sleep=lambda s: None) == "done"
+    assert len(calls) == 4
+
+
+def test_does_not_retry_client_errors():
+    call, calls = failing(api_error(400))
+    with pytest.raises(AccountApiError):
+        call_with_retry(call, RetryPolicy(base=0), sleep=lambda s: None)
+    assert len(calls) == 1
+
+
+def test_creates_are_not_retried_after_server_errors():
+    policy = for_creates(RetryPolicy(base=0))
+    for error in (api_error(502), api_error(504), ConnectionResetError()):
+        call, calls = failing(error)
+        with pytest.raises(type(error)):
+            call_with_retry(call, policy, sleep=lambda s: None)
+        assert len(calls) == 1
+    call, calls = failing(api_error(429), ConnectionRefusedError(), socket.gaierror())
+    assert call_with_retry(call, policy, sleep=lambda s: None) == "done"
+    assert len(calls) == 4
+
+
+def test_for_creates_keeps_the_narrower_predicate():
+    policy = for_creates(RetryPolicy(retryable=lambda e: False))
+    assert not policy.retryable(api_error(429))
+    assert is_retryable(api_error(500))
+
+
+def test_retry_after_is_honored_when_longer_than_the_backoff():
+    sleeps = []
+    call, _ = failing(api_error(429, retry_after=7.0), api_error(429))
+    call_with_retry(call, RetryPolicy(base=0.5, rng=random.Random(1)), sleep=sleeps.append)
+    assert sleeps[0] == 7.0
+    assert sleeps[1] <= 1.0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480.0) == 10.0
+
+
+def test_mock_server_sends_retry_after():
+    with MockAccountServer(rate_limit=0.001, burst=1, retry_after=2) as server:
+        client = AccountClient(server.url_for("test"), "Basic eDp5")
+        client.list_workspaces()
+        with pytest.raises(AccountApiError) as error:
+            client.list_workspaces()
+    assert error.value.status == 429
+    assert error.value.retry_after == 2.0
+
+
+def test_token_bucket_spaces_calls():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=10, capacity=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(4):
+        bucket.acquire()
+    assert sleeps == pytest.approx([0.1, 0.1])
@@ -0,0 +1,114 @@
+import random
+
+import pytest
+
+from dbacademy_admin.client import AccountApiError
+from dbacademy_admin.retry import RetryPolicy
+from dbacademy_admin.rollout import KEY_FIELDS, KeyRolloutScheduler, TimerWheel
+
+
+class FakeClock:
+    """A clock that only moves when slept on, and fails a test that keeps reading it without progress."""
+
+    def __init__(self, now=1000.0, max_reads=10000):
+        self.now = now
+        self.reads = 0
+        self.max_reads = max_reads
+
+    def __call__(self):
+        self.reads += 1
+        if self.reads > self.max_reads:
+            raise AssertionError("the rollout did not finish")
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_items_expire_at_their_deadline_not_before():
+    wheel = TimerWheel(tick=0.1, slots=16)
+    wheel.schedule(0.3, "a")
+    wheel.schedule(0.25, "b")
+    assert len(wheel) == 2 and wheel.next_deadline() == pytest.approx(0.3)
+    assert wheel.advance(0.29) == []
+    assert sorted(wheel.advance(wheel.next_deadline())) == ["a", "b"]
+    assert len(wheel) == 0 and wheel.next_deadline() is None
+
+
+@pytest.mark.parametrize("tick", [0.1, 0.7 / 1200, 1.0 / 3])
+def test_the_next_deadline_always_releases_an_item(tick):
+    rng = random.Random(7)
+    wheel = TimerWheel(tick=tick, slots=64, start=rng.uniform(0, 1e6))
+    deadlines = {i: wheel._origin + rng.uniform(0, 200 * tick) for i in range(200)}
+    for item, deadline in deadlines.items():
+        wheel.schedule(deadline, item)
+    released = []
+    for _ in range(len(deadlines)):
+        if not len(wheel):
+            break
+        now = wheel.next_deadline()
+        expired = wheel.advance(now)
+        assert expired, f"nothing expired at {now}"
+        assert all(deadlines[item] <= now for item in expired)
+        released.extend(expired)
+    assert sorted(released) == sorted(deadlines)
+
+
+def test_deadlines_beyond_one_turn_and_in_the_past():
+    wheel = TimerWheel(tick=1.0, slots=8)
+    wheel.schedule(3, "soon")
+    wheel.schedule(3 + 8 * 2, "two turns later")
+    assert wheel.advance(10) == ["soon"]
+    wheel.schedule(5, "late")
+    # A deadline that has already passed expires on the next tick.
+    assert wheel.next_deadline() == 11
+    assert wheel.advance(11) == ["late"]
+    assert wheel.advance(18) == []
+    assert wheel.advance(19) == ["two turns later"]
+
+
+def workspaces(client, count):
+    return [client.create_workspace({"workspace_name": f"w{i}", "aws_region": "us-east-1"})["workspace_id"]
+            for i in range(count)]
+
+
+@pytest.mark.parametrize("quiet_period", [10.0, 0.7])
+def test_waves_are_paced_by_quiet_windows(client, quiet_period):
+    ids = workspaces(client, 5)
+    clock = FakeClock()
+    started = clock.now
+    scheduler = KeyRolloutScheduler(client, "k-1", ids, wave_size=2, quiet_period=quiet_period,
+                                    clock=clock, sleep=clock.sleep)
+    events = list(scheduler.run())
+
+    patched = [(e.workspace_id, e.at - started) for e in events if e.kind == "patched"]
+    ready = [(e.workspace_id, e.at - started) for e in events if e.kind == "ready"]
+    assert [w for w, _ in patched] == ids and sorted(w for w, _ in ready) == sorted(ids)
+    # At most two workspaces are in their quiet window at a time; a new one starts when a window ends.
+    waves = [0, 0, 1, 1, 2]
+    assert [at for _, at in patched] == pytest.approx([wave * quiet_period for wave in waves], abs=0.01)
+    ready_at = dict(ready)
+    for (workspace_id, at), wave in zip(patched, waves):
+        assert ready_at[workspace_id] >= at + quiet_period
+        assert ready_at[workspace_id] == pytest.approx((wave + 1) * quiet_period, abs=0.01)
+    assert clock.now - started == pytest.approx(3 * quiet_period, abs=0.01)
+    for workspace_id in ids:
+        workspace = client.get_workspace(workspace_id)
+        assert all(workspace[field] == "k-1" for field in KEY_FIELDS)
+
+
+def test_failed_patches_do_not_take_a_slot(server, client):
+    ids = workspaces(client, 3)
+    clock = FakeClock()
+    stopped = []
+    server.fail_next(400, method="PATCH")
+    scheduler = KeyRolloutScheduler(client, "k-1", ids, wave_size=1, quiet_period=5.0,
+                                    stop_clusters=stopped.append, retry=RetryPolicy(max_attempts=1),
+                                    clock=clock, sleep=clock.sleep)
+    events = list(scheduler.run())
+    assert [(e.workspace_id, e.kind) for e in events] == [
+        (ids[0], "failed"), (ids[1], "patched"), (ids[1], "ready"), (ids[2], "patched"), (ids[2], "ready"),
+    ]
+    assert isinstance(events[0].error, AccountApiError) and events[0].at == 1000.0
+    assert stopped == ids
+    assert clock.now == pytest.approx(1010.0)
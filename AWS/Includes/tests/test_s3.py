@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from dbacademy_admin.policies import canonical
+from dbacademy_admin.s3 import BucketSpec, S3Clients, bucket_handlers, current_policy, lab_buckets, provision_buckets
+
+DATABRICKS_ACCOUNT_ID = "414351767826"
+
+
+@pytest.fixture
+def clients(aws):
+    return S3Clients(session=aws)
+
+
+def test_bucket_names():
+    assert BucketSpec("dbacademy--test-bucket").bucket_name == "dbacademy--test-bucket"
+    for name in ("Upper", "with.dot", "ab", "xn--punycode", "sthree-bucket", "name--ol-s3", "name-s3alias", "-edge"):
+        with pytest.raises(ValueError):
+            BucketSpec(name)
+    with pytest.raises(ValueError, match="purpose"):
+        BucketSpec("bucket-name", purpose="logs")
+
+
+def test_root_bucket_policy_text():
+    policy = json.loads(BucketSpec("dbacademy-bucket").policy(DATABRICKS_ACCOUNT_ID))
+    statement = policy["Statement"][0]
+    assert statement["Principal"] == {"AWS": f"arn:aws:iam::{DATABRICKS_ACCOUNT_ID}:root"}
+    assert set(statement["Resource"]) == {"arn:aws:s3:::dbacademy-bucket", "arn:aws:s3:::dbacademy-bucket/*"}
+    assert "s3:PutObject" in statement["Action"]
+    assert BucketSpec("dbacademy-metastore-bucket", purpose="metastore").policy(DATABRICKS_ACCOUNT_ID) is None
+
+
+def test_buckets_and_policies_are_created_in_their_regions(clients):
+    specs = lab_buckets("dbacademy-a") + lab_buckets("dbacademy-b", "eu-west-1")
+    batch = provision_buckets(specs, DATABRICKS_ACCOUNT_ID, clients, max_workers=4, waiter_delay=0.1)
+    assert not batch.failed
+    assert len(batch.created) == 4
+
+    for spec in specs:
+        s3 = clients.client(spec.region)
+        location = s3.get_bucket_location(Bucket=spec.bucket_name)["LocationConstraint"]
+        assert (location or "us-east-1") == spec.region
+        expected = spec.policy(DATABRICKS_ACCOUNT_ID)
+        assert current_policy(s3, spec.bucket_name) == (None if expected is None else canonical(json.loads(expected)))
+    assert [r.policy_applied for r in batch.results] == [True, False, True, False]
+
+
+def test_rerun_keeps_buckets_and_fixes_only_drifted_policies(clients):
+    specs = lab_buckets("dbacademy-c", "eu-west-1")
+    provision_buckets(specs, DATABRICKS_ACCOUNT_ID, clients, waiter_delay=0.1)
+
+    again = provision_buckets(specs, DATABRICKS_ACCOUNT_ID, clients, waiter_delay=0.1)
+    assert not again.failed
+    assert [(r.created, r.policy_applied) for r in again.results] == [(False, False), (False, False)]
+
+    s3 = clients.client("eu-west-1")
+    s3.delete_bucket_policy(Bucket="dbacademy-c-bucket")
+    fixed = provision_buckets(specs, DATABRICKS_ACCOUNT_ID, clients, waiter_delay=0.1)
+    assert [r.policy_applied for r in fixed.results] == [True, False]
+    assert current_policy(s3, "dbacademy-c-bucket") is not None
+
+
+def test_failures_do_not_stop_other_buckets(clients):
+    from botocore.exceptions import ClientError
+
+    def deny(params, **kwargs):
+        if params["Bucket"] == "denied-bucket":
+            raise ClientError({"Error": {"Code": "AccessDenied", "Message": "Access Denied"}}, "CreateBucket")
+
+    clients.client("us-west-2").meta.events.register("provide-client-params.s3.CreateBucket", deny)
+    batch = provision_buckets([BucketSpec("denied-bucket", "us-west-2"), BucketSpec("free-bucket", "us-west-2")],
+                              DATABRICKS_ACCOUNT_ID, clients, waiter_delay=0.1)
+    assert [r.spec.bucket_name for r in batch.failed] == ["denied-bucket"]
+    assert [r.spec.bucket_name for r in batch.created] == ["free-bucket"]
+
+
+def test_bucket_handlers_find_the_region_of_buckets(clients, aws):
+    handlers = bucket_handlers(clients, DATABRICKS_ACCOUNT_ID, waiter_delay=0.1)
+    assert handlers["s3_bucket"]({"bucket_name": "handled-bucket", "region": "eu-west-1"}) == \
+        {"bucket_name": "handled-bucket", "region": "eu-west-1"}
+    # A fresh S3Clients has to ask S3 where the bucket is.
+    fresh = bucket_handlers(S3Clients(session=aws), DATABRICKS_ACCOUNT_ID)
+    assert fresh["s3_bucket_policy"]({"bucket_name": "handled-bucket"}) == {"bucket_name": "handled-bucket"}
+    assert current_policy(clients.client("eu-west-1"), "handled-bucket") == canonical(
+        json.loads(BucketSpec("handled-bucket").policy(DATABRICKS_ACCOUNT_ID)))
@@ -0,0 +1,89 @@
+import io
+import json
+import sys
+
+import pytest
+
+from dbacademy_admin.streaming import iter_json_array, main, project
+
+DOCUMENT = [
+    {"workspace_id": 1234567890123456, "workspace_name": "dbacademy-ü", "workspace_status": "RUNNING",
+     "nested": {"list": [1, 2, {"deep": "]},["}], "escaped": "quote \" and \\u00e9 é"}},
+    12.5, -3, 1e-7, True, False, None, "a string with ] and , inside", [], {}, [[1], [2, [3]]],
+    "日本語の名前",
+]
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100000])
+def test_chunk_boundaries_anywhere(size):
+    data = json.dumps(DOCUMENT, ensure_ascii=False).encode("utf-8")
+    assert list(iter_json_array(split(data, size))) == DOCUMENT
+
+
+def test_pretty_printed_input_and_empty_chunks():
+    data = json.dumps(DOCUMENT, indent=4).encode("utf-8")
+    chunks = [b""] + [c for piece in split(data, 5) for c in (piece, b"")]
+    assert list(iter_json_array(chunks)) == DOCUMENT
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("[]", []),
+    (" \n [ ] \n", []),
+    ("[12", None),
+    ("[12,", None),
+    ('[{"a": 1}', None),
+    ('[{"a": ', None),
+])
+def test_empty_and_truncated(text, expected):
+    chunks = split(text.encode(), 1)
+    if expected is None:
+        with pytest.raises(ValueError):
+            list(iter_json_array(chunks))
+    else:
+        assert list(iter_json_array(chunks)) == expected
+
+
+def test_scalar_split_mid_number_is_not_yielded_early():
+    assert list(iter_json_array([b"[12", b".5, 1", b"e3, tr", b"ue, -", b"0]"])) == [12.5, 1000.0, True, -0]
+
+
+def test_not_an_array():
+    with pytest.raises(ValueError, match="Expected a JSON array"):
+        list(iter_json_array([b'{"error_code": "UNAUTHENTICATED"}']))
+
+
+def test_elements_are_yielded_before_the_stream_ends():
+    def chunks():
+        yield b'[{"workspace_id": 1}, '
+        raise AssertionError("read past the first element")
+
+    assert next(iter_json_array(chunks())) == {"workspace_id": 1}
+
+
+def test_projection():
+    assert project({"a": 1, "b": 2}, ["b", "missing"]) == {"b": 2}
+    assert project([1, 2], ["a"]) == [1, 2]
+    assert project({"a": 1}, None) == {"a": 1}
+    data = b'[{"workspace_id": 1, "workspace_name": "x", "big": [1, 2, 3]}, 7]'
+    assert list(iter_json_array(split(data, 4), ["workspace_id", "workspace_name"])) == \
+        [{"workspace_id": 1, "workspace_name": "x"}, 7]
+
+
+def test_stream_list_matches_request(client):
+    for i in range(25):
+        client.create_credentials(f"dbacademy-credentials-{i}", f"arn:aws:iam::123456789012:role/r{i}")
+    listed = client.request("GET", "/credentials")
+    assert list(client.stream_list("/credentials", chunk_size=16)) == listed
+    assert list(client.stream_list("/credentials", ["credentials_name"])) == \
+        [{"credentials_name": c["credentials_name"]} for c in listed]
+
+
+def test_command_line(monkeypatch, capsys):
+    stdin = io.TextIOWrapper(io.BytesIO(json.dumps([{"a": 1, "b": 2}, {"a": 3}]).encode()))
+    monkeypatch.setattr(sys, "stdin", stdin)
+    main(["--fields", "a"])
+    assert capsys.readouterr().out.splitlines() == ['{"a": 1}', '{"a": 3}']
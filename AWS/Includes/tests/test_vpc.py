@@ -0,0 +1,116 @@
+import ipaddress
+
+import pytest
+
+from dbacademy_admin.netgen import QUAD_ZERO, describe_vpc
+from dbacademy_admin.vpc import ZONES, EC2Clients, provision_vpcs
+
+REGIONS = ["us-east-1", "eu-west-1"]
+
+
+@pytest.fixture
+def clients(aws):
+    return EC2Clients(session=aws, max_pool_connections=8)
+
+
+def provision(clients, regions=REGIONS):
+    return provision_vpcs(regions, "dbacademy-test", clients, max_workers=8, waiter_delay=0.01)
+
+
+def tagged(ec2, method, key, prefix):
+    """The resources whose Name tag starts with ``prefix``."""
+    param = "Filter" if method == "describe_nat_gateways" else "Filters"
+    return getattr(ec2, method)(**{param: [{"Name": "tag:Name", "Values": [prefix + "*"]}]})[key]
+
+
+def test_topology_in_every_region(clients):
+    networks = provision(clients)
+    assert sorted(networks) == sorted(REGIONS)
+
+    for region, network in networks.items():
+        assert network.ok, network.errors
+        ec2 = clients.client(region)
+        vpc = ec2.describe_vpcs(VpcIds=[network.vpc_id])["Vpcs"][0]
+        assert vpc["CidrBlock"] == "10.0.0.0/16"
+        for attribute, key in [("enableDnsSupport", "EnableDnsSupport"), ("enableDnsHostnames", "EnableDnsHostnames")]:
+            assert ec2.describe_vpc_attribute(VpcId=network.vpc_id, Attribute=attribute)[key]["Value"]
+
+        subnets = network.subnets["public"] + network.subnets["private"]
+        assert len(subnets) == 2 * ZONES
+        cidrs = [ipaddress.ip_network(s["cidr_block"]) for s in subnets]
+        assert all(c.prefixlen == 20 and c.subnet_of(ipaddress.ip_network("10.0.0.0/16")) for c in cidrs)
+        assert not any(a.overlaps(b) for i, a in enumerate(cidrs) for b in cidrs[i + 1:])
+        for side in ("public", "private"):
+            assert len({s["availability_zone"] for s in network.subnets[side]}) == ZONES
+            assert all(s["availability_zone"].startswith(region) for s in network.subnets[side])
+
+        # The public side routes through the internet gateway, the private side through the NAT gateway.
+        tables = {t["RouteTableId"]: t for t in ec2.describe_route_tables(RouteTableIds=list(
+            network.route_table_ids.values()))["RouteTables"]}
+        for side, target in [("public", "GatewayId"), ("private", "NatGatewayId")]:
+            table = tables[network.route_table_ids[side]]
+            routes = [r for r in table["Routes"] if r.get("DestinationCidrBlock") == QUAD_ZERO]
+            assert len(routes) == 1 and routes[0][target].startswith("igw-" if side == "public" else "nat-")
+            assert {a["SubnetId"] for a in table["Associations"] if a.get("SubnetId")} == \
+                {s["subnet_id"] for s in network.subnets[side]}
+        nat = ec2.describe_nat_gateways(NatGatewayIds=[network.nat_gateway_id])["NatGateways"][0]
+        assert nat["SubnetId"] == network.subnets["public"][0]["subnet_id"]
+
+        payload = network.network_payload("dbacademy-network")
+        assert payload["vpc_id"] == network.vpc_id
+        assert payload["subnet_ids"] == [s["subnet_id"] for s in network.subnets["private"]]
+        assert payload["security_group_ids"] == network.security_group_ids and network.security_group_ids
+
+
+def test_description_matches_describe_vpc(clients):
+    network = provision(clients, ["us-east-1"])["us-east-1"]
+    described = describe_vpc(clients.client("us-east-1"), network.vpc_id)
+    ours = network.description()
+
+    assert described["vpc_id"] == ours["vpc_id"] and described["cidr_block"] == ours["cidr_block"]
+    assert described["security_group_ids"] == ours["security_group_ids"]
+    key = lambda s: s["subnet_id"]  # noqa: E731
+    assert sorted(described["subnets"], key=key) == sorted(ours["subnets"], key=key)
+    assert described["nat_gateways"] == ours["nat_gateways"]
+    assert described["route_tables"] == ours["route_tables"]
+
+
+def test_rerun_adopts_existing_resources(clients):
+    first = provision(clients)
+    second = provision(clients)
+
+    for region in REGIONS:
+        assert second[region].ok, second[region].errors
+        assert second[region].description() == first[region].description()
+        assert second[region].route_table_ids == first[region].route_table_ids
+
+        ec2 = clients.client(region)
+        prefix = f"dbacademy-test-{region}-"
+        assert len(tagged(ec2, "describe_vpcs", "Vpcs", prefix)) == 1
+        assert len(tagged(ec2, "describe_subnets", "Subnets", prefix)) == 2 * ZONES
+        assert len(tagged(ec2, "describe_internet_gateways", "InternetGateways", prefix)) == 1
+        assert len(tagged(ec2, "describe_addresses", "Addresses", prefix)) == 1
+        assert len(tagged(ec2, "describe_nat_gateways", "NatGateways", prefix)) == 1
+        assert len(tagged(ec2, "describe_route_tables", "RouteTables", prefix)) == 2
+
+
+def test_rerun_completes_a_partial_build(clients):
+    ec2 = clients.client("us-east-1")
+    failures = {"left": 1}
+
+    def refuse_private_routes(params, **kwargs):
+        if params.get("NatGatewayId") and failures["left"]:
+            failures["left"] -= 1
+            raise RuntimeError("simulated outage")
+
+    ec2.meta.events.register("provide-client-params.ec2.CreateRoute", refuse_private_routes)
+    partial = provision(clients, ["us-east-1"])["us-east-1"]
+    assert not partial.ok and set(partial.errors) == {"rtb-private"}
+
+    network = provision(clients, ["us-east-1"])["us-east-1"]
+    assert network.ok, network.errors
+    assert network.vpc_id == partial.vpc_id and network.subnets == partial.subnets
+    table = ec2.describe_route_tables(RouteTableIds=[network.route_table_ids["private"]])["RouteTables"][0]
+    assert [r["NatGatewayId"] for r in table["Routes"] if r.get("DestinationCidrBlock") == QUAD_ZERO] == \
+        [network.nat_gateway_id]
+    assert len(tagged(ec2, "describe_route_tables", "RouteTables", "dbacademy-test-us-east-1-rtb-private")) == 1
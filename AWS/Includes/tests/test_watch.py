@@ -0,0 +1,64 @@
+import pytest
+
+from dbacademy_admin.cache import InventoryCache
+from dbacademy_admin.provisioner import account_handlers
+from dbacademy_admin.watch import AdaptiveSchedule, WorkspaceWatcher
+
+FAST = AdaptiveSchedule(expected=0.0, min_interval=0.02, max_interval=0.05, slope=0.0)
+
+
+@pytest.fixture
+def cached(make_client):
+    cache = InventoryCache(":memory:")
+    yield make_client(cache=cache)
+    cache.close()
+
+
+def create(client, name):
+    return client.create_workspace({"workspace_name": name, "deployment_name": name, "aws_region": "us-east-1"})
+
+
+def test_schedule_is_shortest_around_the_expected_time():
+    schedule = AdaptiveSchedule(expected=300.0, min_interval=5.0, max_interval=60.0, slope=0.25)
+    assert schedule.interval(300.0) == 5.0
+    assert schedule.interval(280.0) == schedule.interval(320.0) == 10.0
+    assert schedule.interval(0.0) == schedule.interval(3600.0) == 60.0
+
+
+def test_polls_bypass_the_cache(server, cached):
+    server.provisioning_delay = 0.3
+    workspace_id = create(cached, "dbacademy-watched")["workspace_id"]
+    # Leave a PROVISIONING listing in the cache, fresh for the whole test.
+    assert cached.list_workspaces()[0]["workspace_status"] == "PROVISIONING"
+
+    watcher = WorkspaceWatcher(cached, FAST)
+    watcher.add(workspace_id)
+    events = list(watcher.watch(timeout=10))
+    assert [(e.previous_status, e.status) for e in events] == [(None, "PROVISIONING"), ("PROVISIONING", "RUNNING")]
+    assert events[-1].done and not watcher.pending and watcher.calls >= 2
+
+
+def test_deleted_workspace_is_not_found(server, client):
+    server.provisioning_delay = 60.0
+    kept, deleted = (create(client, name)["workspace_id"] for name in ("dbacademy-kept", "dbacademy-deleted"))
+    watcher = WorkspaceWatcher(client, FAST, clock=lambda: 100.0)
+    watcher.add(kept, started_at=40.0)
+    watcher.add(deleted, started_at=40.0)
+    assert {e.status for e in watcher.poll()} == {"PROVISIONING"}
+
+    client.delete_workspace(deleted)
+    [event] = watcher.poll()
+    assert (event.workspace_id, event.status, event.elapsed) == (deleted, "NOT_FOUND", 60.0)
+    assert watcher.pending == [kept]
+    assert watcher.poll() == []
+
+
+def test_workspace_handler_waits_for_running_through_a_cache(server, cached):
+    server.provisioning_delay = 0.3
+    create(cached, "dbacademy-other")
+    cached.list_workspaces()
+
+    workspace = account_handlers(cached, schedule=FAST)["workspace"](
+        {"workspace_name": "dbacademy-handled", "deployment_name": "dbacademy-handled", "aws_region": "us-east-1"})
+    listed = {w["workspace_id"]: w for w in cached.iter_workspaces()}
+    assert listed[workspace["workspace_id"]]["workspace_status"] == "RUNNING"